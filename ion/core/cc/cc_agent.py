@@ -21,6 +21,7 @@ from ion.core.messaging.receiver import Receiver, FanoutReceiver
 from ion.core.pack import app_supervisor
 from ion.core.process.process import Process, ProcessFactory, ProcessDesc
 import ion.util.procutils as pu
+from ion.util import metrics
 from ion.services.coi.exchange.agent_client import ExchangeManagementClient
 
 CONF = ioninit.config(__name__)
@@ -44,6 +45,9 @@ class CCAgent(Process):
         self.last_identify = 0
         self.exchange_management_client = None
 
+        metrics.registry.gauge('container.processes',
+                               lambda: len(ioninit.container_instance.proc_manager.process_registry.kvs))
+
     @defer.inlineCallbacks
     def plc_activate(self):
         # Declare CC announcement name
@@ -175,6 +179,28 @@ class CCAgent(Process):
         res = {}
         yield self.reply_ok(msg, res)
 
+    @defer.inlineCallbacks
+    def op_get_metrics(self, content, headers, msg):
+        """
+        Service operation: replies with a snapshot of the container metrics
+        registry. Content may contain 'enable' (True/False) to switch metrics
+        on or off and 'clear' to reset counters and histograms, both applied
+        after the snapshot is taken.
+        """
+        res = metrics.registry.snapshot()
+
+        if type(content) is dict:
+            enable = content.get('enable', None)
+            if enable is not None:
+                if enable:
+                    metrics.registry.enable()
+                else:
+                    metrics.registry.disable()
+            if content.get('clear', False):
+                metrics.registry.clear()
+
+        yield self.reply_ok(msg, res)
+
 # Spawn of the process using the module name
 factory = ProcessFactory(CCAgent)
 
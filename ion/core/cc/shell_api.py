@@ -14,6 +14,7 @@ from ion.core import ioninit
 from ion.core.id import Id
 import ion.util.procutils as pu
 from ion.core.process.process import ProcessDesc, Process
+from ion.util.metrics import registry as metrics_registry, format_snapshot
 
 # The shell namespace
 namespace = None
@@ -31,6 +32,7 @@ def info():
     print "  spawn(module): Spawn a process from a module"
     print "  makeprocess(): Returns a new Process object (spawn is called but may not be done yet)"
     print "  ping(servicename): Pings a named service in this container's sysname. Returns a deferred."
+    print "  metrics(node=None, enable=None, clear=False): Print the metrics of this or another container"
     print "Variables:"
     print "  control: shell control"
     print "  procs: dict of local process names -> pid"
@@ -232,6 +234,29 @@ def _update():
     except Exception:
         log.exception("Error updating CC shell namespace")
 
+@defer.inlineCallbacks
+def metrics(node=None, enable=None, clear=False):
+    """
+    Prints the metrics of this container, or of the container of the given
+    node through its cc agent. enable switches metrics on or off and clear
+    resets them, after the metrics are printed.
+    """
+    if node is None:
+        snapshot = metrics_registry.snapshot()
+        if enable is not None:
+            if enable:
+                metrics_registry.enable()
+            else:
+                metrics_registry.disable()
+        if clear:
+            metrics_registry.clear()
+    else:
+        node = _get_node(node)
+        sup = yield ioninit.container_instance.proc_manager.create_supervisor()
+        (snapshot, headers, msg) = yield sup.rpc_send(node, 'get_metrics', {'enable':enable, 'clear':clear})
+
+    print format_snapshot(snapshot)
+
 def makeprocess():
     p = Process()
     p.spawn()
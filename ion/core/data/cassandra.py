@@ -12,26 +12,53 @@
 @note Test cases for the cassandra backend are now in ion.data.test.test_store
 """
 import os
+import weakref
+import itertools
 
 from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.python import failure
 
 from zope.interface import implements
 
 from telephus.client import CassandraClient
-from telephus.protocol import ManagedCassandraClientFactory
+from telephus.protocol import ManagedCassandraClientFactory, ManagedThriftRequest
 from telephus.cassandra.ttypes import NotFoundException, KsDef, CfDef
 from telephus.cassandra.ttypes import ColumnDef, IndexExpression, IndexOperator, InvalidRequestException
+from telephus.cassandra.ttypes import UnavailableException, TimedOutException
+from telephus.cassandra.ttypes import AuthenticationException, AuthorizationException
 
+from ion.core import ioninit
 from ion.core.data import store
 from ion.core.data.store import Query
 
 from ion.core.data.store import IndexStoreError
 
-from ion.util.tcp_connections import TCPConnection
+from ion.util.state_object import BasicLifecycleObject
+from ion.util import metrics
 
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
 
+CONF = ioninit.config(__name__)
+CF_connections_per_host = CONF.getValue('connections_per_host', 1)
+CF_health_check_interval = CONF.getValue('health_check_interval', 5.0)
+CF_request_timeout = CONF.getValue('request_timeout', 30.0)
+CF_max_attempts = CONF.getValue('max_attempts', 3)
+CF_schema_refresh_interval = CONF.getValue('schema_refresh_interval', 60.0)
+CF_multiget_keys = CONF.getValue('multiget_keys', 500)
+
+INDEX_OPERATORS = {Query.EQ:IndexOperator.EQ,
+                   Query.GT:IndexOperator.GT,
+                   Query.GTE:IndexOperator.GTE,
+                   Query.LT:IndexOperator.LT,
+                   Query.LTE:IndexOperator.LTE}
+
+# Errors which are answers from a healthy server - passed to the caller as they are
+APPLICATION_ERRORS = (NotFoundException, InvalidRequestException, AuthenticationException, AuthorizationException)
+# Errors which mean the cluster could not serve the request right now - retried on another member
+OVERLOAD_ERRORS = (UnavailableException, TimedOutException)
 
 
 class CassandraError(Exception):
@@ -39,8 +66,336 @@ class CassandraError(Exception):
     An exception class for ION Cassandra Client errors
     """
 
+class CassandraPoolError(CassandraError):
+    """
+    Raised when no member of a connection pool can serve a request
+    """
+
+
+class _PoolClientFactory(ManagedCassandraClientFactory):
+    """
+    Client factory of one pool member: reports connection state changes to
+    the pool. Reconnecting after a lost connection is left to the factory.
+    """
+
+    def __init__(self, member, **kwargs):
+        ManagedCassandraClientFactory.__init__(self, **kwargs)
+        self.member = member
+
+    def buildProtocol(self, addr):
+        proto = ManagedCassandraClientFactory.buildProtocol(self, addr)
+        self.member.pool._member_connected(self.member)
+        return proto
+
+    def clientConnectionLost(self, connector, reason):
+        ManagedCassandraClientFactory.clientConnectionLost(self, connector, reason)
+        self.member.pool._member_lost(self.member, reason)
+
+    def clientConnectionFailed(self, connector, reason):
+        ManagedCassandraClientFactory.clientConnectionFailed(self, connector, reason)
+        self.member.pool._member_lost(self.member, reason)
+
+
+class CassandraPoolMember(object):
+    """
+    One connection of a pool to one host
+    """
+
+    def __init__(self, pool, host, port, factory_kwargs):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.factory = _PoolClientFactory(self, **factory_kwargs)
+        self.connector = None
 
-class CassandraStore(TCPConnection):
+        # Set once a health check passed on the current connection
+        self.up = False
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+    def __str__(self):
+        return '%s:%s' % (self.host, self.port)
+
+
+class CassandraConnectionPool(object):
+    """
+    Stands in for the ManagedCassandraClientFactory given to a CassandraClient.
+    Holds connections_per_host connections to each host of the cluster and
+    routes each request to the available connection with the fewest
+    outstanding requests.
+
+    A connection is available once a health check (describe_version) passed
+    on it. A connection is taken out of rotation when it is lost, when a
+    request on it fails with anything but an application error or when a
+    request or health check takes longer than request_timeout; its factory
+    then reconnects and it rejoins the rotation after the next passed health
+    check. Failed requests are retried on other connections, preferring ones
+    that have not failed the request yet, up to max_attempts times. Requests
+    made while no connection is available wait up to request_timeout.
+
+    Cassandra writes are idempotent, so a request abandoned after a timeout
+    and retried elsewhere may still be applied by the first host.
+    """
+
+    def __init__(self, hosts, connections_per_host=None, health_check_interval=None,
+                 request_timeout=None, max_attempts=None, connect_timeout=30, **factory_kwargs):
+        """
+        @param hosts list of (host, port) tuples
+        @param factory_kwargs passed to each ManagedCassandraClientFactory, e.g. keyspace, credentials
+        """
+        if not hosts:
+            raise CassandraPoolError('A connection pool needs at least one host')
+
+        self.connections_per_host = int(connections_per_host or CF_connections_per_host)
+        self.health_check_interval = health_check_interval or CF_health_check_interval
+        self.request_timeout = request_timeout or CF_request_timeout
+        self.max_attempts = int(max_attempts or CF_max_attempts)
+        self.connect_timeout = connect_timeout
+
+        self.members = []
+        for host, port in hosts:
+            for i in range(self.connections_per_host):
+                self.members.append(CassandraPoolMember(self, host, int(port), factory_kwargs))
+
+        self._next = 0
+        self._waiting = []
+        self._health_check = None
+        self._running = False
+
+    def connect(self):
+        """
+        Connect all members and start health checking
+        """
+        self._running = True
+        for member in self.members:
+            member.factory.continueTrying = True
+            member.connector = reactor.connectTCP(member.host, member.port, member.factory, self.connect_timeout)
+        self._health_check = LoopingCall(self.check_health)
+        self._health_check.start(self.health_check_interval, now=False)
+        log.info('Connecting pool of %d connections to %s', len(self.members),
+                 ', '.join(sorted(set(str(m) for m in self.members))))
+
+    def shutdown(self):
+        """
+        Close all connections and fail the requests still waiting for one
+        """
+        self._running = False
+        if self._health_check is not None and self._health_check.running:
+            self._health_check.stop()
+        self._health_check = None
+
+        for member in self.members:
+            member.up = False
+            member.factory.shutdown()
+            if member.connector is not None:
+                member.connector.disconnect()
+                member.connector = None
+
+        waiting, self._waiting = self._waiting, []
+        for request, d, attempts, attempt, failed, timer in waiting:
+            if timer.active():
+                timer.cancel()
+            d.errback(CassandraPoolError('Connection pool shut down'))
+
+    def available(self):
+        """
+        @retval list of members currently in rotation
+        """
+        return [member for member in self.members if member.up]
+
+    def stats(self):
+        """
+        @retval list of dicts with the state of each member
+        """
+        return [{'host':str(m), 'up':m.up, 'outstanding':m.outstanding, 'requests':m.requests,
+                 'failures':m.failures} for m in self.members]
+
+    def pushRequest(self, request, retries=None):
+        """
+        Same contract as ManagedCassandraClientFactory.pushRequest
+        @param retries overrides max_attempts - 1 for this request
+        """
+        attempts = self.max_attempts if retries is None else retries + 1
+        d = defer.Deferred()
+        self._submit(request, d, attempts, 0, set())
+        return d
+
+    def set_keyspace(self, keyspace):
+        """
+        Switch all connections to another keyspace
+        """
+        return defer.gatherResults([m.factory.set_keyspace(keyspace) for m in self.members])
+
+    def login(self, credentials):
+        return defer.gatherResults([m.factory.login(credentials) for m in self.members])
+
+    def _select(self, failed):
+        """
+        @retval the available member with the fewest outstanding requests,
+            preferring members not in failed. Ties go round robin.
+        """
+        best = None
+        best_key = None
+        count = len(self.members)
+        for i in xrange(count):
+            member = self.members[(self._next + i) % count]
+            if not member.up:
+                continue
+            key = (member in failed, member.outstanding)
+            if best is None or key < best_key:
+                best = member
+                best_key = key
+        self._next = (self._next + 1) % count
+        return best
+
+    def _submit(self, request, d, attempts, attempt, failed):
+        member = self._select(failed)
+        if member is None:
+            if not self._running:
+                d.errback(CassandraPoolError('Connection pool is not connected'))
+                return
+            timer = reactor.callLater(self.request_timeout, self._waiting_timed_out, d)
+            self._waiting.append((request, d, attempts, attempt, failed, timer))
+            return
+
+        member.outstanding += 1
+        member.requests += 1
+        md = member.factory.pushRequest(request)
+        timer = reactor.callLater(self.request_timeout, md.cancel)
+        md.addBoth(self._complete, member, timer, request, d, attempts, attempt, failed)
+
+    def _complete(self, result, member, timer, request, d, attempts, attempt, failed):
+        member.outstanding -= 1
+        if timer.active():
+            timer.cancel()
+
+        if not isinstance(result, failure.Failure):
+            member.failures = 0
+            d.callback(result)
+            return
+        if result.check(*APPLICATION_ERRORS):
+            d.errback(result)
+            return
+        if result.check(defer.CancelledError):
+            result = failure.Failure(CassandraPoolError('Request %s to %s timed out after %s seconds' %
+                                                        (request.method, member, self.request_timeout)))
+
+        if result.check(*OVERLOAD_ERRORS):
+            log.info('Request %s not served by %s: %s', request.method, member, result.value)
+        else:
+            self._member_failed(member, result)
+
+        attempt += 1
+        if attempt >= attempts:
+            d.errback(result)
+            return
+        metrics.registry.inc('cassandra.pool.retries')
+        failed.add(member)
+        self._submit(request, d, attempts, attempt, failed)
+
+    def _waiting_timed_out(self, d):
+        for entry in self._waiting:
+            if entry[1] is d:
+                self._waiting.remove(entry)
+                d.errback(CassandraPoolError('No connection available within %s seconds' % self.request_timeout))
+                return
+
+    def _drain_waiting(self):
+        waiting, self._waiting = self._waiting, []
+        for request, d, attempts, attempt, failed, timer in waiting:
+            if timer.active():
+                timer.cancel()
+            self._submit(request, d, attempts, attempt, failed)
+
+    def _member_failed(self, member, reason):
+        """
+        Take a member out of rotation and drop its connection. The factory reconnects.
+        """
+        member.failures += 1
+        if member.up:
+            log.warn('Taking %s out of the connection pool: %s', member, reason.getErrorMessage())
+            metrics.registry.inc('cassandra.pool.failovers')
+            member.up = False
+        if self._running and member.connector is not None:
+            member.connector.disconnect()
+
+    def _member_connected(self, member):
+        # The protocol is being built - check it once it is set up
+        if self._running:
+            reactor.callLater(0, self._probe, member)
+
+    def _member_lost(self, member, reason):
+        if member.up:
+            log.warn('Lost connection %s: %s', member, reason.getErrorMessage())
+            member.up = False
+
+    def check_health(self):
+        """
+        Probe all members in rotation. Members out of rotation are probed when they reconnect.
+        """
+        return defer.DeferredList([self._probe(member) for member in self.available()])
+
+    def _probe(self, member):
+        md = member.factory.pushRequest(ManagedThriftRequest('describe_version'))
+        timer = reactor.callLater(self.request_timeout, md.cancel)
+
+        def passed(version):
+            if timer.active():
+                timer.cancel()
+            if not member.up and self._running:
+                log.info('Adding %s to the connection pool', member)
+                member.up = True
+                self._drain_waiting()
+
+        def failed(reason):
+            if timer.active():
+                timer.cancel()
+            if reason.check(defer.CancelledError):
+                reason = failure.Failure(CassandraPoolError('Health check of %s timed out' % member))
+            self._member_failed(member, reason)
+
+        md.addCallbacks(passed, failed)
+        return md
+
+
+class CassandraConnection(BasicLifecycleObject):
+    """
+    Base class for objects using a Cassandra cluster through a connection pool.
+    The pool is connected on activate and shut down on deactivate, terminate
+    and error.
+    """
+
+    def __init__(self, hosts, **pool_kwargs):
+        """
+        @param hosts list of (host, port) tuples
+        @param pool_kwargs passed to CassandraConnectionPool
+        """
+        BasicLifecycleObject.__init__(self)
+        self._manager = CassandraConnectionPool(hosts, **pool_kwargs)
+        self.client = CassandraClient(self._manager)
+
+    def on_initialize(self, *args, **kwargs):
+        log.info('on_initialize')
+
+    def on_activate(self, *args, **kwargs):
+        self._manager.connect()
+        log.info('on_activate: connected pool')
+
+    def on_deactivate(self, *args, **kwargs):
+        self._manager.shutdown()
+        log.info('on_deactivate: Lose TCP Connection')
+
+    def on_terminate(self, *args, **kwargs):
+        self._manager.shutdown()
+        log.info('on_terminate: Lose TCP Connection')
+
+    def on_error(self, *args, **kwargs):
+        self._manager.shutdown()
+        log.info('on_error: Lose TCP Connection')
+
+
+class CassandraStore(CassandraConnection):
     """
     An Adapter class that implements the IStore interface by way of a
     cassandra client connection. As an adapter, this assumes an active
@@ -64,9 +419,8 @@ class CassandraStore(TCPConnection):
         """
         functional wrapper around active client instance
         """
-        ### Get the host and port from the Persistent Technology resource
-        host = persistent_technology.hosts[0].host
-        port = persistent_technology.hosts[0].port
+        ### Get the hosts and ports from the Persistent Technology resource
+        hosts = [(host.host, host.port) for host in persistent_technology.hosts]
         
         ### Get the Key Space for the connection
         self._keyspace = persistent_archive.name
@@ -76,15 +430,12 @@ class CassandraStore(TCPConnection):
         uname = credentials.username
         pword = credentials.password
         authorization_dictionary = {'username': uname, 'password': pword}
-        log.info("Connecting to %s on port %s " % (host,port))
+        log.info("Connecting to %s" % (hosts,))
         log.info("Using keyspace %s" % (self._keyspace,))
         log.info("authorization_dictionary; %s" % (str(authorization_dictionary),))
-        ### Create the twisted factory for the TCP connection  
-        self._manager = ManagedCassandraClientFactory(keyspace=self._keyspace, credentials=authorization_dictionary)
-        
-        # Call the initialization of the Managed TCP connection base class
-        TCPConnection.__init__(self,host, port, self._manager)
-        self.client = CassandraClient(self._manager)    
+
+        # Create the connection pool and the client using it
+        CassandraConnection.__init__(self, hosts, keyspace=self._keyspace, credentials=authorization_dictionary)
         
         self._cache = cache # Cassandra Column Family maps to an ION Cache resource
         self._cache_name = cache.name
@@ -136,6 +487,28 @@ class CassandraStore(TCPConnection):
             ret = False
         defer.returnValue(ret)
 
+    @defer.inlineCallbacks
+    def multi_has_key(self, keys):
+        """
+        Checks which of the keys exist in the column family, with one
+        multiget_slice per CF_multiget_keys keys, run in parallel
+        @param keys an iterable of keys
+        @retVal Returns the set of the keys which exist in a deferred
+        """
+        keys = list(set(keys))
+        requests = []
+        for start in range(0, len(keys), CF_multiget_keys):
+            chunk = keys[start:start + CF_multiget_keys]
+            requests.append(self.client.multiget_slice(chunk, self._cache_name, names=['has_key']))
+
+        results = yield defer.gatherResults(requests)
+        found = set()
+        for rows in results:
+            for key, columns in rows.iteritems():
+                if columns:
+                    found.add(key)
+        defer.returnValue(found)
+
     @defer.inlineCallbacks
     def remove(self, key):
         """
@@ -146,30 +519,19 @@ class CassandraStore(TCPConnection):
         """
         yield self.client.remove(key, self._cache_name)
 
-    def on_deactivate(self, *args, **kwargs):
-        #self._connector.disconnect()
-        self._manager.shutdown()
-        log.info('on_deactivate: Lose TCP Connection')
-
-    def on_terminate(self, *args, **kwargs):
-        log.info("Called CassandraStore.on_terminate")
-        self._connector.disconnect()
-        self._manager.shutdown()
-        log.info('on_terminate: Lose TCP Connection')
-    
-    def on_error(self, *args, **kwargs):
-        log.info("Called CassandraStore.on_error")
-        self._connector.disconnect()
-        self._manager.shutdown()
-        log.info('on_error: Lose TCP Connection')
-
-
-    @defer.inlineCallbacks
-    def on_activate(self, *args, **kwargs):
-
-        yield TCPConnection.on_activate(self)
 
+# Active indexed stores of this container, notified when a column family is altered
+_indexed_stores = weakref.WeakKeyDictionary()
 
+def schema_changed(keyspace, column_family):
+    """
+    Refresh the cached schema of the active indexed stores using the column
+    family. Stores in other containers pick the change up on their next
+    periodic refresh.
+    """
+    stores = [store for store in _indexed_stores.keys()
+              if store._keyspace == keyspace and store._cache_name == column_family]
+    return defer.DeferredList([store.refresh_schema() for store in stores])
 
 
 class CassandraIndexedStore(CassandraStore):
@@ -177,6 +539,10 @@ class CassandraIndexedStore(CassandraStore):
     An Adapter class that provides the ability to use secondary indexes in Cassandra. It
     extends the IStore interface by adding a query and update_index method. It provides functionality
     for associating attributes with a value. These attributes are used in the query functionality. 
+
+    The names of the indexed columns are cached: loaded on activation,
+    reloaded every schema_refresh_interval seconds and when the column
+    family is altered through a CassandraDataManager in this container.
     """
     implements(store.IIndexStore)
     
@@ -185,9 +551,80 @@ class CassandraIndexedStore(CassandraStore):
         functional wrapper around active client instance
         """   
         CassandraStore.__init__(self, persistent_technology, persistent_archive, credentials, cache)  
+        self._init_schema_cache()
+
+    def _init_schema_cache(self, schema_refresh_interval=None):
+        self._query_attributes = None
         self._query_attribute_names = None
-            
-        
+        self._schema_waiters = None
+        self._schema_refresh_call = None
+        if schema_refresh_interval is None:
+            schema_refresh_interval = CF_schema_refresh_interval
+        self.schema_refresh_interval = schema_refresh_interval
+
+    def on_activate(self, *args, **kwargs):
+        CassandraStore.on_activate(self, *args, **kwargs)
+        _indexed_stores[self] = True
+        if self.schema_refresh_interval:
+            self._schema_refresh_call = LoopingCall(self._refresh_schema_periodically)
+            self._schema_refresh_call.start(self.schema_refresh_interval, now=True)
+        else:
+            self._refresh_schema_periodically()
+
+    def _stop_schema_refresh(self):
+        _indexed_stores.pop(self, None)
+        if self._schema_refresh_call is not None and self._schema_refresh_call.running:
+            self._schema_refresh_call.stop()
+        self._schema_refresh_call = None
+
+    def on_deactivate(self, *args, **kwargs):
+        self._stop_schema_refresh()
+        CassandraStore.on_deactivate(self, *args, **kwargs)
+
+    def on_terminate(self, *args, **kwargs):
+        self._stop_schema_refresh()
+        CassandraStore.on_terminate(self, *args, **kwargs)
+
+    def on_error(self, *args, **kwargs):
+        self._stop_schema_refresh()
+        CassandraStore.on_error(self, *args, **kwargs)
+
+    def _refresh_schema_periodically(self):
+        def failed(reason):
+            log.warn('Could not refresh the schema of %s: %s', self._cache_name, reason.getErrorMessage())
+        # Never fail - that would stop the LoopingCall
+        return self.refresh_schema().addErrback(failed)
+
+    @defer.inlineCallbacks
+    def refresh_schema(self):
+        """
+        Reload the names of the indexed columns from the cluster. Concurrent
+        calls share one describe_keyspace request.
+        @retval Deferred list of the indexed column names
+        """
+        if self._schema_waiters is not None:
+            d = defer.Deferred()
+            self._schema_waiters.append(d)
+            indexes = yield d
+            defer.returnValue(indexes)
+
+        self._schema_waiters = []
+        try:
+            indexes = yield self._describe_query_attributes()
+        except Exception:
+            reason = failure.Failure()
+            waiters, self._schema_waiters = self._schema_waiters, None
+            for d in waiters:
+                d.errback(reason)
+            reason.raiseException()
+
+        self._query_attributes = indexes
+        self._query_attribute_names = set(indexes)
+        waiters, self._schema_waiters = self._schema_waiters, None
+        for d in waiters:
+            d.callback(indexes)
+        defer.returnValue(indexes)
+
     @defer.inlineCallbacks
     def put(self, key, value, index_attributes=None):
         """
@@ -202,8 +639,7 @@ class CassandraIndexedStore(CassandraStore):
         else:
             index_cols = dict(**index_attributes)
 
-            
-        log.info(" index_attributes %s" % (index_cols))
+        log.debug("index_attributes %s", index_cols)
         yield self._check_index(index_cols)
         index_cols.update({"value":value, "has_key":"1"})
         
@@ -222,8 +658,6 @@ class CassandraIndexedStore(CassandraStore):
         yield self.client.batch_insert(key, self._cache_name, index_attributes)
         defer.succeed(None)
 
-    
-    @defer.inlineCallbacks
     def _check_index(self, index_attributes):
         """
         Ensure that the index_attribute keys are columns that are indexed in the column family.
@@ -231,25 +665,28 @@ class CassandraIndexedStore(CassandraStore):
         
         This method raises an IndexStoreError exception if the index_attribute dictionary has keys that 
         are not the names of the columns indexed. 
+
+        Validation uses the cached schema. The schema is reloaded first if it
+        is not loaded yet or does not know one of the attributes, in case the
+        column family was altered since the last refresh.
         """
-        #Get the set of indexes the first time this is called.
-        if self._query_attribute_names is None:
-            query_attributes =  yield self.get_query_attributes()
-            self._query_attribute_names = set(query_attributes)
-        
+        names = self._query_attribute_names
+        if names is None or not names.issuperset(index_attributes):
+            d = self.refresh_schema()
+            d.addCallback(lambda _: self._validate_index(index_attributes))
+            return d
+        return defer.maybeDeferred(self._validate_index, index_attributes)
+
+    def _validate_index(self, index_attributes):
         index_attribute_names = set(index_attributes.keys())
         
         if not index_attribute_names.issubset(self._query_attribute_names):
             bad_attrs = index_attribute_names.difference(self._query_attribute_names)
             raise IndexStoreError("These attributes: %s %s %s"  % (",".join(bad_attrs),os.linesep,"are not indexed."))
-        
-                
-        isstr = lambda x: isinstance(x, (str,unicode))
-        alltrue = lambda x,y: x and y
-        all_strings = reduce(alltrue, map(isstr, index_attributes.values()), True)
-        if not all_strings:
-            raise IndexStoreError("Values for the indexed columns must be of type str.")
-        
+
+        for value in index_attributes.itervalues():
+            if not isinstance(value, (str, unicode)):
+                raise IndexStoreError("Values for the indexed columns must be of type str.")
 
     @defer.inlineCallbacks    
     def query(self, query_predicates, row_count=100):
@@ -266,34 +703,54 @@ class CassandraIndexedStore(CassandraStore):
         """
         log.info(self._cache_name)
         predicates = query_predicates.get_predicates()
-        def fix_preds(query_tuple):
-            if query_tuple[2] == Query.EQ:
-                new_pred = IndexOperator.EQ
-            elif query_tuple[2] == Query.GT:
-                new_pred = IndexOperator.GT
+
+        selection_predicates = []
+        in_predicates = []
+        for name, value, predicate_type in predicates:
+            if predicate_type == Query.IN:
+                in_predicates.append([(name, v) for v in value])
+            elif predicate_type == Query.BETWEEN:
+                selection_predicates.append(IndexExpression(column_name=name, op=IndexOperator.GTE, value=value[0]))
+                selection_predicates.append(IndexExpression(column_name=name, op=IndexOperator.LTE, value=value[1]))
+            elif predicate_type in INDEX_OPERATORS:
+                selection_predicates.append(IndexExpression(column_name=name, op=INDEX_OPERATORS[predicate_type], value=value))
             else:
                 raise CassandraError("Illegal predicate value")
-            args = {'column_name':query_tuple[0], 'op':new_pred, 'value': query_tuple[1]}
-            return IndexExpression(**args)
-        selection_predicates = map(fix_preds, predicates)
-        log.info("Calling get_indexed_slices selection_predicate %s " % (selection_predicates,))
-        
-        rows = yield self.client.get_indexed_slices(self._cache_name, selection_predicates, count=row_count)
+
+        # Index clauses are conjunctions only: an IN predicate becomes one
+        # query per value (per combination of values for several), run in parallel
+        queries = []
+        for in_values in itertools.product(*in_predicates):
+            selection = selection_predicates + [IndexExpression(column_name=name, op=IndexOperator.EQ, value=v)
+                                                for name, v in in_values]
+            log.debug("Calling get_indexed_slices selection_predicate %s", selection)
+            queries.append(self.client.get_indexed_slices(self._cache_name, selection, count=row_count))
+
+        results = yield defer.gatherResults(queries)
         log.info("Got rows back")
         result ={}
-        for row in rows:
-            row_vals = {}
-            for column in row.columns:
-                row_vals[column.column.name] = column.column.value
-            result[row.key] = row_vals
+        for rows in results:
+            for row in rows:
+                row_vals = {}
+                for column in row.columns:
+                    row_vals[column.column.name] = column.column.value
+                result[row.key] = row_vals
 
         defer.returnValue(result)
         
-    @defer.inlineCallbacks
     def get_query_attributes(self):
         """
         Return the column names that are indexed.
         """
+        if self._query_attributes is not None:
+            return defer.succeed(list(self._query_attributes))
+        return self.refresh_schema()
+
+    @defer.inlineCallbacks
+    def _describe_query_attributes(self):
+        """
+        Get the column names that are indexed from the cluster.
+        """
         keyspace_description = yield self.client.describe_keyspace(self._keyspace)
         log.debug("keyspace desc %s" % (keyspace_description,))
         get_cfdef = lambda cfdef: cfdef.name == self._cache_name
@@ -324,6 +781,9 @@ class CassandraStorageResource:
     
     def get_port(self):
         return self.persistent_technology.hosts[0].port
+
+    def get_hosts(self):
+        return [(host.host, host.port) for host in self.persistent_technology.hosts]
     
     def get_credentials(self):    
         uname = self.credentials.username
@@ -332,7 +792,7 @@ class CassandraStorageResource:
         return authorization_dictionary
     
 
-class CassandraDataManager(TCPConnection):
+class CassandraDataManager(CassandraConnection):
 
     #implements(store.IDataManager)
 
@@ -340,14 +800,11 @@ class CassandraDataManager(TCPConnection):
         """
         @param storage_resource provides the connection information to connect to the Cassandra cluster.
         """
-        host = storage_resource.get_host()
-        port = storage_resource.get_port()
+        hosts = storage_resource.get_hosts()
         authorization_dictionary = storage_resource.get_credentials()
-        log.info("host: %s and port: %s" % (host,str(port)))
-        self._manager = ManagedCassandraClientFactory(credentials=authorization_dictionary)
-        
-        TCPConnection.__init__(self,host,port,self._manager)
-        self.client = CassandraClient(self._manager)    
+        log.info("hosts: %s" % (hosts,))
+
+        CassandraConnection.__init__(self, hosts, credentials=authorization_dictionary)
         
         
     @defer.inlineCallbacks
@@ -398,6 +855,7 @@ class CassandraDataManager(TCPConnection):
         yield self.client.set_keyspace(persistent_archive.name)
         cfdef = CfDef(keyspace=persistent_archive.name, name=cache.name)
         yield self.client.system_add_column_family(cfdef)
+        yield schema_changed(persistent_archive.name, cache.name)
     
     @defer.inlineCallbacks
     def remove_cache(self, persistent_archive, cache):
@@ -443,6 +901,7 @@ class CassandraDataManager(TCPConnection):
                        column_metadata= cf_column_metadata)   
         log.info("cf_def: " + str(cf_def))      
         yield self.client.system_update_column_family(cf_def) 
+        yield schema_changed(persistent_archive.name, cache.name)
     
     @defer.inlineCallbacks    
     def _describe_keyspace(self, keyspace):
@@ -480,15 +939,3 @@ class CassandraDataManager(TCPConnection):
         make_cdefs = lambda d: ColumnDef(**d)
         cdefs = map(make_cdefs, cdefs_dicts)
         return cdefs
-        
-        
-    def on_deactivate(self, *args, **kwargs):
-        self._manager.shutdown()
-        log.info('on_deactivate: Lose Connection TCP')
-
-    def on_terminate(self, *args, **kwargs):
-        self._manager.shutdown()
-        log.info('on_terminate: Lose Connection TCP')
-
-
-
@@ -10,8 +10,6 @@ services are not running yet.
 """
 
 from telephus.client import CassandraClient
-from telephus.protocol import ManagedCassandraClientFactory
-from ion.util.tcp_connections import TCPConnection
 from telephus.cassandra.ttypes import KsDef, CfDef, ColumnDef, NotFoundException, IndexType, InvalidRequestException
 
 from twisted.internet import defer
@@ -24,6 +22,7 @@ from ion.core.process import process
 from ion.core.process.process import ProcessFactory
 
 from ion.core.data.cassandra import CassandraStore, CassandraIndexedStore, CassandraError
+from ion.core.data.cassandra import CassandraConnection, CassandraConnectionPool
 from ion.core.data.storage_configuration_utility import PERSISTENT_ARCHIVE, STORAGE_PROVIDER, DEFAULT_KEYSPACE_NAME
 from ion.core.data import storage_configuration_utility
 import ion.util.ionlog
@@ -41,9 +40,7 @@ def parse_cassandra_config(username, password, storage_provider, keyspace=None):
 
 
     log.debug('Configuring Cassandra Connection: %s' % str(storage_provider))
-    host = storage_provider["host"]
-    port = storage_provider["port"]
-
+    hosts = get_storage_hosts(storage_provider)
 
     client_factory_kwargs = {'check_api_version':True}
 
@@ -54,47 +51,59 @@ def parse_cassandra_config(username, password, storage_provider, keyspace=None):
         authorization_dictionary = {"username":username, "password":password}
         client_factory_kwargs['credentials'] = authorization_dictionary
 
-    manager = ManagedCassandraClientFactory(**client_factory_kwargs)
+    log.info('CassandraBootStrap Hosts: %s' % (hosts,))
 
-    log.info('CassandraBootStrap Manager: Host - %s, Port - %s' % (host, port))
+    return (hosts, client_factory_kwargs)
 
-    return (host, port, manager)
+def get_storage_hosts(storage_provider):
+    """
+    @retval list of (host, port) tuples: the host and port of the storage
+        provider followed by its optional 'hosts' entry, a list of
+        'host:port' strings or [host, port] pairs.
+    """
+    port = storage_provider["port"]
+    hosts = [(storage_provider["host"], port)]
+    for entry in storage_provider.get("hosts") or []:
+        if isinstance(entry, basestring):
+            host, sep, entry_port = entry.partition(':')
+            entry = (host, int(entry_port or port))
+        entry = tuple(entry)
+        if entry not in hosts:
+            hosts.append(entry)
+    return hosts
 
 class CassandraIndexedStoreBootstrap(CassandraIndexedStore):
     
-    def __init__(self, username, password, storage_provider, keyspace, column_family):
+    def __init__(self, username, password, storage_provider, keyspace, column_family,
+                 schema_refresh_interval=None, **pool_kwargs):
 
         log.info("CassandraIndexedStoreBootstrap: username - %s, password - %s, storage_provider - %s, keyspace - %s, column_family - %s" %
         (username, password, storage_provider, keyspace, column_family))
 
-        host, port, manager = parse_cassandra_config(username, password, storage_provider, keyspace)
-
-        TCPConnection.__init__(self,host, port, manager)
+        hosts, client_factory_kwargs = parse_cassandra_config(username, password, storage_provider, keyspace)
 
-        self.client = CassandraClient(manager)
-        self._manager = manager
+        client_factory_kwargs.update(pool_kwargs)
+        CassandraConnection.__init__(self, hosts, **client_factory_kwargs)
 
         self._keyspace = keyspace
 
-        self._query_attribute_names = None
         self._cache_name = column_family
+        self._init_schema_cache(schema_refresh_interval)
 
 
 
 
 class CassandraStoreBootstrap(CassandraStore):
 
-    def __init__(self, username, password, storage_provider, keyspace, column_family):
+    def __init__(self, username, password, storage_provider, keyspace, column_family, **pool_kwargs):
 
         log.info("CassandraStoreBootstrap: username - %s, password - %s, storage_provider - %s, keyspace - %s, column_family - %s" %
         (username, password, storage_provider, keyspace, column_family))
 
-        host, port, manager = parse_cassandra_config(username, password, storage_provider, keyspace)
+        hosts, client_factory_kwargs = parse_cassandra_config(username, password, storage_provider, keyspace)
 
-        TCPConnection.__init__(self,host, port, manager)
-
-        self.client = CassandraClient(manager)
-        self._manager = manager
+        client_factory_kwargs.update(pool_kwargs)
+        CassandraConnection.__init__(self, hosts, **client_factory_kwargs)
 
 
         self._keyspace = keyspace
@@ -118,29 +127,27 @@ class CassandraSchemaProvider(object):
             raise CassandraSchemaError('Invalid storage_conf dictionary passed to CassandraSchemaProvider')
 
 
-        host, port, manager = parse_cassandra_config(username, password, storage_provider)
+        hosts, client_factory_kwargs = parse_cassandra_config(username, password, storage_provider)
 
         self._storage_conf = storage_conf
 
-        self.client = CassandraClient(manager)
-
-        self._host = host
-        self._port = port
-        self._manager = manager
+        self._manager = CassandraConnectionPool(hosts, **client_factory_kwargs)
+        self.client = CassandraClient(self._manager)
 
-        self._connector = None
+        self._connected = False
 
         self.error_if_existing = error_if_existing
 
 
     def connect(self):
-        self._connector = reactor.connectTCP(self._host, self._port, self._manager)
+        self._manager.connect()
+        self._connected = True
         log.info('on_activate: connected TCP')
 
 
     def disconnect(self):
         self._manager.shutdown()
-        self._connector = None
+        self._connected = False
 
 
     @defer.inlineCallbacks
@@ -161,7 +168,7 @@ class CassandraSchemaProvider(object):
         if keyspace == DEFAULT_KEYSPACE_NAME or keyspace is None:
             raise CassandraSchemaError('Invlaid keyspace name in CassandraSchemaProvider - Default is not allowed!')
 
-        if self._connector is None:
+        if not self._connected:
             raise CassandraSchemaError('Not connected to cassandra!')
 
         ks_cassandra = None
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/compressed_store.py
+@brief An IStore wrapper compressing values with zlib. Compressed values
+    carry a header, so values written with and without compression can be
+    read from the same store.
+"""
+
+import zlib
+import time
+
+from zope.interface import implements
+
+from ion.core import ioninit
+from ion.core.data import store
+from ion.util import metrics
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+CONF = ioninit.config(__name__)
+
+# zlib level, 1 (fastest) to 9 (smallest)
+CF_level = CONF.getValue('level', 6)
+# Values shorter than this many bytes are written as they are
+CF_threshold = CONF.getValue('threshold', 512)
+
+# A serialized protocol buffer never starts with a zero byte - field numbers
+# start at 1 - so a serialized StructureElement is never taken for a value
+# with a header. Other values starting with a zero byte get the STORED codec.
+HEADER = '\x00ZC'
+STORED = '\x00'
+ZLIB = '\x01'
+
+
+class CompressedStoreError(Exception):
+    """
+    Raised when a value has a header with an unknown codec
+    """
+
+
+def encode(value, level=None, threshold=None):
+    """
+    @param value str to be written to a store
+    @retval the value compressed with a header, or the value itself if it is
+        short or does not compress
+    """
+    if level is None:
+        level = CF_level
+    if threshold is None:
+        threshold = CF_threshold
+
+    if len(value) >= threshold:
+        compressed = zlib.compress(value, level)
+        if len(compressed) + len(HEADER) + 1 < len(value):
+            return HEADER + ZLIB + compressed
+
+    if value.startswith('\x00'):
+        return HEADER + STORED + value
+    return value
+
+
+def decode(value):
+    """
+    @param value str read from a store, written by encode or not
+    @retval the value as it was passed to encode
+    """
+    if value is None or not value.startswith(HEADER):
+        return value
+
+    codec = value[len(HEADER):len(HEADER) + 1]
+    if codec == ZLIB:
+        return zlib.decompress(value[len(HEADER) + 1:])
+    elif codec == STORED:
+        return value[len(HEADER) + 1:]
+    raise CompressedStoreError('Unknown codec %r in value header' % codec)
+
+
+class CompressedStore(object):
+    """
+    Wraps an IStore, compressing the values put and decompressing the values
+    read. The wrapped store is used as it is - its life cycle is up to the
+    owner.
+
+    Bytes put before and after compression are counted in stats, and in the
+    metrics registry when it is enabled.
+    """
+    implements(store.IStore)
+
+    def __init__(self, backend, level=None, threshold=None):
+        """
+        @param backend The IStore holding the compressed values
+        @param level zlib compression level
+        @param threshold Size in bytes from which values are compressed
+        """
+        self.backend = backend
+        self.level = CF_level if level is None else level
+        self.threshold = CF_threshold if threshold is None else threshold
+
+        self.stats = {'values':0, 'compressed':0, 'bytes_in':0, 'bytes_stored':0, 'seconds':0.0}
+
+    def get(self, key):
+        """
+        @see IStore.get
+        """
+        d = self.backend.get(key)
+        d.addCallback(decode)
+        return d
+
+    def put(self, key, value):
+        """
+        @see IStore.put
+        """
+        start = time.time()
+        encoded = encode(value, self.level, self.threshold)
+
+        stats = self.stats
+        stats['seconds'] += time.time() - start
+        stats['values'] += 1
+        stats['bytes_in'] += len(value)
+        stats['bytes_stored'] += len(encoded)
+        if len(encoded) < len(value):
+            stats['compressed'] += 1
+
+        if metrics.registry.enabled:
+            metrics.registry.inc('compressed_store.bytes_in', len(value))
+            metrics.registry.inc('compressed_store.bytes_stored', len(encoded))
+
+        return self.backend.put(key, encoded)
+
+    def remove(self, key):
+        """
+        @see IStore.remove
+        """
+        return self.backend.remove(key)
+
+    def has_key(self, key):
+        """
+        @see IStore.has_key
+        """
+        return self.backend.has_key(key)
+
+    def multi_has_key(self, keys):
+        """
+        @see IStore.multi_has_key
+        """
+        return self.backend.multi_has_key(keys)
+
+    def ratio(self):
+        """
+        @retval Bytes put over bytes stored since the store was created
+        """
+        return float(self.stats['bytes_in']) / (self.stats['bytes_stored'] or 1)
@@ -92,13 +92,25 @@ class IndexStoreService(ServiceProcess):
         log.debug("In op_query: request %s" % request)
 
         query_predicates = Query()    
+        # IN predicates arrive as one attribute per value
+        in_values = {}
         for attr in request.attrs:
             if attr.predicate_type == Query.EQ:
                 query_predicates.add_predicate_eq(attr.attribute_name, attr.attribute_value)
             elif attr.predicate_type == Query.GT:
                 query_predicates.add_predicate_gt(attr.attribute_name, attr.attribute_value)
+            elif attr.predicate_type == Query.GTE:
+                query_predicates.add_predicate_gte(attr.attribute_name, attr.attribute_value)
+            elif attr.predicate_type == Query.LT:
+                query_predicates.add_predicate_lt(attr.attribute_name, attr.attribute_value)
+            elif attr.predicate_type == Query.LTE:
+                query_predicates.add_predicate_lte(attr.attribute_name, attr.attribute_value)
+            elif attr.predicate_type == Query.IN:
+                in_values.setdefault(attr.attribute_name, []).append(attr.attribute_value)
             else:
                 raise IndexStoreServiceException("Unhandled predicate type: %s " % (attr.predicate_type,))
+        for name, values in in_values.iteritems():
+            query_predicates.add_predicate_in(name, values)
                 
         results = yield self._indexed_store.query(query_predicates)
         #Now we have to put these back into a response
@@ -191,6 +203,21 @@ class IndexStoreService(ServiceProcess):
         response = yield self.message_client.create_instance(ROW_TYPE)
         response.value = str(int(key_exists))
         yield self.reply_ok(msg, response)
+
+    @defer.inlineCallbacks
+    def op_multi_has_key(self, request, headers, msg):
+        """
+        @note sees which of the keys exist in the cluster
+        @request is a rows message object with the keys to check
+        @retval return a rows message with a row for each key which exists
+        """
+        keys = [row.key for row in request.rows]
+        found = yield self._indexed_store.multi_has_key(keys)
+        response = yield self.message_client.create_instance(ROWS_TYPE)
+        for key in found:
+            r = response.rows.add()
+            r.key = key
+        yield self.reply_ok(msg, response)
         
     @defer.inlineCallbacks
     def op_get_query_attributes(self, request, headers, msg):
@@ -234,10 +261,20 @@ class IndexStoreServiceClient(ServiceClient):
         request = yield self.mc.create_instance(QUERY_ATTRIBUTES_TYPE)
 
         for attr_key,attr_value,pred_type in query_predicates.get_predicates():
-            attr = request.attrs.add()                
-            attr.attribute_name = str(attr_key)
-            attr.attribute_value = str(attr_value)
-            attr.predicate_type = str(pred_type)
+            # The message holds one value per attribute: BETWEEN is sent as
+            # GTE and LTE, IN as one attribute per value
+            if pred_type == Query.BETWEEN:
+                attrs = [(Query.GTE, attr_value[0]), (Query.LTE, attr_value[1])]
+            elif pred_type == Query.IN:
+                attrs = [(Query.IN, value) for value in attr_value]
+            else:
+                attrs = [(pred_type, attr_value)]
+
+            for pred_type, attr_value in attrs:
+                attr = request.attrs.add()                
+                attr.attribute_name = str(attr_key)
+                attr.attribute_value = str(attr_value)
+                attr.predicate_type = str(pred_type)
 
         (result, headers, msg) = yield self.rpc_send('query', request)
 
@@ -331,6 +368,17 @@ class IndexStoreServiceClient(ServiceClient):
         ret = bool(int(result.value))
         log.info("%s" % (ret,))
         defer.returnValue(ret)
+
+    @defer.inlineCallbacks
+    def multi_has_key(self, keys):
+        log.info("Called Index Store Service client: multi_has_key")
+        request = yield self.mc.create_instance(ROWS_TYPE)
+        for key in keys:
+            row = request.rows.add()
+            row.key = key
+        (result, headers, msg) = yield self.rpc_send('multi_has_key', request)
+        found = set([row.key for row in result.rows])
+        defer.returnValue(found)
         
     @defer.inlineCallbacks
     def get_query_attributes(self):
@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/sqlite_store.py
+@brief Embedded, disk backed implementations of IStore and IIndexStore on
+    sqlite3 in write ahead log mode. Writes are batched into one transaction,
+    reads go through a byte bounded LRU cache of values.
+"""
+
+import os
+import re
+import sqlite3
+
+from zope.interface import implements
+
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.enterprise import adbapi
+from twisted.python.failure import Failure
+
+from ion.core import ioninit
+from ion.core.data import store
+from ion.core.data.store import Query, IndexStoreError
+from ion.util.cache import LRUDict
+from ion.util.state_object import BasicLifecycleObject
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+CONF = ioninit.config(__name__)
+
+# Database file - defaults to data/<sysname>.db under the working directory
+CF_database = CONF.getValue('database', None)
+# Writes queued before a batch is flushed without waiting for the next reactor turn
+CF_batch_size = CONF.getValue('batch_size', 500)
+# Bytes of values kept in the read cache of each store
+CF_cache_size = CONF.getValue('cache_size', 10**7)
+# Seconds a connection waits for the write lock held by another connection
+CF_busy_timeout = CONF.getValue('busy_timeout', 30.0)
+# Writes to an index store before its query planner statistics are first refreshed
+CF_analyze_rows = CONF.getValue('analyze_rows', 1000)
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Host parameters of one statement - the default limit of sqlite builds is 999
+MAX_VARIABLES = 500
+
+# Pending value of a key removed in a batch which is not written yet
+_REMOVED = object()
+
+SQL_OPERATORS = {Query.EQ:'=',
+                 Query.GT:'>',
+                 Query.LT:'<',
+                 Query.GTE:'>=',
+                 Query.LTE:'<=',
+                 }
+
+
+class SqliteStoreError(Exception):
+    """
+    Raised on invalid sqlite store configuration
+    """
+
+
+def default_database():
+    """
+    @retval The database file of stores created without one
+    """
+    if CF_database:
+        return CF_database
+    return os.path.join('data', '%s.db' % (ioninit.sys_name or 'ion'))
+
+
+def _quote(name):
+    if not _IDENTIFIER.match(name):
+        raise SqliteStoreError('Invalid table or column name: %s' % name)
+    return '"%s"' % name
+
+
+def _open_connection(connection):
+    """
+    Called by the connection pool on each new connection
+    """
+    # Attribute values come back as the str they were put as
+    connection.text_factory = str
+    connection.execute('PRAGMA journal_mode=WAL')
+    # Durable at checkpoints - a power loss may drop the last transactions, never corrupts
+    connection.execute('PRAGMA synchronous=NORMAL')
+    # Bound the rows ANALYZE reads per index, where supported
+    connection.execute('PRAGMA analysis_limit=1000')
+
+
+class SqliteStore(BasicLifecycleObject):
+    """
+    Disk backed key value store in one table of a sqlite3 database. The
+    database is opened on activation and closed on termination, after the
+    pending writes are flushed.
+
+    Puts and removes are queued and written together in one transaction at
+    the end of the reactor turn, or as soon as batch_size writes are queued;
+    the deferred of each write fires once its transaction commits. Reads see
+    the queued writes.
+
+    All statements run in order on a single connection, which is what makes
+    caching the result of a read safe: a read is answered before any write
+    queued after it.
+    """
+    implements(store.IStore)
+
+    def __init__(self, database=None, table='blobs', batch_size=None, cache_size=None):
+        """
+        @param database Path to the database file, created if it does not exist.
+            Several stores may share a database, each using its own table.
+        @param table Name of the table holding the keys and values
+        """
+        BasicLifecycleObject.__init__(self)
+
+        self.database = database or default_database()
+        self.table = _quote(table)
+        self.batch_size = max(int(batch_size or CF_batch_size), 1)
+        self._cache = LRUDict(int(cache_size or CF_cache_size), use_size=True)
+
+        self._dbpool = None
+        # key -> value or _REMOVED of the queued writes
+        self._pending = {}
+        self._ops = []
+        self._waiters = []
+        self._flush_call = None
+
+    def on_initialize(self, *args, **kwargs):
+        log.info('Initializing sqlite store %s in %s' % (self.table, self.database))
+
+    @defer.inlineCallbacks
+    def on_activate(self, *args, **kwargs):
+        directory = os.path.dirname(os.path.abspath(self.database))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._dbpool = adbapi.ConnectionPool('sqlite3', self.database, timeout=CF_busy_timeout,
+                                             check_same_thread=False, cp_min=1, cp_max=1,
+                                             cp_openfun=_open_connection)
+        yield self._dbpool.runInteraction(self._create_table)
+        log.info('Activated sqlite store %s in %s' % (self.table, self.database))
+
+    def on_deactivate(self, *args, **kwargs):
+        return self._close()
+
+    def on_terminate(self, *args, **kwargs):
+        return self._close()
+
+    def on_error(self, *args, **kwargs):
+        return self._close()
+
+    @defer.inlineCallbacks
+    def _close(self):
+        if self._dbpool is None:
+            return
+        try:
+            yield self.flush()
+        finally:
+            self._dbpool.close()
+            self._dbpool = None
+            self._cache = LRUDict(self._cache.limit, use_size=True)
+
+    def _create_table(self, txn):
+        txn.execute('CREATE TABLE IF NOT EXISTS %s (key BLOB PRIMARY KEY, value BLOB)' % self.table)
+
+    def get(self, key):
+        """
+        @see IStore.get
+        """
+        pending = self._pending.get(key)
+        if pending is not None:
+            if pending is _REMOVED:
+                return defer.succeed(None)
+            return defer.succeed(pending)
+
+        if key in self._cache:
+            return defer.succeed(self._cache[key])
+
+        d = self._dbpool.runQuery('SELECT value FROM %s WHERE key = ?' % self.table, (sqlite3.Binary(key),))
+        d.addCallback(self._got_value, key)
+        return d
+
+    def _got_value(self, rows, key):
+        if not rows:
+            return None
+        value = str(rows[0][0])
+        # A write queued since the read was issued supersedes what it found
+        if key not in self._pending:
+            self._cache[key] = value
+        return value
+
+    def put(self, key, value):
+        """
+        @see IStore.put
+        """
+        return self._queue('put', key, value)
+
+    def remove(self, key):
+        """
+        @see IStore.remove
+        """
+        return self._queue('remove', key, _REMOVED)
+
+    def has_key(self, key):
+        """
+        @see IStore.has_key
+        """
+        pending = self._pending.get(key)
+        if pending is not None:
+            return defer.succeed(pending is not _REMOVED)
+
+        if key in self._cache:
+            return defer.succeed(True)
+
+        d = self._dbpool.runQuery('SELECT 1 FROM %s WHERE key = ?' % self.table, (sqlite3.Binary(key),))
+        d.addCallback(bool)
+        return d
+
+    def multi_has_key(self, keys):
+        """
+        @see IStore.multi_has_key
+        """
+        found = set()
+        lookup = []
+        for key in set(keys):
+            pending = self._pending.get(key)
+            if pending is not None:
+                if pending is not _REMOVED:
+                    found.add(key)
+            elif key in self._cache:
+                found.add(key)
+            else:
+                lookup.append(key)
+
+        if not lookup:
+            return defer.succeed(found)
+
+        d = self._dbpool.runInteraction(self._select_keys, lookup)
+        d.addCallback(self._got_keys, found)
+        return d
+
+    def _select_keys(self, txn, keys):
+        rows = []
+        for start in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[start:start + MAX_VARIABLES]
+            txn.execute('SELECT key FROM %s WHERE key IN (%s)' % (self.table, ', '.join('?' * len(chunk))),
+                        [sqlite3.Binary(key) for key in chunk])
+            rows.extend(txn.fetchall())
+        return rows
+
+    def _got_keys(self, rows, found):
+        for row in rows:
+            key = str(row[0])
+            # A remove queued since the lookup was issued supersedes what it found
+            if self._pending.get(key) is not _REMOVED:
+                found.add(key)
+        return found
+
+    def _queue(self, op, key, value, *args):
+        """
+        Queue a write for the next batch and return a deferred fired when it is committed
+        """
+        if value is not None:
+            self._pending[key] = value
+        if key in self._cache:
+            del self._cache[key]
+        self._ops.append((op, key, value) + args)
+
+        d = defer.Deferred()
+        self._waiters.append(d)
+
+        if len(self._ops) >= self.batch_size:
+            self.flush()
+        elif self._flush_call is None:
+            self._flush_call = reactor.callLater(0, self.flush)
+        return d
+
+    def flush(self):
+        """
+        Write the queued puts and removes in one transaction
+        @retval Deferred fired when they are committed
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+
+        if not self._ops:
+            return defer.succeed(None)
+
+        ops, waiters = self._ops, self._waiters
+        self._ops, self._waiters = [], []
+
+        d = self._dbpool.runInteraction(self._write, ops)
+        d.addBoth(self._flushed, ops, waiters)
+        return d
+
+    def _write(self, txn, ops):
+        for op in ops:
+            if op[0] == 'remove':
+                txn.execute('DELETE FROM %s WHERE key = ?' % self.table, (sqlite3.Binary(op[1]),))
+            else:
+                self._write_op(txn, op)
+
+    def _write_op(self, txn, op):
+        name, key, value = op
+        txn.execute('INSERT OR REPLACE INTO %s (key, value) VALUES (?, ?)' % self.table,
+                    (sqlite3.Binary(key), sqlite3.Binary(value)))
+
+    def _flushed(self, result, ops, waiters):
+        for op in ops:
+            key, value = op[1], op[2]
+            if value is not None and self._pending.get(key) is value:
+                del self._pending[key]
+
+        if isinstance(result, Failure):
+            log.error('Failed to write %d operations to sqlite store %s: %s' %
+                      (len(ops), self.table, result.getErrorMessage()))
+            for d in waiters:
+                d.errback(result)
+            return None
+
+        for d in waiters:
+            d.callback(None)
+        return None
+
+
+class SqliteIndexStore(SqliteStore):
+    """
+    Disk backed index store: each indexed attribute is a column of the table
+    with an index on it, so queries including range predicates are answered
+    by sqlite from its b-trees. Columns for new indexed attributes are added
+    to an existing table on activation.
+    """
+    implements(store.IIndexStore)
+
+    def __init__(self, database=None, table='commits', indices=None, batch_size=None, cache_size=None):
+        """
+        @param indices The names of the indexed attributes
+        """
+        SqliteStore.__init__(self, database=database, table=table, batch_size=batch_size, cache_size=cache_size)
+        self.indices = list(indices or [])
+        self._columns = dict((name, _quote(name)) for name in self.indices)
+
+        # Only used by the database thread
+        self._unanalyzed = 0
+        self._analyze_after = CF_analyze_rows
+
+    def _create_table(self, txn):
+        SqliteStore._create_table(self, txn)
+
+        txn.execute('PRAGMA table_info(%s)' % self.table)
+        existing = set(row[1] for row in txn.fetchall())
+        table_name = self.table.strip('"')
+        for name in self.indices:
+            if name not in existing:
+                txn.execute('ALTER TABLE %s ADD COLUMN %s TEXT' % (self.table, self._columns[name]))
+            txn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' %
+                        (_quote('%s_%s' % (table_name, name)), self.table, self._columns[name]))
+
+    def _check_attributes(self, index_attributes):
+        bad_attrs = set(index_attributes.keys()).difference(self._columns)
+        if bad_attrs:
+            raise IndexStoreError("These attributes: %s %s %s" % (",".join(bad_attrs), os.linesep, "are not indexed."))
+
+    def put(self, key, value, index_attributes=None):
+        """
+        @see IIndexStore.put
+        Raises an exception if index_attibutes contains attributes that are not indexed
+        by the underlying store.
+        """
+        index_attributes = index_attributes or {}
+        try:
+            self._check_attributes(index_attributes)
+        except IndexStoreError:
+            return defer.fail()
+        return self._queue('put', key, value, dict(index_attributes))
+
+    def update_index(self, key, index_attributes):
+        """
+        @see IIndexStore.update_index
+        """
+        try:
+            self._check_attributes(index_attributes)
+        except IndexStoreError:
+            return defer.fail()
+        if not index_attributes:
+            return defer.succeed(None)
+        return self._queue('update', key, None, dict(index_attributes))
+
+    def _write(self, txn, ops):
+        SqliteStore._write(self, txn, ops)
+
+        # Without statistics sqlite answers EQ and range predicates from the
+        # index of the EQ attribute, even when every row has the same value.
+        # Refresh them each time the number of writes doubles.
+        self._unanalyzed += len(ops)
+        if self._unanalyzed >= self._analyze_after:
+            txn.execute('ANALYZE %s' % self.table)
+            self._unanalyzed = 0
+            self._analyze_after *= 2
+
+    def _write_op(self, txn, op):
+        name, key, value, attrs = op
+        names = sorted(attrs)
+        columns = [self._columns[attr] for attr in names]
+        args = [attrs[attr] for attr in names]
+        if name == 'update':
+            txn.execute('UPDATE %s SET %s WHERE key = ?' % (self.table, ', '.join('%s = ?' % c for c in columns)),
+                        args + [sqlite3.Binary(key)])
+        else:
+            txn.execute('INSERT OR REPLACE INTO %s (%s) VALUES (%s)' %
+                        (self.table, ', '.join(['key', 'value'] + columns), ', '.join('?' * (len(columns) + 2))),
+                        [sqlite3.Binary(key), sqlite3.Binary(value)] + args)
+
+    def query(self, query_predicates):
+        """
+        @see IIndexStore.query
+        Queued writes are flushed first, so the result includes them.
+        @retVal dict of key to a dict of the value and indexed attributes of each matching row
+        """
+        predicates = query_predicates.get_predicates()
+        if not [p for p in predicates if p[2] in (Query.EQ, Query.IN)]:
+            return defer.fail(IndexStoreError('A query needs at least one EQ or IN predicate'))
+
+        clauses = []
+        args = []
+        for name, value, predicate_type in predicates:
+            column = self._columns.get(name)
+            if column is None:
+                # Nothing has an attribute which is not indexed
+                return defer.succeed({})
+            if predicate_type == Query.BETWEEN:
+                clauses.append('%s BETWEEN ? AND ?' % column)
+                args.extend(value)
+            elif predicate_type == Query.IN:
+                values = list(value)
+                if not values:
+                    return defer.succeed({})
+                clauses.append('%s IN (%s)' % (column, ', '.join('?' * len(values))))
+                args.extend(values)
+            else:
+                clauses.append('%s %s ?' % (column, SQL_OPERATORS[predicate_type]))
+                args.append(value)
+
+        self.flush()
+        sql = 'SELECT key, value, %s FROM %s WHERE %s' % (', '.join(self._columns[name] for name in self.indices),
+                                                          self.table, ' AND '.join(clauses))
+        d = self._dbpool.runQuery(sql, args)
+        d.addCallback(self._query_result)
+        return d
+
+    def _query_result(self, rows):
+        result = {}
+        for row in rows:
+            attributes = {'value':str(row[1])}
+            for name, attr_val in zip(self.indices, row[2:]):
+                if attr_val is not None:
+                    attributes[name] = attr_val
+            result[str(row[0])] = attributes
+        return result
+
+    def get_query_attributes(self):
+        """
+        @see IIndexStore.get_query_attributes
+        """
+        return defer.succeed(list(self.indices))
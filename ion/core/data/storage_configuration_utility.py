@@ -109,6 +109,8 @@ blob_cf['name']=BLOB_CACHE
 ### This is the cassandra cluster details - do not put credentials in a config file!
 storage_provider = {'host':'localhost', # ec2-184-72-14-57.us-west-1.compute.amazonaws.com',
                     'port':9160,
+                    # Further nodes of the cluster for the connection pool: 'host:port' or [host, port]
+                    'hosts':[],
                     }
 
 class StorageConfigurationError(Exception):
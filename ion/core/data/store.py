@@ -9,6 +9,7 @@
         in memory implementation
 """
 import os
+import bisect
 from zope.interface import Interface
 from zope.interface import implements
 
@@ -49,6 +50,13 @@ class IStore(Interface):
      
         """
 
+    def multi_has_key(keys):
+        """
+        Checks which of the keys exist, in as few round trips as the backend allows
+        @param keys an iterable of keys
+        @retval Deferred, for the set of the keys which exist
+        """
+
 class Store(object):
     """
     Memory implementation of an asynchronous key/value store, using a dict.
@@ -92,6 +100,12 @@ class Store(object):
         """ 
         return defer.maybeDeferred(self.kvs.has_key, key )
 
+    def multi_has_key(self, keys):
+        """
+        @see IStore.multi_has_key
+        """
+        return defer.succeed(set([key for key in keys if self.kvs.has_key(key)]))
+
 
 class IIndexStore(IStore):
     """
@@ -142,6 +156,13 @@ class IIndexStore(IStore):
         @param key is the key to check in the column family
         @retVal Returns a bool in a deferred
         """ 
+
+    def multi_has_key(keys):
+        """
+        Checks which of the keys exist in the column family
+        @param keys an iterable of keys
+        @retVal Returns the set of the keys which exist in a deferred
+        """
     
     def get_query_attributes( ):
         """
@@ -153,6 +174,66 @@ class IndexStoreError(Exception):
     An exception class for the index store
     """
 
+class AttributeIndex(dict):
+    """
+    Index of one attribute: maps each value to the set of keys of the rows
+    having it, and keeps the distinct values sorted so that range predicates
+    find their values by bisection.
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self.sorted_values = []
+
+    def add(self, value, key):
+        keys = self.get(value)
+        if keys is None:
+            keys = self[value] = set()
+            bisect.insort(self.sorted_values, value)
+        keys.add(key)
+
+    def discard(self, value, key):
+        keys = self.get(value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if not keys:
+            del self[value]
+            i = bisect.bisect_left(self.sorted_values, value)
+            if i < len(self.sorted_values) and self.sorted_values[i] == value:
+                del self.sorted_values[i]
+
+    def value_range(self, low=None, high=None, include_low=True, include_high=True):
+        """
+        @retval (start, end) slice of sorted_values between low and high. None is unbounded.
+        """
+        values = self.sorted_values
+        if low is None:
+            start = 0
+        elif include_low:
+            start = bisect.bisect_left(values, low)
+        else:
+            start = bisect.bisect_right(values, low)
+
+        if high is None:
+            end = len(values)
+        elif include_high:
+            end = bisect.bisect_right(values, high)
+        else:
+            end = bisect.bisect_left(values, high)
+        return start, max(start, end)
+
+    def range_keys(self, start, end):
+        """
+        @retval set of the keys of the values in sorted_values[start:end]
+        """
+        keys = set()
+        values = self.sorted_values
+        for i in xrange(start, end):
+            keys.update(self[values[i]])
+        return keys
+
+
 class IndexStore(object):
     """
     Memory implementation of an asynchronous key/value store, using a dict.
@@ -170,6 +251,8 @@ class IndexStore(object):
     
     self.indices is an index to map attribute names to attribute values to keys
         {attr_names:{attr_value: set( keys)}}.
+    Each attribute index is an AttributeIndex which also keeps its values
+    sorted, so a range predicate costs O(log n + k) for k matching values.
     """
     implements(IIndexStore)
 
@@ -183,7 +266,7 @@ class IndexStore(object):
         if kwargs.has_key('indices'):
             for name in kwargs.get('indices'):
                 if not self.indices.has_key(name):
-                    self.indices[name]={}
+                    self.indices[name]=AttributeIndex()
 
     def get(self, key):
         """
@@ -227,45 +310,65 @@ class IndexStore(object):
         
         @retVal A data structure representing Cassandra rows. See the class
         docstring for the description of the data structure.
+
+        Equality (EQ, IN) predicates are evaluated first, smallest key set
+        first. Each range predicate then either filters the candidate rows by
+        value or intersects them with the keys of its values in the sorted
+        index, whichever touches fewer entries.
         """
-        log.debug("In query: predicates %s" % query_predicates)
+        log.debug("In query: predicates %s", query_predicates)
 
         predicates = query_predicates.get_predicates()
 
-        eq_filter = lambda x: x[2] == Query.EQ
-        preds_eq = filter(eq_filter, predicates)
-        keys = set()
-        if len(preds_eq) == 0:
-            raise IndexStoreError('Invalid arguments to IndexStore - must provide at least one equal to operator for search!')
-        else:
-            k,v,pred = preds_eq.pop()
-            kindex = self.indices.get(k, None)
-            if kindex:
-                keys.update(kindex.get(v,set()))
-
-        for k,v,p in predicates:
-
-            kindex = self.indices.get(k,None)
+        eq_sets = []
+        range_preds = []
+        for k, v, p in predicates:
+            if k in self.indices:
+                kindex = self._attribute_index(k)
+            else:
+                kindex = AttributeIndex()
             if p == Query.EQ:
-                
-                if kindex:
-                    keys.intersection_update(kindex.get(v,set()))
-            elif p == Query.GT:
-                
+                eq_sets.append(kindex.get(v, _EMPTY))
+            elif p == Query.IN:
                 matches = set()
-                for attr_val in kindex.keys():
-                    if attr_val > v:
-                        matches.update(kindex.get(attr_val,set()))
-                keys.intersection_update(matches)
+                for value in v:
+                    matches.update(kindex.get(value, _EMPTY))
+                eq_sets.append(matches)
+            elif p in Query.RANGES:
+                range_preds.append((k, v, p, kindex))
+            else:
+                raise IndexStoreError('Invalid predicate type: %s' % (p,))
+
+        if len(eq_sets) == 0:
+            raise IndexStoreError('Invalid arguments to IndexStore - must provide at least one equal to or in operator for search!')
+
+        # Intersect from the smallest set, never modifying the index sets
+        eq_sets.sort(key=len)
+        keys = eq_sets[0]
+        for other in eq_sets[1:]:
+            if not keys:
+                break
+            keys = keys.intersection(other)
+
+        for k, v, p, kindex in range_preds:
+            if not keys:
+                break
+            start, end = kindex.value_range(**Query.range_bounds(v, p))
+            if len(keys) <= end - start:
+                test = Query.range_test(v, p)
+                keys = set(key for key in keys if key in self.kvs and k in self.kvs[key] and test(self.kvs[key][k]))
+            else:
+                keys = kindex.range_keys(start, end).intersection(keys)
 
         #log.debug("keys: "+ str(keys))
         result = {}
         for k in keys:
             # This is stupid, but now remove effectively works - delete keys are no longer visible!
-            if self.kvs.has_key(k):
-                result[k] = self.kvs.get(k).copy()
+            row = self.kvs.get(k)
+            if row is not None:
+                result[k] = row.copy()
 
-        log.debug("Query Results: %s" % result)
+        log.debug("Query Results: %s", result)
 
         return defer.succeed(result)                
     
@@ -289,19 +392,24 @@ class IndexStore(object):
 
 
             for k,v in changed_attrs.items():
-                kindex = self.indices.get(k)
-                # Create a set of keys if it does not already exist
-                kindex[v].discard(key)
+                self._attribute_index(k).discard(v, key)
 
 
         for k, v in index_attributes.items():
-            kindex = self.indices.get(k, None)
-            #if not kindex:
-            #    kindex = {}
-            #    self.indices[k] = kindex
             # Create a set of keys if it does not already exist
-            kindex[v] = kindex.get(v, set())
-            kindex[v].add(key)
+            self._attribute_index(k).add(v, key)
+
+    def _attribute_index(self, name):
+        kindex = self.indices[name]
+        if not isinstance(kindex, AttributeIndex):
+            # Index created as a plain dict - convert it
+            converted = AttributeIndex()
+            for value, keys in kindex.iteritems():
+                if keys:
+                    converted[value] = set(keys)
+            converted.sorted_values = sorted(converted.keys())
+            kindex = self.indices[name] = converted
+        return kindex
     
 
     def update_index(self, key, index_attributes):
@@ -325,6 +433,12 @@ class IndexStore(object):
         @retVal Returns a bool in a deferred
         """
         return defer.maybeDeferred(self.kvs.has_key, key)
+
+    def multi_has_key(self, keys):
+        """
+        @see IIndexStore.multi_has_key
+        """
+        return defer.succeed(set([key for key in keys if self.kvs.has_key(key)]))
     
     def get_query_attributes(self):
         """
@@ -332,13 +446,27 @@ class IndexStore(object):
         """
         return defer.maybeDeferred(self.indices.keys)
 
+_EMPTY = frozenset()
+
 class Query:
     """
     Class that holds the predicates used to query an IndexStore.
+
+    A query needs at least one EQ or IN predicate. The value of a BETWEEN
+    predicate is a (low, high) tuple, both inclusive; the value of an IN
+    predicate is a tuple of values.
     """
     
     EQ = "EQ"
     GT = "GT"
+    LT = "LT"
+    GTE = "GTE"
+    LTE = "LTE"
+    BETWEEN = "BETWEEN"
+    IN = "IN"
+
+    RANGES = (GT, LT, GTE, LTE, BETWEEN)
+
     def __init__(self):
         self._predicates = []
 
@@ -354,9 +482,59 @@ class Query:
     
     def add_predicate_gt(self, name, value):
         self._predicates.append((name,value,Query.GT))
+
+    def add_predicate_lt(self, name, value):
+        self._predicates.append((name,value,Query.LT))
+
+    def add_predicate_gte(self, name, value):
+        self._predicates.append((name,value,Query.GTE))
+
+    def add_predicate_lte(self, name, value):
+        self._predicates.append((name,value,Query.LTE))
+
+    def add_predicate_between(self, name, low, high):
+        self._predicates.append((name,(low, high),Query.BETWEEN))
+
+    def add_predicate_in(self, name, values):
+        self._predicates.append((name,tuple(values),Query.IN))
         
     def get_predicates(self):
         return self._predicates    
+
+    @staticmethod
+    def range_bounds(value, predicate_type):
+        """
+        @retval keyword arguments for AttributeIndex.value_range of a range predicate
+        """
+        if predicate_type == Query.GT:
+            return {'low':value, 'include_low':False}
+        elif predicate_type == Query.GTE:
+            return {'low':value}
+        elif predicate_type == Query.LT:
+            return {'high':value, 'include_high':False}
+        elif predicate_type == Query.LTE:
+            return {'high':value}
+        elif predicate_type == Query.BETWEEN:
+            return {'low':value[0], 'high':value[1]}
+        raise IndexStoreError('Not a range predicate: %s' % (predicate_type,))
+
+    @staticmethod
+    def range_test(value, predicate_type):
+        """
+        @retval function testing an attribute value against a range predicate
+        """
+        if predicate_type == Query.GT:
+            return lambda x: x > value
+        elif predicate_type == Query.GTE:
+            return lambda x: x >= value
+        elif predicate_type == Query.LT:
+            return lambda x: x < value
+        elif predicate_type == Query.LTE:
+            return lambda x: x <= value
+        elif predicate_type == Query.BETWEEN:
+            low, high = value
+            return lambda x: low <= x <= high
+        raise IndexStoreError('Not a range predicate: %s' % (predicate_type,))
         
     
 
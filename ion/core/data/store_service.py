@@ -140,6 +140,21 @@ class StoreService(ServiceProcess):
         response.value = str(int(key_exists))
         yield self.reply_ok(msg, response)
 
+    @defer.inlineCallbacks
+    def op_multi_has_key(self, request, headers, msg):
+        """
+        @note sees which of the keys exist in the cluster
+        @request is a rows message object with the keys to check
+        @retval return a rows message with a row for each key which exists
+        """
+        keys = [row.key for row in request.rows]
+        found = yield self._store.multi_has_key(keys)
+        response = yield self.message_client.create_instance(ROWS_TYPE)
+        for key in found:
+            r = response.rows.add()
+            r.key = key
+        yield self.reply_ok(msg, response)
+
         
 # Spawn of the process using the module name
 factory = ProcessFactory(StoreService)
@@ -206,4 +221,15 @@ class StoreServiceClient(ServiceClient):
         (result, headers, msg) = yield self.rpc_send('has_key', row)
         ret = bool(int(result.value))
         log.info("%s" % (ret,))
-        defer.returnValue(ret)
\ No newline at end of file
+        defer.returnValue(ret)
+
+    @defer.inlineCallbacks
+    def multi_has_key(self, keys):
+        log.info("Called Store Service client: multi_has_key")
+        request = yield self.mc.create_instance(ROWS_TYPE)
+        for key in keys:
+            row = request.rows.add()
+            row.key = key
+        (result, headers, msg) = yield self.rpc_send('multi_has_key', request)
+        found = set([row.key for row in result.rows])
+        defer.returnValue(found)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/test/fake_cassandra.py
+@brief An in memory Cassandra Thrift server for testing clients and the
+    connection pool without a cluster. Implements the calls used by the
+    Cassandra stores; data is kept per column family, the keyspace is ignored.
+"""
+
+from zope.interface import implements
+
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
+
+from thrift.transport import TTwisted
+from thrift.protocol import TBinaryProtocol
+
+from telephus.cassandra import Cassandra
+from telephus.cassandra.ttypes import NotFoundException, InvalidRequestException
+from telephus.cassandra.ttypes import Column, ColumnOrSuperColumn, KeySlice, KsDef, CfDef, ColumnDef
+from telephus.cassandra.ttypes import IndexType, IndexOperator
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+# Thrift API version of Cassandra 0.7
+API_VERSION = '19.4.0'
+
+
+class FakeCassandraHandler(object):
+    """
+    Implements the Cassandra Thrift interface on dictionaries. Set delay to
+    answer each call after that many seconds.
+    """
+    implements(Cassandra.Iface)
+
+    def __init__(self, indexes=None, delay=0):
+        """
+        @param indexes dict of column family name to the list of indexed column names
+        """
+        self.indexes = indexes or {}
+        self.delay = delay
+        self.rows = {}
+        self.calls = 0
+
+    def _respond(self, func, *args):
+        self.calls += 1
+        if self.delay:
+            return task.deferLater(reactor, self.delay, func, *args)
+        return defer.maybeDeferred(func, *args)
+
+    def _row(self, column_family, key, create=False):
+        cf = self.rows.get(column_family)
+        if cf is None:
+            if not create:
+                return None
+            cf = self.rows[column_family] = {}
+        row = cf.get(key)
+        if row is None and create:
+            row = cf[key] = {}
+        return row
+
+    def login(self, auth_request):
+        return self._respond(lambda: None)
+
+    def set_keyspace(self, keyspace):
+        return self._respond(lambda: None)
+
+    def describe_version(self):
+        return self._respond(lambda: API_VERSION)
+
+    def describe_keyspace(self, keyspace):
+        def describe():
+            cf_defs = []
+            for name in sorted(set(self.rows.keys() + self.indexes.keys())):
+                columns = [ColumnDef(name=column, validation_class='org.apache.cassandra.db.marshal.BytesType',
+                                     index_type=IndexType.KEYS, index_name=column)
+                           for column in self.indexes.get(name, [])]
+                cf_defs.append(CfDef(keyspace=keyspace, name=name, column_metadata=columns))
+            return KsDef(name=keyspace, strategy_class='org.apache.cassandra.locator.SimpleStrategy',
+                         replication_factor=1, cf_defs=cf_defs)
+        return self._respond(describe)
+
+    def get(self, key, column_path, consistency_level):
+        def get():
+            row = self._row(column_path.column_family, key)
+            if row is None or column_path.column not in row:
+                raise NotFoundException()
+            value, timestamp = row[column_path.column]
+            return ColumnOrSuperColumn(column=Column(name=column_path.column, value=value, timestamp=timestamp))
+        return self._respond(get)
+
+    def multiget_slice(self, keys, column_parent, predicate, consistency_level):
+        def multiget_slice():
+            result = {}
+            for key in keys:
+                row = self._row(column_parent.column_family, key) or {}
+                names = predicate.column_names
+                if names is None:
+                    names = sorted(row)
+                result[key] = [ColumnOrSuperColumn(column=Column(name=name, value=row[name][0], timestamp=row[name][1]))
+                               for name in names if name in row]
+            return result
+        return self._respond(multiget_slice)
+
+    def insert(self, key, column_parent, column, consistency_level):
+        def insert():
+            row = self._row(column_parent.column_family, key, create=True)
+            row[column.name] = (column.value, column.timestamp)
+        return self._respond(insert)
+
+    def batch_mutate(self, mutation_map, consistency_level):
+        def mutate():
+            for key, cf_map in mutation_map.iteritems():
+                for column_family, mutations in cf_map.iteritems():
+                    row = self._row(column_family, key, create=True)
+                    for mutation in mutations:
+                        if mutation.column_or_supercolumn is not None:
+                            column = mutation.column_or_supercolumn.column
+                            row[column.name] = (column.value, column.timestamp)
+                        elif mutation.deletion is not None:
+                            predicate = mutation.deletion.predicate
+                            if predicate is None or predicate.column_names is None:
+                                row.clear()
+                            else:
+                                for name in predicate.column_names:
+                                    row.pop(name, None)
+                    if not row:
+                        del self.rows[column_family][key]
+        return self._respond(mutate)
+
+    def remove(self, key, column_path, timestamp, consistency_level):
+        def remove():
+            row = self._row(column_path.column_family, key)
+            if row is None:
+                return
+            if column_path.column is None:
+                row.clear()
+            else:
+                row.pop(column_path.column, None)
+            if not row:
+                del self.rows[column_path.column_family][key]
+        return self._respond(remove)
+
+    def get_indexed_slices(self, column_parent, index_clause, column_predicate, consistency_level):
+        def get_indexed_slices():
+            indexed = self.indexes.get(column_parent.column_family, [])
+            for expression in index_clause.expressions:
+                if expression.column_name not in indexed:
+                    raise InvalidRequestException(why='No indexed column %s' % expression.column_name)
+
+            tests = {IndexOperator.EQ:lambda a, b: a == b,
+                     IndexOperator.GT:lambda a, b: a > b,
+                     IndexOperator.GTE:lambda a, b: a >= b,
+                     IndexOperator.LT:lambda a, b: a < b,
+                     IndexOperator.LTE:lambda a, b: a <= b}
+
+            result = []
+            cf = self.rows.get(column_parent.column_family, {})
+            for key in sorted(cf):
+                if len(result) >= index_clause.count:
+                    break
+                row = cf[key]
+                match = True
+                for expression in index_clause.expressions:
+                    column = row.get(expression.column_name)
+                    if column is None or not tests[expression.op](column[0], expression.value):
+                        match = False
+                        break
+                if match:
+                    columns = [ColumnOrSuperColumn(column=Column(name=name, value=value, timestamp=timestamp))
+                               for name, (value, timestamp) in sorted(row.items())]
+                    result.append(KeySlice(key=key, columns=columns))
+            return result
+        return self._respond(get_indexed_slices)
+
+
+class _FakeServerFactory(TTwisted.ThriftServerFactory):
+    """
+    Keeps track of the open connections so the server can drop them
+    """
+
+    def __init__(self, processor, iprot_factory):
+        TTwisted.ThriftServerFactory.__init__(self, processor, iprot_factory)
+        self.connections = []
+
+    def buildProtocol(self, addr):
+        proto = TTwisted.ThriftServerFactory.buildProtocol(self, addr)
+        self.connections.append(proto)
+        return proto
+
+
+class FakeCassandraServer(object):
+    """
+    Serves a FakeCassandraHandler on a local port. Stopping the server drops
+    its client connections, like a crashed node; starting it again listens on
+    the same port.
+    """
+
+    def __init__(self, handler=None, port=0):
+        self.handler = handler or FakeCassandraHandler()
+        self.port = port
+        self.factory = None
+        self.listener = None
+
+    def start(self):
+        self.factory = _FakeServerFactory(Cassandra.Processor(self.handler),
+                                          TBinaryProtocol.TBinaryProtocolFactory())
+        self.listener = reactor.listenTCP(self.port, self.factory, interface='127.0.0.1')
+        self.port = self.listener.getHost().port
+        log.debug('Fake cassandra listening on port %d', self.port)
+        return self.port
+
+    def drop_connections(self):
+        for proto in self.factory.connections:
+            if proto.transport is not None:
+                proto.transport.loseConnection()
+        self.factory.connections = []
+
+    def stop(self):
+        self.drop_connections()
+        d = defer.maybeDeferred(self.listener.stopListening)
+        self.listener = None
+        return d
+
+    def get_host(self):
+        return ('127.0.0.1', self.port)
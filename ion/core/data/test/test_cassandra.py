@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+"""
+@file ion/core/data/test/test_cassandra.py
+@test Cassandra connection pool and stores against the fake Thrift server
+"""
+
+import time
+
+from twisted.trial import unittest
+from twisted.internet import defer
+
+from telephus.client import CassandraClient
+from telephus.cassandra.ttypes import NotFoundException
+
+import ion.util.procutils as pu
+from ion.core.data.cassandra import CassandraConnectionPool, CassandraPoolError, schema_changed
+from ion.core.data.cassandra_bootstrap import CassandraStoreBootstrap, CassandraIndexedStoreBootstrap, get_storage_hosts
+from ion.core.data.store import IndexStoreError
+from ion.core.data.test.fake_cassandra import FakeCassandraServer, FakeCassandraHandler
+
+
+class CassandraPoolTest(unittest.TestCase):
+
+    timeout = 60
+
+    def setUp(self):
+        self.servers = []
+        self.pools = []
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        for pool in self.pools:
+            pool.shutdown()
+        for server in self.servers:
+            if server.listener is not None:
+                yield server.stop()
+        # Let the connections close
+        yield pu.asleep(0.1)
+
+    def _start_servers(self, count, handler=None):
+        # Servers share the handler - a cluster with full replication
+        handler = handler or FakeCassandraHandler()
+        for i in range(count):
+            server = FakeCassandraServer(handler)
+            server.start()
+            self.servers.append(server)
+        return handler
+
+    def _connect_pool(self, **kwargs):
+        kwargs.setdefault('health_check_interval', 0.2)
+        kwargs.setdefault('request_timeout', 2)
+        pool = CassandraConnectionPool([server.get_host() for server in self.servers], keyspace='ks', **kwargs)
+        self.pools.append(pool)
+        pool.connect()
+        return pool
+
+    @defer.inlineCallbacks
+    def _wait_for(self, condition, timeout=15):
+        start = time.time()
+        while not condition():
+            if time.time() - start > timeout:
+                self.fail('Condition not met within %s seconds' % timeout)
+            yield pu.asleep(0.05)
+
+    @defer.inlineCallbacks
+    def test_least_outstanding(self):
+        handler = self._start_servers(1)
+        pool = self._connect_pool(connections_per_host=4)
+        yield self._wait_for(lambda: len(pool.available()) == 4)
+
+        client = CassandraClient(pool)
+        yield client.batch_insert('key', 'blobs', {'value':'data'})
+
+        handler.delay = 0.05
+        for member in pool.members:
+            member.requests = 0
+        results = yield defer.gatherResults([client.get('key', 'blobs', column='value') for i in range(40)])
+
+        self.assertEqual([r.column.value for r in results], ['data'] * 40)
+        # All requests were outstanding at once - they spread evenly
+        self.assertEqual([member.requests for member in pool.members], [10] * 4)
+        self.assertEqual([member.outstanding for member in pool.members], [0] * 4)
+
+    @defer.inlineCallbacks
+    def test_application_error(self):
+        handler = self._start_servers(2)
+        pool = self._connect_pool()
+        yield self._wait_for(lambda: len(pool.available()) == 2)
+
+        calls = handler.calls
+        client = CassandraClient(pool)
+        yield self.failUnlessFailure(client.get('missing', 'blobs', column='value'), NotFoundException)
+
+        # Not retried and not counted against the member
+        self.assertEqual(handler.calls, calls + 1)
+        self.assertEqual(len(pool.available()), 2)
+
+    @defer.inlineCallbacks
+    def test_failover(self):
+        self._start_servers(2)
+        pool = self._connect_pool(connections_per_host=2)
+        yield self._wait_for(lambda: len(pool.available()) == 4)
+
+        client = CassandraClient(pool)
+        yield client.batch_insert('key', 'blobs', {'value':'data'})
+
+        failed_server = self.servers[0]
+        failed_host = '%s:%s' % failed_server.get_host()
+        yield failed_server.stop()
+
+        results = yield defer.gatherResults([client.get('key', 'blobs', column='value') for i in range(20)])
+        self.assertEqual([r.column.value for r in results], ['data'] * 20)
+
+        yield self._wait_for(lambda: len(pool.available()) == 2)
+        for member in pool.available():
+            self.assertNotEqual(str(member), failed_host)
+
+        # The host rejoins once it is back and passed a health check
+        failed_server.start()
+        yield self._wait_for(lambda: len(pool.available()) == 4)
+
+        result = yield client.get('key', 'blobs', column='value')
+        self.assertEqual(result.column.value, 'data')
+
+    @defer.inlineCallbacks
+    def test_no_host_available(self):
+        self._start_servers(1)
+        yield self.servers[0].stop()
+
+        pool = self._connect_pool(request_timeout=0.5)
+        client = CassandraClient(pool)
+        yield self.failUnlessFailure(client.get('key', 'blobs', column='value'), CassandraPoolError)
+
+    @defer.inlineCallbacks
+    def test_store(self):
+        self._start_servers(2)
+        storage_provider = {'host':'127.0.0.1', 'port':self.servers[0].port,
+                            'hosts':['127.0.0.1:%d' % self.servers[1].port]}
+        self.assertEqual(get_storage_hosts(storage_provider), [server.get_host() for server in self.servers])
+
+        store = CassandraStoreBootstrap(None, None, storage_provider, 'ks', 'blobs')
+        yield store.initialize()
+        yield store.activate()
+        try:
+            yield store.put('key', 'value')
+            value = yield store.get('key')
+            self.assertEqual(value, 'value')
+
+            has_key = yield store.has_key('key')
+            self.failUnless(has_key)
+
+            found = yield store.multi_has_key(['key', 'missing'])
+            self.assertEqual(found, set(['key']))
+
+            yield store.remove('key')
+            value = yield store.get('key')
+            self.assertEqual(value, None)
+        finally:
+            yield store.terminate()
+
+    @defer.inlineCallbacks
+    def test_indexed_store_schema_cache(self):
+        handler = self._start_servers(1, FakeCassandraHandler(indexes={'commits':['repository_key', 'branch_name']}))
+        storage_provider = {'host':'127.0.0.1', 'port':self.servers[0].port}
+
+        # No periodic schema reloads or health checks to count
+        store = CassandraIndexedStoreBootstrap(None, None, storage_provider, 'ks', 'commits',
+                                               schema_refresh_interval=0, health_check_interval=600)
+        yield store.initialize()
+        yield store.activate()
+        try:
+            # Loaded on activation
+            yield self._wait_for(lambda: store._query_attribute_names is not None)
+            attributes = yield store.get_query_attributes()
+            self.assertEqual(sorted(attributes), ['branch_name', 'repository_key'])
+
+            # Puts validate in memory: one call each to the server
+            calls = handler.calls
+            for i in range(10):
+                yield store.put('key%d' % i, 'value', {'repository_key':'repo', 'branch_name':'master'})
+            self.assertEqual(handler.calls, calls + 10)
+
+            # Unknown attributes reload the schema once before failing
+            calls = handler.calls
+            yield self.failUnlessFailure(store.put('key', 'value', {'keyword':'x'}), IndexStoreError)
+            self.assertEqual(handler.calls, calls + 1)
+            yield self.failUnlessFailure(store.put('key', 'value', {'branch_name':5}), IndexStoreError)
+
+            # Altering the column family refreshes active stores
+            handler.indexes['commits'].append('keyword')
+            yield schema_changed('ks', 'commits')
+            self.failUnless('keyword' in store._query_attribute_names)
+
+            calls = handler.calls
+            yield store.put('key', 'value', {'keyword':'x'})
+            self.assertEqual(handler.calls, calls + 1)
+        finally:
+            yield store.terminate()
@@ -21,6 +21,8 @@ from ion.test.iontest import IonTestCase
 from ion.core.data import store
 from ion.core.data import index_store_service
 from ion.core.data import store_service
+from ion.core.data import sqlite_store
+from ion.core.data import compressed_store
 
 from ion.core.object import object_utils
 from ion.core.data.store import Query
@@ -120,6 +122,19 @@ class IStoreTest(unittest.TestCase):
         has_key = yield self.ds.has_key(self.key)
         self.failUnlessEqual(has_key, False)
 
+    @defer.inlineCallbacks
+    def test_multi_has_key(self):
+        keys = [object_utils.sha1bin(str(uuid4())) for i in range(5)]
+        for key in keys[:3]:
+            yield self.ds.put(key, self.value)
+        yield self.ds.remove(keys[2])
+
+        found = yield self.ds.multi_has_key(keys)
+        self.failUnlessEqual(found, set(keys[:2]))
+
+        found = yield self.ds.multi_has_key([])
+        self.failUnlessEqual(found, set())
+
 
 class StoreServiceTest(IStoreTest, IonTestCase):
 
@@ -152,6 +167,81 @@ class StoreServiceTest(IStoreTest, IonTestCase):
 
 
 
+class SqliteStoreTest(IStoreTest):
+
+    @defer.inlineCallbacks
+    def _setup_backend(self):
+        ds = sqlite_store.SqliteStore(database=self.mktemp())
+        yield ds.initialize()
+        yield ds.activate()
+        defer.returnValue(ds)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        IStoreTest.tearDown(self)
+        yield self.ds.terminate()
+
+    @defer.inlineCallbacks
+    def test_batched_writes(self):
+        # Written in one transaction, read back before and after it commits
+        keys = ['key%d' % i for i in range(10)]
+        d = defer.DeferredList([self.ds.put(key, self.value + key) for key in keys], fireOnOneErrback=True)
+        value = yield self.ds.get(keys[0])
+        self.assertEqual(value, self.value + keys[0])
+        yield d
+
+        yield self.ds.remove(keys[1])
+        values = yield defer.gatherResults([self.ds.get(key) for key in keys])
+        self.assertEqual(values, [self.value + keys[0], None] + [self.value + key for key in keys[2:]])
+
+    @defer.inlineCallbacks
+    def test_persistent(self):
+        yield self.ds.put(self.key, self.value)
+        yield self.ds.terminate()
+
+        self.ds = sqlite_store.SqliteStore(database=self.ds.database)
+        yield self.ds.initialize()
+        yield self.ds.activate()
+        value = yield self.ds.get(self.key)
+        self.assertEqual(value, self.value)
+
+
+
+class CompressedStoreTest(IStoreTest):
+
+    def _setup_backend(self):
+        return defer.succeed(compressed_store.CompressedStore(store.Store(), threshold=64))
+
+    @defer.inlineCallbacks
+    def test_compressed(self):
+        value = 'float32 array ' * 100
+        yield self.ds.put(self.key, value)
+
+        stored = store.Store.kvs[self.key]
+        self.failUnless(stored.startswith(compressed_store.HEADER))
+        self.failUnless(len(stored) < len(value) / 10)
+
+        rc = yield self.ds.get(self.key)
+        self.assertEqual(rc, value)
+        self.assertEqual(self.ds.stats['compressed'], 1)
+
+    @defer.inlineCallbacks
+    def test_uncompressed_coexist(self):
+        # Written before compression was enabled, too short or leading zero byte
+        values = {'raw':'float32 array ' * 100, 'short':'value', 'zero':'\x00' + 'x' * 10}
+        yield self.ds.backend.put('raw', values['raw'])
+        yield self.ds.put('short', values['short'])
+        yield self.ds.put('zero', values['zero'])
+
+        self.assertEqual(store.Store.kvs['short'], values['short'])
+        self.assertEqual(store.Store.kvs['zero'], compressed_store.HEADER + compressed_store.STORED + values['zero'])
+
+        for key, value in values.items():
+            rc = yield self.ds.get(key)
+            self.assertEqual(rc, value)
+
+
+
 
 class IndexStoreTest(IStoreTest):
 
@@ -292,7 +382,43 @@ class IndexStoreTest(IStoreTest):
         for key in self.d3.keys():
             self.assertIn(key, rows['htayler'])
 
+    # Tests the range predicates with state == UT
+    @defer.inlineCallbacks
+    def test_query_ranges(self):
+
+        for predicate, value, expected in (('lt', '1975', ['htayler']),
+                                           ('lte', '1975', ['bsanderson', 'htayler']),
+                                           ('gte', '1975', ['bsanderson']),
+                                           ('gte', '1976', [])):
+            query = Query()
+            getattr(query, 'add_predicate_' + predicate)('birth_date', value)
+            query.add_predicate_eq('state','UT')
+            rows = yield self.ds.query(query)
+            self.assertEqual(sorted(rows.keys()), expected, '%s %s' % (predicate, value))
+
+        query = Query()
+        query.add_predicate_between('birth_date', '1968', '1974')
+        query.add_predicate_eq('state','UT')
+        rows = yield self.ds.query(query)
+        self.assertEqual(rows.keys(), ['htayler'])
+        self.assertEqual(rows['htayler']['value'], self.binary_value3)
+
+    # Tests the in predicate, alone and with others
+    @defer.inlineCallbacks
+    def test_query_in(self):
 
+        query = Query()
+        query.add_predicate_in('state', ['WI', 'CA'])
+        rows = yield self.ds.query(query)
+        self.assertEqual(rows.keys(), ['prothfuss'])
+        self.assertEqual(rows['prothfuss']['value'], self.binary_value2)
+
+        query = Query()
+        query.add_predicate_in('birth_date', ['1968', '1973', '1975'])
+        query.add_predicate_eq('state','UT')
+        query.add_predicate_gt('birth_date','1970')
+        rows = yield self.ds.query(query)
+        self.assertEqual(rows.keys(), ['bsanderson'])
 
 
 
@@ -432,3 +558,36 @@ class IndexStoreServiceTest(IndexStoreTest, IonTestCase):
         yield self._stop_container()
 
 
+
+
+class SqliteIndexStoreTest(IndexStoreTest):
+
+    @defer.inlineCallbacks
+    def _setup_backend(self):
+        ds = sqlite_store.SqliteIndexStore(database=self.mktemp(), indices=self.columns)
+        yield ds.initialize()
+        yield ds.activate()
+        defer.returnValue(ds)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        IndexStoreTest.tearDown(self)
+        yield self.ds.terminate()
+
+    @defer.inlineCallbacks
+    def test_persistent_indices(self):
+        yield self.ds.terminate()
+
+        # Reopened with an additional indexed attribute
+        self.ds = sqlite_store.SqliteIndexStore(database=self.ds.database, indices=self.columns + ['nickname'])
+        yield self.ds.initialize()
+        yield self.ds.activate()
+
+        yield self.ds.update_index('htayler', {'nickname':'Schlock'})
+        query = Query()
+        query.add_predicate_eq('nickname', 'Schlock')
+        query.add_predicate_lte('birth_date', '1970')
+        rows = yield self.ds.query(query)
+        self.assertEqual(rows.keys(), ['htayler'])
+        self.assertEqual(rows['htayler']['value'], self.binary_value3)
+        self.assertEqual(rows['htayler']['state'], 'UT')
@@ -6,6 +6,7 @@
 @brief Process Manager for capability container
 """
 
+import time
 import types
 
 from twisted.internet import defer
@@ -21,6 +22,7 @@ from ion.core.process import process
 from ion.core.process.cprocess import ContainerProcess, IContainerProcess, Invocation
 from ion.util.state_object import BasicLifecycleObject
 import ion.util.procutils as pu
+from ion.util import metrics
 
 class InterceptorSystem(Interceptor):
     """
@@ -76,10 +78,13 @@ class InterceptorSystem(Interceptor):
         path = self.paths.get(pathname, None)
         if not path:
             raise RuntimeError("Path %s unknown" % invocation.path)
+        timed = metrics.registry.enabled
         for path_element in path:
             invocation.path = pathname
             intc = path_element['interceptor_instance']
             #log.debug("Process path %s step %s" % (invocation.path, path_element['name']))
+            if timed:
+                start = time.time()
             try:
                 invocation = yield defer.maybeDeferred(intc.process, invocation)
             except Exception, ex:
@@ -87,6 +92,8 @@ class InterceptorSystem(Interceptor):
                     invocation.path, path_element['name']))
                 invocation.error(str(ex))
                 raise ex
+            if timed:
+                metrics.registry.record('interceptor.%s.%s' % (pathname, path_element['name']), time.time() - start)
 
             # Continuation
             if invocation.status == Invocation.STATUS_DROP:
@@ -120,6 +120,13 @@ def set_log_levels(levelfilekey=None):
         for level in levellist:
             logging.getLogger(level[0]).setLevel(level[1])
 
+        # IonLogger instances cache their effective level. On import through
+        # ion.util.ionlog the module is not complete yet and has none cached.
+        import sys
+        log_levels_changed = getattr(sys.modules.get('ion.util.ionlog'), 'log_levels_changed', None)
+        if log_levels_changed is not None:
+            log_levels_changed()
+
 set_log_levels()
 
 #def augment_logging():
@@ -7,13 +7,14 @@
 """
 
 import os
+import time
 import types
 
 from zope.interface import implements, Interface
 from twisted.internet import defer
 
 import ion.util.ionlog
-log = ion.util.ionlog.getLogger(__name__)
+log = ion.util.ionlog.getIonLogger(__name__)
 
 from ion.core import ioninit
 from ion.core.id import Id
@@ -21,6 +22,7 @@ from ion.core.intercept.interceptor import Invocation
 from ion.core.messaging import messaging
 from ion.util.state_object import BasicLifecycleObject
 import ion.util.procutils as pu
+from ion.util import metrics
 from ion.core.object.codec import ION_R1_GPB
 
 from ion.core.exception import IonError
@@ -130,7 +132,7 @@ class Receiver(BasicLifecycleObject):
             raise RuntimeError("Messaging name undefined: "+self.xname)
 
         yield self._init_receiver(name_config)
-        log.debug("Receiver %s initialized (queue attached) cfg=%s" % (self.xname,name_config))
+        log.debug("Receiver %s initialized (queue attached) cfg=%s", self.xname,name_config)
 
     @defer.inlineCallbacks
     def _init_receiver(self, receiver_config, store_config=False):
@@ -154,7 +156,7 @@ class Receiver(BasicLifecycleObject):
         """
         #self.consumer.register_callback(self.receive)
         yield self.consumer.consume(self.receive)
-        log.debug("Receiver %s activated (consumer enabled)" % self.xname)
+        log.debug("Receiver %s activated (consumer enabled)", self.xname)
 
     #@defer.inlineCallbacks
     def on_deactivate(self, *args, **kwargs):
@@ -175,7 +177,7 @@ class Receiver(BasicLifecycleObject):
 
     def on_error(self, cause= None, *args, **kwargs):
         if cause:
-            log.error("Receiver error: %s" % cause)
+            log.error("Receiver error: %s", cause)
             pass
         else:
             raise RuntimeError("Illegal state change")
@@ -217,12 +219,17 @@ class Receiver(BasicLifecycleObject):
         @note is called from carrot as normal method; no return expected
         @param msg instance of carrot.backends.txamqp.Message
         """
-        log.info('Start Receiver.Receive on proc: %s' % str(self.process))
+        log.info('Start Receiver.Receive on proc: %s', self.process)
 
+        start = None
+        if metrics.registry.enabled:
+            start = time.time()
+            metrics.registry.inc('receiver.messages')
 
         if self.rec_shutoff:
+            metrics.registry.inc('receiver.dropped')
             log.warn("MESSAGE RECEIVED AFTER SHUTOFF - DROPPED")
-            log.warn("Dropped message: "+str(msg.payload))
+            log.warn("Dropped message: %s", msg.payload)
             # @todo ACK for now. Should be requeue.
             yield msg.ack()
             return
@@ -247,7 +254,8 @@ class Receiver(BasicLifecycleObject):
 
             # Interceptor failed message.  Call error handler(s)
             if inv1.status != Invocation.STATUS_PROCESS:
-                log.info("Message error! to=%s op=%s" % (data.get('receiver',None), data.get('op',None)))
+                metrics.registry.inc('receiver.rejected')
+                log.info("Message error! to=%s op=%s", data.get('receiver',None), data.get('op',None))
                 try:
                     for error_handler in self.error_handlers:
                         yield defer.maybeDeferred(error_handler, data, msg, inv1.code)
@@ -277,24 +285,24 @@ class Receiver(BasicLifecycleObject):
 
 
                 log.debug( 'BEFORE YIELD to Message Handler')
-                log.debug('OP "%s"' % op)
-                log.debug('CONVID "%s"' %  convid)
-                log.debug('PERFORMATIVE "%s"' % performative)
-                log.debug('PROTOCOL "%s"' % protocol)
-                log.debug('Current Context "%s"' % str(current_context))
+                log.debug('OP "%s"', op)
+                log.debug('CONVID "%s"', convid)
+                log.debug('PERFORMATIVE "%s"', performative)
+                log.debug('PROTOCOL "%s"', protocol)
+                log.debug('Current Context "%s"', current_context)
 
-                log.debug("WORKBENCH STATE before incoming message is added:\n%s" % str(workbench))
+                log.debug("WORKBENCH STATE before incoming message is added:\n%s", workbench)
 
                 if protocol != 'rpc':
                     # if it is not an rpc conversation - set the context
 
-                    log.info('Setting NON RPC request workbench_context: %s, in Proc: %s ' % (convid, self.process))
+                    log.info('Setting NON RPC request workbench_context: %s, in Proc: %s ', convid, self.process)
                     current_context.append( convid)
                     request.workbench_context = current_context
 
                 elif performative == 'request':
                     # if it is an rpc request - set the context
-                    log.info('Setting RPC request workbench_context: %s, in Proc: %s ' % (convid, self.process))
+                    log.info('Setting RPC request workbench_context: %s, in Proc: %s ', convid, self.process)
 
                     current_context.append( convid)
                     request.workbench_context = current_context
@@ -313,7 +321,7 @@ class Receiver(BasicLifecycleObject):
                     content = data.get('content')
                     workbench.put_repository(content.Repository)
 
-                    log.debug("WORKBENCH STATE after incoming message is added:\n%s" % str(workbench))
+                    log.debug("WORKBENCH STATE after incoming message is added:\n%s", workbench)
 
 
                 # Make the calls into the application code (e.g. process receive)
@@ -322,6 +330,8 @@ class Receiver(BasicLifecycleObject):
                         yield defer.maybeDeferred(handler, data, msg)
                 finally:
 
+                    if start is not None:
+                        metrics.registry.record('receiver.receive', time.time() - start)
 
                     if msg._state == "RECEIVED":
                         log.error("Message has not been ACK'ed at the end of processing")
@@ -337,20 +347,20 @@ class Receiver(BasicLifecycleObject):
                     if protocol != 'rpc':
                         # if it is not an rpc conversation - set the context
                         workbench_context = current_context.pop()
-                        log.info('Popping Non RPC request workbench_context: %s, in Proc: %s ' % (workbench_context, self.process))
+                        log.info('Popping Non RPC request workbench_context: %s, in Proc: %s ', workbench_context, self.process)
 
                     elif performative == 'request':
                         # if it is an rpc request - set the context
 
                         workbench_context = current_context.pop()
-                        log.info('Popping RPC request workbench_context: %s, in Proc: %s ' % (workbench_context, self.process))
+                        log.info('Popping RPC request workbench_context: %s, in Proc: %s ', workbench_context, self.process)
 
                         # if it is an RPC result message - do not set the context!
 
                     else:
                         # @TODO - SHOULD THIS BE HERE?
                         workbench_context = pu.get_last_or_default(current_context, 'No Context Set!')
-                        log.info('Using last workbench_context: %s, in Proc: %s ' % (workbench_context, self.process))
+                        log.info('Using last workbench_context: %s, in Proc: %s ', workbench_context, self.process)
                         #print 'CONVID:', convid
                         #print 'CONTEXT:', workbench_context
 
@@ -358,12 +368,12 @@ class Receiver(BasicLifecycleObject):
                     if hasattr(self.process, 'workbench'):
 
                         log.debug('AFTER YIELD to message handler')
-                        log.debug('OP "%s"' % op)
-                        log.debug('CONVID: %s' % convid)
+                        log.debug('OP "%s"', op)
+                        log.debug('CONVID: %s', convid)
                         log.debug('PERFORMATIVE: %s',performative)
-                        log.debug('PROTOCOL "%s"' % protocol)
-                        log.debug('Current CONTXT: %s' % current_context)
-                        log.debug('WORKBENCH CONTXT: %s' % workbench_context)
+                        log.debug('PROTOCOL "%s"', protocol)
+                        log.debug('Current CONTXT: %s', current_context)
+                        log.debug('WORKBENCH CONTXT: %s', workbench_context)
 
 
 
@@ -372,32 +382,17 @@ class Receiver(BasicLifecycleObject):
 
                             log.info('Receiver Process: Calling workbench clear:')
 
-                            log.debug("WORKBENCH STATE Before Clear:\n%s" % str(self.process.workbench))
+                            log.debug("WORKBENCH STATE Before Clear:\n%s", self.process.workbench)
 
-                            self.process.workbench.manage_workbench_cache(workbench_context)
+                            # Its repositories are released in a batch with those of other ended conversations
+                            self.process.workbench.end_conversation(workbench_context)
 
-                            nrepos = len(self.process.workbench._repos)
-                            if  nrepos > 0:
-
-                                pname = self.process.proc_name
-
-                                count = 0
-                                for repo in self.process.workbench._repos.itervalues():
-                                    #if repo.convid_context != 'Test runner context!' or repo.persistent is True:
-                                    if repo.persistent is True:
-                                        count +=1
-
-                                if count > 0:
-
-                                    # Print a warning if someone else is using the persistence tricks...
-                                    log.warn('The "%s" process is holding persistent state in %d repository objects!' % (pname, count))
-
-                            log.debug("WORKBENCH STATE After Clear:\n%s" % str(self.process.workbench))
+                            log.debug("WORKBENCH STATE After Clear:\n%s", self.process.workbench)
 
                         else:
                             log.debug('Workbench context does not match the Convid - Do not clear anything from the workbench!')
 
-        log.info( 'End Receiver.Receive on proc: %s' % str(self.process))
+        log.info( 'End Receiver.Receive on proc: %s', self.process)
 
     @defer.inlineCallbacks
     def send(self, **kwargs):
@@ -425,7 +420,7 @@ class Receiver(BasicLifecycleObject):
             # TODO fix this
             # For now, silently dropping message
             if inv1.status == Invocation.STATUS_DROP:
-                log.info("Message dropped! to=%s op=%s" % (msg.get('receiver',None), msg.get('op',None)))
+                log.info("Message dropped! to=%s op=%s", msg.get('receiver',None), msg.get('op',None))
             else:
                 # call flow: Container.send -> ExchangeManager.send -> ProcessExchangeSpace.send
                 yield ioninit.container_instance.send(msg.get('receiver'), msg, publisher_config=self.publisher_config)
@@ -433,9 +428,9 @@ class Receiver(BasicLifecycleObject):
             log.exception("Send error")
         else:
             if inv1.status != Invocation.STATUS_DROP:
-                log.info("===Message SENT! >>>> %s -> %s: %s:%s:%s===" % (msg.get('sender',None),
+                log.info("===Message SENT! >>>> %s -> %s: %s:%s:%s===", msg.get('sender',None),
                                 msg.get('receiver',None), msg.get('protocol',None),
-                                msg.get('performative',None), msg.get('op',None)))
+                                msg.get('performative',None), msg.get('op',None))
                 defer.returnValue(msg)
                 #log.debug("msg"+str(msg))
 
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+
+"""
+@file ion/core/object/blob_cache.py
+@brief The workbench cache of structure elements shared between repositories:
+weak references to the elements in use, backed by a byte bounded LRU which
+keeps recently added ones after the last repository holding them is gone
+"""
+
+import weakref
+
+import ion.util.ionlog
+
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.util.cache import LRUDict
+
+# Bytes of structure element values kept by default
+BLOB_CACHE_SIZE = 10**7
+
+
+def _element_size(element):
+    return len(element.value)
+
+
+class BlobCache(weakref.WeakValueDictionary):
+    """
+    @brief A WeakValueDictionary of structure elements by key. Each element
+    added is also held in an LRU bounded by the size in bytes of the element
+    values, which keeps it, and its child links, alive once no repository
+    holds it. Set size to 0 for only the weak references.
+
+    Counts the lookups of elements the LRU holds, the keys found in neither
+    and the elements the LRU evicted.
+    """
+
+    def __init__(self, size=BLOB_CACHE_SIZE):
+        weakref.WeakValueDictionary.__init__(self)
+
+        self.size = size
+        self._blobs = None
+        if size:
+            self._blobs = LRUDict(size, use_size=True, sizeof=_element_size)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getitem__(self, key):
+        try:
+            element = weakref.WeakValueDictionary.__getitem__(self, key)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        if self._blobs is not None and key in self._blobs.d:
+            self.hits += 1
+        return element
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, element):
+        weakref.WeakValueDictionary.__setitem__(self, key, element)
+        blobs = self._blobs
+        if blobs is not None and key not in blobs.d and len(element.value) <= self.size:
+            # Larger elements would push everything else out
+            count = len(blobs.d)
+            blobs[key] = element
+            self.evictions += count + 1 - len(blobs.d)
+
+    def update(self, *args, **kwargs):
+        for key, element in dict(*args, **kwargs).iteritems():
+            self[key] = element
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def pop(self, key, *args):
+        # Take the element before the LRU lets it go
+        element = weakref.WeakValueDictionary.pop(self, key, *args)
+        blobs = self._blobs
+        if blobs is not None and key in blobs.d:
+            del blobs[key]
+        return element
+
+    def clear(self):
+        weakref.WeakValueDictionary.clear(self)
+        if self._blobs is not None:
+            self._blobs = LRUDict(self.size, use_size=True, sizeof=_element_size)
+
+    def stats(self):
+        """
+        @retval dictionary of the lookups served by the LRU, the misses, the evictions and its content
+        """
+        blobs = self._blobs
+        return {'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'blobs':blobs is not None and len(blobs.d) or 0,
+                'bytes':blobs is not None and blobs.total_size or 0,
+                'size':self.size,
+                }
@@ -44,14 +44,7 @@ class ObjectCodecInterceptor(EnvelopeInterceptor):
         # Only mess with ION_R1_GPB encoded objects...
         if isinstance(invocation.content, dict) and ION_R1_GPB == invocation.content['encoding']:
             raw_content = invocation.content['content']
-            unpacked_content = unpack_structure(raw_content)
-                
-            if hasattr(unpacked_content, 'ObjectType') and unpacked_content.ObjectType == ION_MESSAGE_TYPE:
-                # If this content should be returned in a Message Instance
-                unpacked_content = message_client.MessageInstance(unpacked_content.Repository)
-
-            
-            invocation.content['content'] = unpacked_content
+            invocation.content['content'] = unpack_message_content(raw_content)
 
         return invocation
 
@@ -65,20 +58,42 @@ class ObjectCodecInterceptor(EnvelopeInterceptor):
           
         if isinstance(content, (message_client.MessageInstance, gpb_wrapper.Wrapper)):
 
-            # Turn of access to shared process object Cache
-            content.Repository.index_hash.has_cache = False
-
-            invocation.message['content'] = pack_structure(content)
+            invocation.message['content'] = pack_message_content(content)
         
             invocation.message['encoding'] = ION_R1_GPB
 
-            # Turn it back on.
-            content.Repository.index_hash.has_cache = True
-
 
         return invocation
 
 
+def pack_message_content(content):
+    """
+    Serialize a Message Instance or a gpb_wrapper for sending. Access to the shared process object cache is turned
+    off while packing so that only objects in the content's repository are sent.
+    """
+    # Turn of access to shared process object Cache
+    content.Repository.index_hash.has_cache = False
+    try:
+        serialized = pack_structure(content)
+    finally:
+        # Turn it back on.
+        content.Repository.index_hash.has_cache = True
+
+    return serialized
+
+def unpack_message_content(serialized_container):
+    """
+    Decode serialized message content. If the root object is an ION Message it is returned in a Message Instance.
+    """
+    unpacked_content = unpack_structure(serialized_container)
+
+    if hasattr(unpacked_content, 'ObjectType') and unpacked_content.ObjectType == ION_MESSAGE_TYPE:
+        # If this content should be returned in a Message Instance
+        unpacked_content = message_client.MessageInstance(unpacked_content.Repository)
+
+    return unpacked_content
+
+
 
 def pack_structure(content):
     """
@@ -252,4 +267,92 @@ def _unpack_container(serialized_container):
 
     log.debug('_unpack_container: returning head and dictionary of %d objects' % len(obj_dict))
 
-    return head, obj_dict
\ No newline at end of file
+    return head, obj_dict
+
+def _read_varint(stream):
+    """
+    Read a protocol buffer varint from the stream
+    Returns None at the end of the stream
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            if shift == 0:
+                return None
+            raise CodecError('Could not decode message content - truncated varint!')
+
+        byte = ord(byte)
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result
+        shift += 7
+
+
+def _read_bytes(stream, length):
+    """
+    Read exactly length bytes from the stream
+    """
+    data = stream.read(length)
+    if len(data) != length:
+        raise CodecError('Could not decode message content - truncated field!')
+    return data
+
+
+def _iter_container(stream):
+    """
+    Helper for unpacking a serialized container from a file like object one
+    structure element at a time, so that neither the serialized container nor
+    the parsed container is ever held in memory at once.
+    Yields (is_head, wrapped structure element) in the order they are stored.
+    """
+    log.debug('_iter_container: Unpacking Container from stream')
+    container_class = object_utils.get_gpb_class_from_type_id(STRUCTURE_TYPE)
+    element_class = object_utils.get_gpb_class_from_type_id(STRUCTURE_ELEMENT_TYPE)
+
+    fields = container_class.DESCRIPTOR.fields_by_name
+    head_number = fields['head'].number
+    items_number = fields['items'].number
+
+    count = 0
+    while True:
+        tag = _read_varint(stream)
+        if tag is None:
+            break
+
+        number = tag >> 3
+        wire_type = tag & 0x7
+
+        if wire_type == 0:
+            if _read_varint(stream) is None:
+                raise CodecError('Could not decode message content - truncated field!')
+            continue
+        elif wire_type == 1:
+            _read_bytes(stream, 8)
+            continue
+        elif wire_type == 5:
+            _read_bytes(stream, 4)
+            continue
+        elif wire_type != 2:
+            raise CodecError('Could not decode message content - unexpected wire type %d!' % wire_type)
+
+        length = _read_varint(stream)
+        if length is None:
+            raise CodecError('Could not decode message content - truncated field!')
+        data = _read_bytes(stream, length)
+
+        if number != head_number and number != items_number:
+            continue
+
+        se = element_class()
+        try:
+            se.ParseFromString(data)
+        except decoder._DecodeError, de:
+            log.debug('Received invalid content - decode error: "%s"' % str(de))
+            raise CodecError('Could not decode message content as a GPB structure element!')
+
+        count += 1
+        yield number == head_number, gpb_wrapper.StructureElement(se)
+
+    log.debug('_iter_container: unpacked %d objects' % count)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+
+"""
+@file ion/core/object/commit_graph.py
+@brief Index of the commit history of a repository: parent keys, dates and
+generation numbers by commit key, the commit keys sorted by date, and the
+ancestry and merge base queries answered from them
+"""
+
+import bisect
+import heapq
+
+import ion.util.ionlog
+
+log = ion.util.ionlog.getLogger(__name__)
+
+from ion.util.cache import LRUDict
+
+# (ancestor, descendant) pairs whose reachability is remembered
+REACHABILITY_CACHE = 10000
+
+# Merge base search marks
+_ONE = 1
+_OTHER = 2
+_STALE = 4
+
+
+class CommitGraphError(Exception):
+    """
+    Error class for the commit graph
+    """
+
+
+class CommitGraph(object):
+    """
+    @brief The commits of a repository keyed by their key. A commit is added
+    after its parents, so each one has a generation number: one more than the
+    largest generation of its parents, 1 for a commit without parents. A commit
+    never has a larger generation than its descendants, which bounds the
+    search for ancestors. The history of a commit never changes, so answers
+    to ancestry queries are cached for the life of the graph.
+    """
+
+    def __init__(self):
+        self._parents = {}
+        self._dates = {}
+        self._generations = {}
+
+        # Sorted parallel lists of commit dates and keys - rebuilt when a commit was added since
+        self._sorted_dates = []
+        self._sorted_keys = []
+        self._sorted = True
+
+        self._reachable = LRUDict(REACHABILITY_CACHE)
+
+    def __len__(self):
+        return len(self._parents)
+
+    def __contains__(self, key):
+        return key in self._parents
+
+    def clear(self):
+        self._parents.clear()
+        self._dates.clear()
+        self._generations.clear()
+        self._sorted_dates = []
+        self._sorted_keys = []
+        self._sorted = True
+        self._reachable = LRUDict(REACHABILITY_CACHE)
+
+    def add(self, key, date, parent_keys):
+        """
+        Add a commit whose parents are all in the graph already
+        """
+        if key in self._parents:
+            return
+
+        generation = 0
+        for parent_key in parent_keys:
+            parent_generation = self._generations.get(parent_key)
+            if parent_generation is None:
+                raise CommitGraphError('Can not add a commit before its parent commits!')
+            generation = max(generation, parent_generation)
+
+        self._parents[key] = tuple(parent_keys)
+        self._dates[key] = date
+        self._generations[key] = generation + 1
+        self._sorted = False
+
+    def parents(self, key):
+        return self._parents[key]
+
+    def date(self, key):
+        return self._dates[key]
+
+    def generation(self, key):
+        return self._generations[key]
+
+    def older_than(self, date):
+        """
+        @retval iterator over the keys of the commits made at or before date, newest first
+        """
+        if not self._sorted:
+            items = sorted(self._dates.iteritems(), key=lambda item: item[1])
+            self._sorted_keys = [key for key, commit_date in items]
+            self._sorted_dates = [commit_date for key, commit_date in items]
+            self._sorted = True
+
+        keys = self._sorted_keys
+        for index in xrange(bisect.bisect_right(self._sorted_dates, date) - 1, -1, -1):
+            yield keys[index]
+
+    def is_ancestor(self, ancestor, descendant):
+        """
+        @retval True if ancestor is descendant or one of its ancestors
+        """
+        if ancestor == descendant:
+            return True
+
+        result = self._reachable.get((ancestor, descendant))
+        if result is None:
+            result = self._reach(ancestor, descendant)
+            self._reachable[(ancestor, descendant)] = result
+        return result
+
+    def _reach(self, ancestor, descendant):
+
+        generation = self._generations[ancestor]
+        generations = self._generations
+        reachable = self._reachable
+        touched = set([descendant])
+        keys = [descendant]
+        while keys:
+            key = keys.pop()
+            for parent_key in self._parents[key]:
+                if parent_key == ancestor:
+                    return True
+
+                # Commits of the same or a lower generation can not descend from ancestor
+                if parent_key in touched or generations[parent_key] <= generation:
+                    continue
+                touched.add(parent_key)
+
+                known = reachable.get((ancestor, parent_key))
+                if known:
+                    return True
+                elif known is None:
+                    keys.append(parent_key)
+
+        return False
+
+    def merge_bases(self, one, other):
+        """
+        @retval the keys of the best common ancestors of two commits: common
+        ancestors which are not an ancestor of another common ancestor. Usually
+        there is one, criss cross merges can make more. Highest generation first.
+        """
+        if self.is_ancestor(one, other):
+            return [one]
+        if self.is_ancestor(other, one):
+            return [other]
+
+        generations = self._generations
+        marks = {one:_ONE, other:_OTHER}
+        queue = [(-generations[one], one), (-generations[other], other)]
+        heapq.heapify(queue)
+
+        # Commits in the queue which are not stale - the search ends when there are none
+        active = 2
+        bases = []
+        while active > 0:
+            neg_generation, key = heapq.heappop(queue)
+            mark = marks[key]
+
+            # All descendants of key come first - its mark is final
+            if not mark & _STALE:
+                active -= 1
+                if mark & (_ONE | _OTHER) == _ONE | _OTHER:
+                    bases.append(key)
+                    # Its ancestors are common ancestors too, but not the best ones
+                    mark |= _STALE
+
+            for parent_key in self._parents[key]:
+                parent_mark = marks.get(parent_key, 0)
+                new_mark = parent_mark | mark
+                if new_mark == parent_mark:
+                    continue
+                marks[parent_key] = new_mark
+
+                if parent_mark == 0:
+                    heapq.heappush(queue, (-generations[parent_key], parent_key))
+                    if not new_mark & _STALE:
+                        active += 1
+                elif new_mark & _STALE and not parent_mark & _STALE:
+                    active -= 1
+
+        return bases
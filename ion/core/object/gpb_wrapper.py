@@ -19,6 +19,13 @@ from ion.core.object.object_utils import CDM_GROUP_TYPE, CDM_DATASET_TYPE, CDM_A
 from ion.core.object.object_utils import _gpb_source, _gpb_source_root
 
 import struct
+import array
+
+# NumPy is optional - only needed to export repeated scalars as NumPy arrays
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from google.protobuf import message
 from google.protobuf.internal import containers
@@ -34,6 +41,7 @@ import ion.util.ionlog
 from ion.core import ioninit
 
 CONF = ioninit.config(__name__)
+CF_STR_GPBS = CONF.getValue('STR_GPBS', False)
 log = ion.util.ionlog.getLogger(__name__)
 
 STRUCTURE_ELEMENT_TYPE = create_type_identifier(object_id=1, version=1)
@@ -184,15 +192,16 @@ class WrappedMessageProperty(WrappedProperty):
     """ Data descriptor (like a property) for passing through GPB properties of Type Message from the Wrapper. """
 
     def __get__(self, wrapper, objtype=None):
-        if wrapper.Invalid:
+        source = wrapper._source
+        if source._invalid:
             log.error(wrapper.Debug())
             raise OOIObjectError('Can not get message (composite) property - %s - in a wrapper which is invalidated.' % self.name)
             # This may be the result we were looking for, in the case of a simple scalar field
-        field = getattr(wrapper.GPBMessage, self.name)
-        result = wrapper._rewrap(field)
+        field = getattr(_source_message(source), self.name)
+        result = source._rewrap(field)
 
-        if result.ObjectType == LINK_TYPE:
-            result = wrapper.Repository.get_linked_object(result)
+        if result._gpb_type == LINK_TYPE:
+            result = source._root._repository.get_linked_object(result)
 
         return result
 
@@ -228,11 +237,12 @@ class WrappedRepeatedScalarProperty(WrappedProperty):
     """ Data descriptor (like a property) for passing through GPB properties of Type Repeated Scalar from the Wrapper. """
 
     def __get__(self, wrapper, objtype=None):
-        if wrapper.Invalid:
+        source = wrapper._source
+        if source._invalid:
             log.error(wrapper.Debug())
             raise OOIObjectError('Can not get repeated scalar property - %s - in a wrapper which is invalidated.'% self.name)
             # This may be the result we were looking for, in the case of a simple scalar field
-        field = getattr(wrapper.GPBMessage, self.name)
+        field = getattr(_source_message(source), self.name)
 
         return ScalarContainerWrapper.factory(wrapper, field)
 
@@ -247,12 +257,13 @@ class WrappedRepeatedCompositeProperty(WrappedProperty):
     """ Data descriptor (like a property) for passing through GPB properties of Type Repeated Composite from the Wrapper. """
 
     def __get__(self, wrapper, objtype=None):
-        if wrapper.Invalid:
+        source = wrapper._source
+        if source._invalid:
             log.error(wrapper.Debug())
             raise OOIObjectError('Can not "get" from a repeated composite property - %s - in a wrapper which is invalidated.' % self.name)
 
         # This may be the result we were looking for, in the case of a simple scalar field
-        field = getattr(wrapper.GPBMessage, self.name)
+        field = getattr(_source_message(source), self.name)
 
         return ContainerWrapper.factory(wrapper, field)
 
@@ -280,24 +291,28 @@ class WrappedScalarProperty(WrappedProperty):
 
     def __get__(self, wrapper, objtype=None):
         # This may be the result we were looking for, in the case of a simple scalar field
-        if wrapper.Invalid:
+        source = wrapper._source
+        if source._invalid:
             log.error(wrapper.Debug())
             raise OOIObjectError('Can not get scalar property - %s - in a wrapper which is invalidated.' % self.name)
 
-        return getattr(wrapper.GPBMessage, self.name)
+        return getattr(_source_message(source), self.name)
 
     def __set__(self, wrapper, value):
-        if wrapper.Invalid:
+        source = wrapper._source
+        if source._invalid:
             log.error(wrapper.Debug())
             raise OOIObjectError('Can not set scalar property - %s -in a wrapper which is invalidated.' % self.name)
 
-        if wrapper.ReadOnly:
+        root = source._root
+        if root._read_only:
             raise OOIObjectError('This object wrapper is read only!')
 
-        setattr(wrapper.GPBMessage, self.name, value)
+        setattr(_source_message(source), self.name, value)
 
         # Set this object and it parents to be modified
-        wrapper._set_parents_modified()
+        if not root._modified:
+            source._set_parents_modified()
 
         return None
 
@@ -305,6 +320,15 @@ class WrappedScalarProperty(WrappedProperty):
         raise AttributeError('Can not delete a Wrapper property for an ION Object field')
 
 
+def _source_message(source):
+    """
+    The GPB message of a valid source wrapper - the GPBMessage property without the checks the caller made already
+    """
+    if source._bytes is not None:
+        return source.GPBMessage
+    return source._gpbMessage
+
+
 class CommitCounter(object):
     """
     Class used to count the number of recursive calls to commit a data structure
@@ -405,18 +429,8 @@ class WrapperType(type):
             # Special methods for certain object types:
             WrapperType._add_specializations(cls, obj_type, clsDict)
 
-            VALIDATE_ATTRS = CONF.getValue('VALIDATE_ATTRS', True)
-            if VALIDATE_ATTRS:
-                def obj_setter(self, k, v):
-                    if self._init and not hasattr(self, k):
-                        raise AttributeError(\
-                            '''Cant add properties to the ION object wrapper for object Class "%s".\n'''
-                            '''Unknown property name - "%s"; value - "%s"''' % (self._GPBClass, k, v))
-                    super(Wrapper, self).__setattr__(k, v)
-
-                clsDict['__setattr__'] = obj_setter
-
-            clsDict['_init'] = False
+            # No instance dictionary - properties can not be added to the ION object wrapper
+            clsDict['__slots__'] = ()
 
             clsType = WrapperType.__new__(WrapperType, clsName, (cls,), clsDict)
 
@@ -571,6 +585,11 @@ class Wrapper(object):
 
     __metaclass__ = WrapperType
 
+    # Hundreds of thousands of wrappers make up a large dataset - no instance dictionary
+    __slots__ = ('_gpbMessage', '_root', '_invalid', '_bytes', '_parent_links', '_child_links',
+                 '_derived_wrappers', '_myid', '_modified', '_read_only', '_repository', '_source',
+                 '__weakref__')
+
 
     def __init__(self, gpbMessage):
         """
@@ -657,11 +676,6 @@ class Wrapper(object):
         To avoid invalidating during when there is a hash conflict in the workspace - set the twin...
         """
 
-        self.__no_string = CONF.getValue('STR_GPBS', False)
-
-        # Hack to prevent setting properties in a class instance
-        self._init = True
-
         #frame = sys._getframe(2)
         #frames = []
         #for i in range(6):
@@ -1148,11 +1162,19 @@ class Wrapper(object):
     def AddParentLink(self, link):
         #if self.Invalid:
 
-        for parent in self.ParentLinks:
-            if parent.GPBMessage is link.GPBMessage:
-                break
-        else:
-            self.ParentLinks.add(link)
+        parents = self.ParentLinks
+        if link in parents:
+            return
+
+        # A link found in the derived wrappers of its root is the only wrapper
+        # of its message - no need to compare it with every parent
+        message = link.GPBMessage
+        if link._root._derived_wrappers.get(message) is not link:
+            for parent in parents:
+                if parent.GPBMessage is message:
+                    return
+
+        parents.add(link)
 
     @GPBSource
     def _rewrap(self, gpbMessage):
@@ -1163,16 +1185,18 @@ class Wrapper(object):
         '''
 
         # Check the root wrapper objects list of derived wrappers
-        if gpbMessage in self.DerivedWrappers:
-            return self.DerivedWrappers[gpbMessage]
+        root = self._root
+        derived_wrappers = root._derived_wrappers
+        if gpbMessage in derived_wrappers:
+            return derived_wrappers[gpbMessage]
 
         # Else make a new one...
         inst = Wrapper(gpbMessage)
-        inst._root = self.Root
+        inst._root = root
         inst._invalid=False
 
         # Add it to the list of objects which derive from the root wrapper
-        self.DerivedWrappers[gpbMessage] = inst
+        derived_wrappers[gpbMessage] = inst
 
         return inst
 
@@ -1196,7 +1220,8 @@ class Wrapper(object):
             new_id = repo.new_id()
             repo._workspace[new_id] = self.Root
 
-            if repo._workspace.has_key(self.MyId):
+            # A copy loaded from the same element is not the wrapper in the workspace
+            if repo._workspace.get(self.MyId) is self.Root:
                 del repo._workspace[self.MyId]
             self.MyId = new_id
 
@@ -1246,7 +1271,7 @@ class Wrapper(object):
             msg = '\n' +self._gpbMessage.__str__()
         '''
 
-        if not self.__no_string:
+        if not CF_STR_GPBS:
             return 'GPB NO STRING!'
 
         #log.critical('HOLY SHIT STILL HERE!')
@@ -1522,6 +1547,8 @@ class ContainerWrapper(object):
     It is not needed for repeated scalars!
     """
 
+    __slots__ = ('_wrapper', '_gpbcontainer', 'Repository', '_source')
+
     def __init__(self, wrapper, gpbcontainer):
         # Be careful - this is a hard link
         self._wrapper = wrapper
@@ -1681,6 +1708,58 @@ class ContainerWrapper(object):
         self._wrapper._set_parents_modified()
         return self._wrapper._rewrap(new_element)
 
+    @GPBSourceCW
+    def set_all(self, values):
+        """
+        Sets the links of a repeated link field to the given root wrappers, in
+        order. Existing links are reused, links are added or deleted to match
+        the number of values and the wrapper is modified once.
+        """
+
+        if self._wrapper._source._root._read_only:
+            raise OOIObjectError('This object wrapper is read only!')
+
+        values = list(values)
+        for value in values:
+            if not isinstance(value, Wrapper):
+                raise OOIObjectError('To set an item in a repeated field container, the value must be a Wrapper')
+
+        container = self._gpbcontainer
+        rewrap = self._wrapper._rewrap
+
+        # All the items of the field have the same type - check the first one
+        added = not len(container)
+        if added:
+            item = rewrap(container.add())
+        else:
+            item = rewrap(container[0])
+        if item.ObjectType != LINK_TYPE:
+            if added:
+                item._clear_derived_message()
+                del container[0]
+            raise OOIObjectError(
+                'It is illegal to set a value of a repeated composite field unless it is a CASRef - Link')
+
+        while len(container) < len(values):
+            container.add()
+        for index in reversed(xrange(len(values), len(container))):
+            link = rewrap(container[index])
+            if link.key:
+                link._clear_derived_message()
+            del container[index]
+
+        set_linked_object = self.Repository.set_linked_object
+        for index, value in enumerate(values):
+            set_linked_object(rewrap(container[index]), value)
+
+        self._wrapper._set_parents_modified()
+
+    @GPBSourceCW
+    def to_list(self):
+        """Returns the items as a list, with links replaced by the objects they link to."""
+
+        return self.__getslice__(0, len(self))
+
     @GPBSourceCW
     def __getslice__(self, start, stop):
         """Retrieves the subset of items from between the specified indices."""
@@ -1778,6 +1857,8 @@ class ScalarContainerWrapper(object):
     It is not needed for repeated scalars!
     """
 
+    __slots__ = ('_wrapper', '_gpbcontainer', 'Repository', '_source')
+
     def __init__(self, wrapper, gpbcontainer):
         # Be careful - this is a hard link
         self._wrapper = wrapper
@@ -1861,6 +1942,81 @@ class ScalarContainerWrapper(object):
         self._gpbcontainer.remove(elem)
         self._wrapper._set_parents_modified()
 
+    def _check_values(self, values):
+        """
+        Type check values for this field and return them as a list. All the
+        items of an array module array, or of a NumPy array of a non object
+        dtype, have the type of the array, so only its smallest and largest
+        items are checked. Other sequences are checked item by item.
+        """
+        if self._wrapper._source._root._read_only:
+            raise OOIObjectError('This object wrapper is read only!')
+
+        check = self._gpbcontainer._type_checker.CheckValue
+        if isinstance(values, array.array) or \
+                (numpy is not None and isinstance(values, numpy.ndarray) and values.dtype.kind != 'O'):
+            values = values.tolist()
+            if values:
+                check(min(values))
+                check(max(values))
+        else:
+            values = list(values)
+            for value in values:
+                check(value)
+        return values
+
+    @GPBSourceSCW
+    def extend_from_buffer(self, buffer):
+        """
+        Extends by appending the values of an array module or NumPy buffer, or
+        of any sequence. The values are checked and the wrapper is modified
+        once for the whole buffer.
+        """
+
+        values = self._check_values(buffer)
+        if not values:
+            return
+
+        self._gpbcontainer._values.extend(values)
+        self._gpbcontainer._message_listener.Modified()
+        self._wrapper._set_parents_modified()
+
+    @GPBSourceSCW
+    def set_all(self, buffer):
+        """
+        Replaces all the items with the values of an array module or NumPy
+        buffer, or of any sequence.
+        """
+
+        values = self._check_values(buffer)
+        if not values and not self._gpbcontainer._values:
+            return
+
+        self._gpbcontainer._values[:] = values
+        self._gpbcontainer._message_listener.Modified()
+        self._wrapper._set_parents_modified()
+
+    @GPBSourceSCW
+    def to_list(self):
+        """Returns a copy of the items as a list."""
+
+        return list(self._gpbcontainer._values)
+
+    @GPBSourceSCW
+    def to_buffer(self, typecode):
+        """Returns the items in an array module array of the given typecode."""
+
+        return array.array(typecode, self._gpbcontainer._values)
+
+    @GPBSourceSCW
+    def to_array(self, dtype=None):
+        """Returns the items in a NumPy array - NumPy must be installed."""
+
+        if numpy is None:
+            raise OOIObjectError('NumPy is not installed - use to_buffer or to_list instead')
+
+        return numpy.array(self._gpbcontainer._values, dtype=dtype)
+
 
     @GPBSourceSCW
     def __getslice__(self, start, stop):
@@ -1954,6 +2110,9 @@ class StructureElement(object):
     need not be decoded to find them.
     """
 
+    # The weak reference is for the workbench cache
+    __slots__ = ('_element', 'ChildLinks', '__weakref__')
+
     def __init__(self, se=None):
         if se:
             self._element = se
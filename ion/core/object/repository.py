@@ -21,13 +21,14 @@ from ion.core.object import gpb_wrapper
 from ion.core.object import object_utils
 
 from ion.core.object import association_manager
+from ion.core.object import commit_graph
 
 from ion.core.exception import ApplicationError, ReceivedApplicationError, ReceivedContainerError
 
 from ion.util import procutils as pu
 
 import ion.util.ionlog
-log = ion.util.ionlog.getLogger(__name__)
+log = ion.util.ionlog.getIonLogger(__name__)
 
 COMMIT_TYPE = object_utils.create_type_identifier(object_id=8, version=1)
 MUTABLE_TYPE = object_utils.create_type_identifier(object_id=6, version=1)
@@ -153,15 +154,18 @@ class IndexHash(dict):
         D.update(E, **F) -> None.  Update D from E and F: for k in E: D[k] = E[k]
         (if E has keys else: for (k, v) in E: D[k] = v) then: for k in F: D[k] = F[k]
         """
-        dict.update(self, *args, **kwargs)
-        if self.has_cache:
-            self.cache.update(*args, **kwargs)
+        other = dict(*args, **kwargs)
+
+        # Count only what changes - elements are streamed in by batches
+        for key, item in other.iteritems():
+            old = dict.get(self, key)
+            if old is not None:
+                self._size -= old.__sizeof__()
+            self._size += item.__sizeof__()
 
-        # For now - don't bother parsing args just recount
-        size = 0
-        for item in self.itervalues():
-            size += item.__sizeof__()
-        self._size = size
+        dict.update(self, other)
+        if self.has_cache:
+            self.cache.update(other)
 
     def clear(self):
         dict.clear(self)
@@ -201,6 +205,12 @@ class ObjectContainer(object):
         Pointer to the current root object in the workspace
         """
 
+        self._copies = weakref.WeakValueDictionary()
+        """
+        Deep copies and the children loaded through them by id, until they are
+        committed - a child reached through a copy gets its own wrapper
+        """
+
 
         self.index_hash = IndexHash()
         """
@@ -266,6 +276,7 @@ class ObjectContainer(object):
             item.Invalidate()
 
         self._workspace.clear()
+        self._copies.clear()
         self.index_hash.clear()
         self._workspace_root = None
 
@@ -315,12 +326,19 @@ class ObjectContainer(object):
         if self._workspace.has_key(link.key):
 
             obj = self._workspace.get(link.key)
-            # Make sure the parent is set...
-            #self.set_linked_object(link, obj)
 
-            obj.AddParentLink(link)
+            element = None
+            if self._copies and link not in obj.ParentLinks and self._copies.has_key(link.Root.MyId):
+                # Loaded for another parent - the copy gets its own wrapper
+                element = self.index_hash.get(link.key)
 
-            return obj
+            if element is None:
+                # Make sure the parent is set...
+                #self.set_linked_object(link, obj)
+
+                obj.AddParentLink(link)
+
+                return obj
 
         elif self._commit_index.has_key(link.key):
             # make sure the parent is set...
@@ -334,7 +352,7 @@ class ObjectContainer(object):
 
         else:
 
-            log.debug('Linked object not found. Need non local object: %s' % str(link))
+            log.debug('Linked object not found. Need non local object: %s', link)
 
             raise KeyError('Object not found in the local work bench.')
 
@@ -361,6 +379,12 @@ class ObjectContainer(object):
             self._workspace[obj.MyId]=obj
             obj.ReadOnly = False
 
+        elif self._copies and self._copies.has_key(link.Root.MyId):
+            # A child of a copy - a new id keeps it apart from the original and other copies
+            obj.ReadOnly = link.ReadOnly
+            obj._set_parents_modified()
+            self._copies[obj.MyId] = obj
+
         else:
             # When getting an object from it's parent, use the parents readonly setting
             self._workspace[obj.MyId]=obj
@@ -560,6 +584,12 @@ class Repository(ObjectContainer):
         A place to stash the work space under a saved name.
         """
 
+        self._commit_graph = commit_graph.CommitGraph()
+        """
+        Parents, dates and generation numbers of the commits in _commit_index
+        which have all their ancestors indexed - see _index_commits
+        """
+
 
         if not isinstance(persistent, bool):
             raise RepositoryError('Invalid argument type to set the persistent property of a repository')
@@ -728,8 +758,10 @@ class Repository(ObjectContainer):
         self._dotgit.Invalidate()
 
         self._workspace.clear()
+        self._copies.clear()
         self.index_hash.clear()
         self._commit_index.clear()
+        self._commit_graph.clear()
         self._current_branch = None
         self.branchnicknames.clear()
         self._stash.clear()
@@ -871,7 +903,7 @@ class Repository(ObjectContainer):
                 del self.branches[idx]
                 break
         else:
-            log.info('Branch %s not found!' % name)
+            log.info('Branch %s not found!', name)
             return
 
         # Clean up the branch nickname if any...
@@ -892,7 +924,7 @@ class Repository(ObjectContainer):
                 branch = item
                 break
         else:
-            log.info('Branch %s not found!' % name)
+            log.info('Branch %s not found!', name)
             
         return branch
     
@@ -911,7 +943,7 @@ class Repository(ObjectContainer):
 
 
 
-        log.debug('checkout: branchname - "%s", commit id - "%s", older_than - "%s", excluded_types - %s' % (branchname, commit_id, older_than, excluded_types))
+        log.debug('checkout: branchname - "%s", commit id - "%s", older_than - "%s", excluded_types - %s', branchname, commit_id, older_than, excluded_types)
         if self.status == self.MODIFIED:
             raise RepositoryError('Can not checkout while the workspace is dirty')
             #What to do for uninitialized? 
@@ -943,80 +975,37 @@ class Repository(ObjectContainer):
             
             # IF you are checking out a specific commit ID it is always a detached head!
             detached = True
-            
-            # Use this set to make sure we only examine each commit once!
-            touched_refs = set()
-                
-            crefs = branch.commitrefs[:]
-            
-            while len(crefs) >0:
-                new_set = set()
-                    
-                for ref in crefs:
-                        
-                    if ref.MyId == commit_id:
-                        
-                        # Empty the crefs set to exit the while loop!
-                        crefs = set()
-                        # Save the CRef!
-                        cref = ref
-                        break # Break to ref in crefs
-                        
-                    # For each child reference...
-                    for pref in ref.parentrefs:
-                        # If we have not already looked at this one...
-                        p_commit = pref.commitref
-                        if not p_commit in touched_refs:                            
-                            new_set.add(p_commit)
-                            touched_refs.add(p_commit)    
-                    
-                else:
-                    crefs = new_set                    
-            else:
-                if not cref:
-                    raise RepositoryError('End of Ancestors: No matching reference \
-                                          found in commit history on branch name %s, \
-                                          commit_id: %s' % (branchname, commit_id))
+
+            heads = self._index_commits(branch.commitrefs[:])
+            if commit_id in self._commit_graph:
+                for head in heads:
+                    if self._commit_graph.is_ancestor(commit_id, head):
+                        cref = self._commit_index[commit_id]
+                        break
+
+            if cref is None:
+                raise RepositoryError('End of Ancestors: No matching reference \
+                                      found in commit history on branch name %s, \
+                                      commit_id: %s' % (branchname, commit_id))
 
         elif older_than:
             
             # IF you are checking out a specific commit date it is always a detached head!
             detached = True
-            
-            # Need to make sure we get the closest commit to the older_than date!
-            younger_than = -9999.99
-            
-            # Use this set to make sure we only examine each commit once!
-            touched_refs = set()
-            
-            crefs = branch.commitrefs[:]
-            
-            while len(crefs) >0:
-                
-                new_set = set()
-                
-                for ref in crefs:
-                        
-                    if ref.date <= older_than & ref.date > younger_than:
-                        cref = ref
-                        younger_than = ref.date
-                        
-                    # Only keep looking at parent references if they are to young
-                    elif ref.date > older_than:
-                        # For each child reference...
-                        for pref in ref.parentrefs:
-                            # If we have not already looked at this one...
-                            if not pref in touched_refs:                            
-                                new_set.add(pref)
-                                touched_refs.add(pref)    
-                       
-                crefs = new_set
-                       
+
+            # The newest commit made at or before older_than on the branch
+            heads = self._index_commits(branch.commitrefs[:])
+            for key in self._commit_graph.older_than(older_than):
+                for head in heads:
+                    if self._commit_graph.is_ancestor(key, head):
+                        cref = self._commit_index[key]
+                        break
+                if cref is not None:
+                    break
             else:
-                if not cref:
-                    raise RepositoryError('End of Ancestors: No matching commit \
-                                          found in commit history on branch name %s, \
-                                          older_than: %s' % (branch_name, older_than))
+                raise RepositoryError('End of Ancestors: No matching commit \
+                                      found in commit history on branch name %s, \
+                                      older_than: %s' % (branchname, older_than))
                 
         # Just checking out the current head - need to make sure it has not diverged! 
         else:
@@ -1056,10 +1045,120 @@ class Repository(ObjectContainer):
 
         
         
+    def _index_commits(self, crefs):
+        """
+        Add commits and all their ancestors which are not indexed yet to the
+        commit graph. Each commit is loaded once for the life of the repository.
+        @param crefs a list of commit objects - it is consumed
+        @retval the keys of the commits
+        """
+        graph = self._commit_graph
+
+        heads = [cref.MyId for cref in crefs]
+
+        while crefs:
+            cref = crefs[-1]
+            if cref.MyId in graph:
+                crefs.pop()
+                continue
+
+            parents = [pref.commitref for pref in cref.parentrefs]
+            missing = [parent for parent in parents if parent.MyId not in graph]
+            if missing:
+                crefs.extend(missing)
+                continue
+
+            crefs.pop()
+            graph.add(cref.MyId, cref.date, [parent.MyId for parent in parents])
+
+        return heads
+
+    def _get_indexed_commit(self, commit_id):
+
+        cref = self._commit_index.get(commit_id)
+        if cref is None:
+            raise RepositoryError('Commit id %s is not a known commit in this repository!' % commit_id)
+        self._index_commits([cref])
+        return cref
+
+    def is_ancestor(self, ancestor_id, descendant_id):
+        """
+        @brief Test whether a commit is in the history of another one
+        @param ancestor_id the key of a commit
+        @param descendant_id the key of a commit
+        @retval True if ancestor_id is descendant_id or one of its ancestors
+        """
+        self._get_indexed_commit(ancestor_id)
+        self._get_indexed_commit(descendant_id)
+        return self._commit_graph.is_ancestor(ancestor_id, descendant_id)
+
+    def merge_base(self, commit_id, other_id):
+        """
+        @brief Find the most recent commit in the history of two commits
+        @param commit_id the key of a commit
+        @param other_id the key of a commit
+        @retval the key of the best common ancestor - the one with the highest
+        generation if there are several - or None if the histories are unrelated
+        """
+        self._get_indexed_commit(commit_id)
+        self._get_indexed_commit(other_id)
+        bases = self._commit_graph.merge_bases(commit_id, other_id)
+        if bases:
+            return bases[0]
+        return None
+
+    def _drop_ancestors(self, crefs):
+        """
+        @brief Remove commits which are in the history of another one, and
+        duplicates. What remains has really diverged.
+        @retval a new list of commit objects
+        """
+        unique = []
+        keys = set()
+        for cref in crefs:
+            if cref.MyId not in keys:
+                keys.add(cref.MyId)
+                unique.append(cref)
+
+        try:
+            self._index_commits(unique[:])
+        except KeyError, ke:
+            log.info('History of the commits is not local - can not drop ancestors: %s', ke)
+            return unique
+
+        graph = self._commit_graph
+        heads = []
+        for cref in unique:
+            for other in unique:
+                if other is not cref and graph.is_ancestor(cref.MyId, other.MyId):
+                    break
+            else:
+                heads.append(cref)
+        return heads
+
+    def _index_new_commit(self, cref):
+        """
+        Add a new commit to the commit graph if its parents are indexed. Otherwise
+        it is indexed with its ancestors when the history is needed.
+        """
+        parent_keys = [pref.GetLink('commitref').key for pref in cref.parentrefs]
+        for key in parent_keys:
+            if key not in self._commit_graph:
+                return
+        self._commit_graph.add(cref.MyId, cref.date, parent_keys)
+
     def merge_by_date(self, branch):
         
-        crefs=branch.commitrefs[:]
-        
+        crefs = self._drop_ancestors(branch.commitrefs[:])
+
+        if len(crefs) == 1:
+            # Only one head has diverged - the others are in its history
+            cref = crefs[0]
+            del branch.commitrefs[:]
+            bref = branch.commitrefs.add()
+            bref.SetLink(cref)
+            return cref
+
         newest = -999.99
         for cref in crefs:
             if cref.date > newest:
@@ -1097,6 +1196,7 @@ class Repository(ObjectContainer):
         
         # Add the cref to the active commit objects - for convienance
         self._commit_index[cref.MyId] = cref
+        self._index_new_commit(cref)
 
         # update the hashed elements
         self.index_hash.update(structure)
@@ -1179,11 +1279,12 @@ class Repository(ObjectContainer):
             
             # Add the cref to the active commit objects - for convenience
             self._commit_index[cref.MyId] = cref
+            self._index_new_commit(cref)
 
             # update the hashed elements
             self.index_hash.update(structure)
 
-            log.debug('Commited repository - Comment: "%s"' % cref.comment)
+            log.debug('Commited repository - Comment: "%s"', cref.comment)
                             
         else:
             raise RepositoryError('Repository in invalid state to commit')
@@ -1297,12 +1398,23 @@ class Repository(ObjectContainer):
                 crefs.extend( branch.commitrefs)
         
         else:
-            log.debug('''Arguments to Repository.merge - branchname: %s; commit_id: %s''' \
-                      % (branchname, commit_id))
+            log.debug('''Arguments to Repository.merge - branchname: %s; commit_id: %s''', branchname, commit_id)
             raise RepositoryError('merge takes either a branchname argument or a commit_id argument!')
         
         assert len(crefs) > 0, 'Illegal state reached in repository Merge With function!'
 
+        # Commits in the history of the current head are merged already
+        head = self._current_branch.commitrefs[0]
+        try:
+            self._index_commits([head] + list(crefs))
+        except KeyError, ke:
+            log.info('History of the commits is not local - merging all of them: %s', ke)
+        else:
+            crefs = [cref for cref in crefs if not self._commit_graph.is_ancestor(cref.MyId, head.MyId)]
+            if len(crefs) == 0:
+                log.info('Nothing to merge - the commits are in the history of the current head')
+                return
+
         for cref in crefs:
             # Create a merge container to hold the merge object state for access
 
@@ -1347,19 +1459,19 @@ class Repository(ObjectContainer):
             branchname = self._current_branch.branchkey
         
         branch = self.get_branch(branchname)
-        log.info('$$ Logging commits on Branch %s $$' % branchname)
+        log.info('$$ Logging commits on Branch %s $$', branchname)
         cntr = 0
         for cref in branch.commitrefs:
             cntr+=1
-            log.info('$$ Branch Head Commit # %s $$' % cntr)
+            log.info('$$ Branch Head Commit # %s $$', cntr)
             
-            log.info('Commit: \n' + str(cref))
+            log.info('Commit: \n%s', cref)
         
             while len(cref.parentrefs) >0:
                 for pref in cref.parentrefs:
                     if pref.relationship == pref.Relationship.PARENT:
                             cref = pref.commitref
-                            log.info('Commit: \n' + str(cref))
+                            log.info('Commit: \n%s', cref)
                             break # There should be only one parent ancestor from a branch
                 
         
@@ -1392,6 +1504,36 @@ class Repository(ObjectContainer):
     @defer.inlineCallbacks
     def fetch_links(self, links):
 
+        yield self._fetch_elements(links)
+
+        # Load the content by the link!
+        for link in links:
+            self.get_linked_object(link)
+
+    def _checkout_remote_commit(self, commit, excluded_types):
+
+        link = commit.GetLink('objectroot')
+        if self.index_hash.has_key(link.key):
+            # Only part of the structure is missing - get just that
+            return self._checkout_partial_commit(commit, excluded_types)
+
+        return ObjectContainer._checkout_remote_commit(self, commit, excluded_types)
+
+    @defer.inlineCallbacks
+    def _checkout_partial_commit(self, commit, excluded_types):
+
+        link = commit.GetLink('objectroot')
+        root_obj = self.get_linked_object(link)
+
+        yield self.load_remote_links(root_obj, excluded_types)
+
+        defer.returnValue(root_obj)
+
+    @defer.inlineCallbacks
+    def _fetch_elements(self, links):
+        """
+        Get the elements for links from upstream in one request and add them to the index hash
+        """
         if hasattr(self._process, 'fetch_links'):
             # Get the method from the process if it overrides workbench
             fetch_links = self._process.fetch_links
@@ -1406,9 +1548,62 @@ class Repository(ObjectContainer):
 
         self.index_hash.update(elements)
 
-        # Load the content by the link!
-        for link in links:
-            self.get_linked_object(link)
+    @defer.inlineCallbacks
+    def load_remote_links(self, obj, excluded_types=None):
+        """
+        Load the child objects into the work space like load_links, getting the
+        ones which are not local from upstream. The structure is walked level by
+        level: the missing objects of a level are requested together, and the
+        next levels of what is local are loaded while the request is in flight.
+        @retval the number of objects fetched
+        """
+        excluded_types = excluded_types or []
+
+        links = list(obj.ChildLinks)
+        seen = set([obj.MyId])
+        requested = set()
+
+        # Requests in flight, oldest first: the deferred and the links waiting for it
+        fetches = []
+        waiting = {}
+        while links or fetches:
+            children = []
+            missing = {}
+            for link in links:
+                if link.type.GPBMessage in excluded_types:
+                    continue
+
+                try:
+                    child = self.get_linked_object(link)
+                except KeyError, ke:
+                    if link.key in waiting:
+                        waiting[link.key].append(link)
+                    elif link.key in requested:
+                        raise RepositoryError('Linked object not found upstream: %s' % object_utils.sha1_to_hex(link.key))
+                    else:
+                        missing.setdefault(link.key, []).append(link)
+                    continue
+
+                if child.MyId not in seen:
+                    seen.add(child.MyId)
+                    children.extend(child.ChildLinks)
+
+            if missing:
+                # One request for the level - what it gets is loaded once everything local is
+                d = self._fetch_elements([key_links[0] for key_links in missing.itervalues()])
+                fetches.append((d, missing))
+                waiting.update(missing)
+                requested.update(missing)
+
+            links = children
+            if not links and fetches:
+                d, missing = fetches.pop(0)
+                yield d
+                for key, key_links in missing.iteritems():
+                    del waiting[key]
+                    links.extend(key_links)
+
+        defer.returnValue(len(requested))
 
 
 
@@ -1483,6 +1678,12 @@ class Repository(ObjectContainer):
         Then read it back in as new objects in the repository. The copies will all be
         created in a modified state. Copy can move from one repository to another.
         The deep_copy parameter determines whether all child objects are also copied.
+
+        A deep copy links to the serialized children of the value by key. A child
+        is only loaded when it is first accessed through the copy, into a wrapper
+        of its own with a new id, so that modifying one copy does not modify the
+        original or another copy. Children which are never accessed are committed
+        with the copy without being decoded.
         """
 
         log.debug('Copy Object:')
@@ -1514,13 +1715,11 @@ class Repository(ObjectContainer):
         new_obj._set_parents_modified()
 
         if deep_copy:
-            # Deep copy from the original!
-            for link in new_obj.ChildLinks:
-                # Use the copies link to get the child - possibly from a different repo!
+            if value.Repository is not self:
+                # Own the serialized children - the other repository may let go of them
+                self._share_elements(value.Repository, [link.key for link in new_obj.ChildLinks])
 
-                child = self.get_linked_object(link)
-                new_child = self.copy_object(child, True)
-                link.SetLink(new_child)
+            self._copies[new_obj.MyId] = new_obj
 
         log.debug('Copy Object: Complete')
 
@@ -1528,6 +1727,30 @@ class Repository(ObjectContainer):
     
     
         
+    def _share_elements(self, other, keys):
+        """
+        Add the serialized elements for keys and everything they link to from the
+        index hash of another repository to this one. Elements are not decoded:
+        the children of one which does not list its child links yet, because it
+        was never loaded, are found by key through the workbench when it is.
+        """
+        keys = list(keys)
+        while keys:
+            key = keys.pop()
+
+            if dict.has_key(self.index_hash, key):
+                # Already owned - and so is what it links to
+                continue
+
+            element = other.index_hash.get(key)
+            if element is None:
+                # Excluded or not yet fetched - it can still be found by key later
+                continue
+
+            self.index_hash[key] = element
+            keys.extend(element.ChildLinks)
+
+
     def set_linked_object(self,link, value):        
         # If it is a link - set a link to the value in the wrapper
         if link.ObjectType != LINK_TYPE:
@@ -1535,8 +1758,8 @@ class Repository(ObjectContainer):
             raise RepositoryError('Can not set a composite field unless it is of type Link')
 
         if not isinstance(value, gpb_wrapper.Wrapper):
-            log.debug('Error Setting Link in Object - Root Object Containing the Link: \n %s' % link.Root.Debug())
-            log.error('Error Setting Link in Object - Attempting to set the link equal to a non GPBWrapper Value: "%s"' % str(value))
+            log.debug('Error Setting Link in Object - Root Object Containing the Link: \n %s', ion.util.ionlog.DeferredStr(link.Root.Debug))
+            log.error('Error Setting Link in Object - Attempting to set the link equal to a non GPBWrapper Value: "%s"', value)
 
             raise RepositoryError('You can not assign an object link equal to a none GPB Wrapper value. Value type "%s", see log errors and log debug for more details' % type(value))
 
@@ -1549,14 +1772,15 @@ class Repository(ObjectContainer):
         if not value.Repository is self:
             value = self.copy_object(value)
         
-        
-        if link.key == value.MyId:
+        value_id = value.MyId
+        if link.key == value_id:
                 # Add the new link to the list of parents for the object
                 value.AddParentLink(link) 
                 # Setting it again is a pass...
                 return
         
-        if link.InParents(value):
+        # Only a value which links to other objects can be a parent of the link - new objects and leaves are not
+        if value.ChildLinks and link.InParents(value):
             raise RepositoryError('You can not create a recursive structure - this value is also a parent of the link you are setting.')
 
         # Add the new link to the list of parents for the object
@@ -1595,11 +1819,16 @@ class Repository(ObjectContainer):
         
             
         # Set the id of the linked wrapper
-        link.key = value.MyId
-        
-        # Set the type
-        tp = link.type
-        object_utils.set_type_from_obj(value, tp)
+        link.key = value_id
+        
+        # Set the type - the wrapper class of the value holds its type, only copy it if it changed
+        tp = link.GPBMessage.type
+        value_type = value.ObjectType
+        if value_type.object_id < 0:
+            # No type identifier in the message - this raises
+            object_utils.set_type_from_obj(value, tp)
+        elif tp.object_id != value_type.object_id or tp.version != value_type.version:
+            tp.CopyFrom(value_type)
         #link.type = object_utils.get_type_from_obj(value)
 
 
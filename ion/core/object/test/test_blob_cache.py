@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+@brief Test implementation of the blob cache class
+
+@file ion/core/object/test/test_blob_cache.py
+@test The workbench cache of structure elements
+"""
+
+import gc
+
+from twisted.trial import unittest
+
+from ion.core.object import blob_cache
+from ion.core.object import gpb_wrapper
+from ion.core.object import object_utils
+from ion.core.object import workbench
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+
+
+def make_element(value):
+    element = gpb_wrapper.StructureElement()
+    element.type = PERSON_TYPE
+    element.value = value
+    element.key = element.sha1
+    return element
+
+
+class BlobCacheTest(unittest.TestCase):
+
+    def test_kept(self):
+        cache = blob_cache.BlobCache(10**6)
+        element = make_element('a person')
+        key = element.key
+        cache[key] = element
+
+        self.assertEqual(cache[key] is element, True)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+        # Nothing else holds the element any more - the LRU keeps it, child links and all
+        element.ChildLinks.add('a child')
+        del element
+        gc.collect()
+        self.assertEqual(cache.has_key(key), True)
+
+        kept = cache[key]
+        self.assertEqual(kept.value, 'a person')
+        self.assertEqual(kept.ChildLinks, set(['a child']))
+        self.assertEqual(cache.get(key) is kept, True)
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['bytes'], len('a person'))
+
+        self.assertEqual(cache.get('not a key'), None)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_evictions(self):
+        elements = [make_element('person %d' % i + 'x' * 1000) for i in range(10)]
+        cache = blob_cache.BlobCache(len(elements[0].value) * 3)
+        cache.update(dict([(element.key, element) for element in elements]))
+
+        stats = cache.stats()
+        self.assertEqual(stats['blobs'], 3)
+        self.assertEqual(stats['evictions'], 7)
+        self.failUnless(stats['bytes'] <= stats['size'])
+
+        # All still in use
+        for element in elements:
+            self.assertEqual(cache[element.key] is element, True)
+
+        keys = [element.key for element in elements]
+        del element
+        del elements
+        gc.collect()
+        self.assertEqual(len([key for key in keys if cache.has_key(key)]), 3)
+
+    def test_too_large(self):
+        cache = blob_cache.BlobCache(4)
+        element = make_element('a person')
+        key = element.key
+        cache[key] = element
+
+        # Not kept rather than pushing everything else out
+        self.assertEqual(cache.stats()['blobs'], 0)
+        self.assertEqual(cache[key] is element, True)
+        del element
+        gc.collect()
+        self.assertEqual(cache.has_key(key), False)
+
+    def test_pop(self):
+        cache = blob_cache.BlobCache(10**6)
+        element = make_element('a person')
+        key = element.key
+        cache[key] = element
+
+        self.assertEqual(cache.pop(key) is element, True)
+        self.assertEqual(cache.has_key(key), False)
+        self.assertEqual(cache.pop(key, None), None)
+        self.assertRaises(KeyError, cache.pop, key)
+
+    def test_weak_only(self):
+        cache = blob_cache.BlobCache(0)
+        element = make_element('a person')
+        key = element.key
+        cache[key] = element
+
+        del element
+        gc.collect()
+        self.assertEqual(cache.has_key(key), False)
+        self.assertRaises(KeyError, cache.__getitem__, key)
+        self.assertEqual(cache.stats()['blobs'], 0)
+
+
+class WorkBenchBlobCacheTest(unittest.TestCase):
+
+    def test_cleared_repository(self):
+        wb = workbench.WorkBench('No Process Test')
+
+        repo = wb.create_repository(PERSON_TYPE)
+        repo.root_object.name = 'David'
+        repo.commit('Shared person')
+        key = repo.root_object.MyId
+
+        wb.clear_repository(repo)
+        del repo
+        gc.collect()
+
+        # Another repository still finds the person
+        hits = wb._workbench_cache.stats()['hits']
+        repo = wb.create_repository()
+        element = repo.index_hash[key]
+        self.assertEqual(repo._load_element(element).name, 'David')
+        self.assertEqual(wb._workbench_cache.stats()['hits'], hits + 1)
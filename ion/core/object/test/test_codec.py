@@ -10,6 +10,8 @@
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
 
+from StringIO import StringIO
+
 
 from twisted.trial import unittest
 
@@ -80,6 +82,30 @@ class CodecTest(unittest.TestCase):
         self.assertRaises(codec.CodecError,codec.unpack_structure,'junk that is not a serialized container!')
 
 
+    def test_iter_container(self):
+
+        serialized = codec.pack_structure(self.ab)
+
+        head, obj_dict = codec._unpack_container(serialized)
+
+        streamed = {}
+        heads = []
+        for is_head, element in codec._iter_container(StringIO(serialized)):
+            if is_head:
+                heads.append(element)
+            streamed[element.key] = element
+
+        self.assertEqual(len(heads), 1)
+        self.assertEqual(heads[0].key, head.key)
+        self.assertEqual(sorted(streamed.keys()), sorted(obj_dict.keys()))
+        for key, element in obj_dict.items():
+            self.assertEqual(streamed[key].serialize(), element.serialize())
+
+        # A truncated container must not be taken for a shorter one
+        truncated = StringIO(serialized[:-3])
+        self.assertRaises(codec.CodecError, list, codec._iter_container(truncated))
+
+
     def test_parents(self):
 
         serialized = codec.pack_structure(self.ab)
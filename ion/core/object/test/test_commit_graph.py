@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+@brief Test implementation of the commit graph class
+
+@file ion/core/object/test/test_commit_graph.py
+@test The commit history index of a repository
+"""
+
+import random
+
+from twisted.trial import unittest
+
+from ion.core.object import commit_graph
+
+
+class CommitGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        # a - b - c - e
+        #      \     /
+        #       - d -
+        graph = commit_graph.CommitGraph()
+        graph.add('a', 1.0, [])
+        graph.add('b', 2.0, ['a'])
+        graph.add('c', 3.0, ['b'])
+        graph.add('d', 4.0, ['b'])
+        graph.add('e', 5.0, ['c', 'd'])
+        self.graph = graph
+
+    def test_generations(self):
+        self.assertEqual(len(self.graph), 5)
+        self.assertEqual(self.graph.generation('a'), 1)
+        self.assertEqual(self.graph.generation('d'), 3)
+        self.assertEqual(self.graph.generation('e'), 4)
+        self.assertEqual(self.graph.parents('e'), ('c', 'd'))
+
+    def test_add_before_parent(self):
+        self.assertRaises(commit_graph.CommitGraphError, self.graph.add, 'g', 7.0, ['f'])
+        self.failIf('g' in self.graph)
+
+    def test_is_ancestor(self):
+        graph = self.graph
+        self.failUnless(graph.is_ancestor('a', 'e'))
+        self.failUnless(graph.is_ancestor('d', 'e'))
+        self.failUnless(graph.is_ancestor('e', 'e'))
+        self.failIf(graph.is_ancestor('c', 'd'))
+        self.failIf(graph.is_ancestor('e', 'a'))
+
+    def test_older_than(self):
+        graph = self.graph
+        self.assertEqual(list(graph.older_than(3.5)), ['c', 'b', 'a'])
+        self.assertEqual(list(graph.older_than(3.0)), ['c', 'b', 'a'])
+        self.assertEqual(list(graph.older_than(0.5)), [])
+
+        # Added commits are found as well
+        graph.add('f', 2.5, ['a'])
+        self.assertEqual(list(graph.older_than(3.0)), ['c', 'f', 'b', 'a'])
+
+    def test_merge_bases(self):
+        graph = self.graph
+        self.assertEqual(graph.merge_bases('c', 'd'), ['b'])
+        self.assertEqual(graph.merge_bases('a', 'e'), ['a'])
+        self.assertEqual(graph.merge_bases('e', 'd'), ['d'])
+
+        # Unrelated histories
+        graph.add('x', 6.0, [])
+        self.assertEqual(graph.merge_bases('x', 'e'), [])
+
+    def test_merge_bases_criss_cross(self):
+        graph = self.graph
+        graph.add('f', 6.0, ['c', 'd'])
+        self.assertEqual(sorted(graph.merge_bases('e', 'f')), ['c', 'd'])
+
+    def test_clear(self):
+        self.graph.clear()
+        self.assertEqual(len(self.graph), 0)
+        self.assertEqual(list(self.graph.older_than(10.0)), [])
+
+
+class CommitGraphWritersTest(unittest.TestCase):
+    """
+    Many writers commit concurrently to one repository: each one extends its
+    own head and now and then merges the head of another writer.
+    """
+
+    def setUp(self):
+        rand = random.Random(5)
+        graph = commit_graph.CommitGraph()
+        graph.add('root', 0.0, [])
+        ancestors = {'root':set()}
+        heads = ['root'] * 8
+
+        for i in range(400):
+            writer = rand.randrange(len(heads))
+            parents = [heads[writer]]
+            if rand.random() < 0.3:
+                other = heads[rand.randrange(len(heads))]
+                if other not in parents:
+                    parents.append(other)
+
+            key = 'c%d' % i
+            graph.add(key, float(i), parents)
+            ancestors[key] = set(parents)
+            for parent in parents:
+                ancestors[key].update(ancestors[parent])
+            heads[writer] = key
+
+        self.rand = rand
+        self.graph = graph
+        self.ancestors = ancestors
+        self.keys = sorted(ancestors.keys())
+
+    def _pairs(self, count):
+        for i in range(count):
+            yield self.rand.choice(self.keys), self.rand.choice(self.keys)
+
+    def test_is_ancestor(self):
+        pairs = list(self._pairs(2000))
+        for one, other in pairs:
+            expected = one == other or one in self.ancestors[other]
+            self.assertEqual(self.graph.is_ancestor(one, other), expected)
+
+        # Cached answers are the same
+        for one, other in pairs:
+            expected = one == other or one in self.ancestors[other]
+            self.assertEqual(self.graph.is_ancestor(one, other), expected)
+
+    def test_merge_bases(self):
+        for one, other in self._pairs(500):
+            common = (self.ancestors[one] | set([one])) & (self.ancestors[other] | set([other]))
+            best = set([key for key in common
+                        if not [base for base in common if key in self.ancestors[base]]])
+            self.assertEqual(set(self.graph.merge_bases(one, other)), best)
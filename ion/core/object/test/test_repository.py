@@ -23,6 +23,8 @@ from ion.core.object import gpb_wrapper
 from ion.core.object import object_utils
 from ion.core.object import repository
 
+from ion.util import procutils as pu
+
 
 
 INVALID_TYPE = object_utils.create_type_identifier(object_id=-1, version=1)
@@ -482,6 +484,84 @@ class RepositoryTest(unittest.TestCase):
         self.assertEqual(ab.person[0].name,'alpha')
 
 
+    @defer.inlineCallbacks
+    def test_checkout_older_than(self):
+        repo, ab = self.wb.init_repository(ADDRESSBOOK_TYPE)
+
+        commit_ref1 = repo.commit()
+
+        p = ab.person.add()
+        p.id = 1
+        p.name = 'Uma'
+
+        commit_ref2 = repo.commit()
+
+        p.name = 'alpha'
+        commit_ref3 = repo.commit()
+
+        date2 = repo._commit_index[commit_ref2].date
+
+        ab = yield repo.checkout(branchname='master', older_than=date2)
+        self.assertEqual(repo.commit_head.MyId, commit_ref2)
+        self.assertEqual(ab.person[0].name,'Uma')
+
+        ab = yield repo.checkout(branchname='master', older_than=date2 - 0.000001)
+        self.assertEqual(repo.commit_head.MyId, commit_ref1)
+        self.assertEqual(len(ab.person),0)
+
+        ab = yield repo.checkout(branchname='master', older_than=pu.currenttime())
+        self.assertEqual(repo.commit_head.MyId, commit_ref3)
+
+        # All three commits are indexed once
+        self.assertEqual(len(repo._commit_graph), 3)
+        self.assertEqual(repo._commit_graph.generation(commit_ref3), 3)
+
+        try:
+            yield repo.checkout(branchname='master', older_than=repo._commit_index[commit_ref1].date - 1.0)
+        except repository.RepositoryError:
+            pass
+        else:
+            self.fail('Checkout before the first commit should fail')
+
+    @defer.inlineCallbacks
+    def test_merge_base(self):
+        repo, ab = self.wb.init_repository(ADDRESSLINK_TYPE)
+        ab.title = 'Base'
+        cref1 = repo.commit('base')
+
+        repo.branch('other')
+        repo.root_object.title = 'Other'
+        cref2 = repo.commit('other')
+
+        ab = yield repo.checkout(branchname='master')
+        ab.title = 'Master'
+        cref3 = repo.commit('master')
+
+        self.failUnless(repo.is_ancestor(cref1, cref3))
+        self.failUnless(repo.is_ancestor(cref1, cref2))
+        self.failIf(repo.is_ancestor(cref2, cref3))
+        self.failIf(repo.is_ancestor(cref3, cref1))
+
+        self.assertEqual(repo.merge_base(cref2, cref3), cref1)
+        self.assertEqual(repo.merge_base(cref1, cref3), cref1)
+
+        self.assertRaises(repository.RepositoryError, repo.is_ancestor, 'not a commit', cref3)
+
+        # Merging a commit in the history of the current head does nothing
+        yield repo.merge_with(commit_id=cref1)
+        self.assertEqual(repo.merge, None)
+
+        yield repo.merge_with(branchname='other')
+        self.assertEqual(repo.merge[0].title, 'Other')
+
+    def test_checkout_unknown_commit_id(self):
+        repo, ab = self.wb.init_repository(ADDRESSBOOK_TYPE)
+        repo.commit()
+
+        d = repo.checkout(branchname='master', commit_id='not a commit')
+        return self.assertFailure(d, repository.RepositoryError)
+
+
     def test_error_on_set_linked_object(self):
 
         repo, ab = self.wb.init_repository(ADDRESSLINK_TYPE)
@@ -682,6 +762,112 @@ class RepositoryTest(unittest.TestCase):
         
         
         
+    @defer.inlineCallbacks
+    def test_copy_shares_children(self):
+
+        repo1, ab1 = self.wb.init_repository(ADDRESSLINK_TYPE)
+        ab1.title = 'Original'
+
+        for i in range(3):
+            p = repo1.create_object(PERSON_TYPE)
+            p.name = 'Person %d' % i
+            p.id = i
+            ab1.person.add()
+            ab1.person[i] = p
+        ab1.owner = ab1.person[0]
+
+        repo1.commit(comment='testing commit')
+        ab1 = yield repo1.checkout(branchname='master')
+
+        owner_key = ab1.GetLink('owner').key
+        person_key = ab1.person.GetLink(1).key
+
+        # Copy to another repository - the children are not decoded
+        repo2, ab2 = self.wb.init_repository(ADDRESSLINK_TYPE)
+        ab2.owner = ab1
+
+        copy = ab2.owner
+        self.assertEqual(copy, ab1)
+        self.assertNotIdentical(copy, ab1)
+        self.failIf(repo2._workspace.has_key(owner_key))
+        self.failUnless(dict.has_key(repo2.index_hash, owner_key))
+
+        # The repository copied from can go away
+        self.wb.clear_repository(repo1)
+
+        self.assertEqual(copy.owner.name, 'Person 0')
+        self.assertIdentical(copy.owner.Repository, repo2)
+
+        # The copied children are owned by the copy
+        copy.person[1].name = 'John'
+        self.assertNotEqual(copy.person.GetLink(1).key, person_key)
+        self.failUnless(copy.Modified)
+
+        repo2.commit(comment='copied')
+        ab2 = yield repo2.checkout(branchname='master')
+
+        self.assertEqual(ab2.owner.title, 'Original')
+        self.assertEqual(ab2.owner.person[0].name, 'Person 0')
+        self.assertEqual(ab2.owner.person[1].name, 'John')
+        self.assertEqual(ab2.owner.person[2].name, 'Person 2')
+
+    @defer.inlineCallbacks
+    def test_copy_twice(self):
+
+        repo, ab = self.wb.init_repository(ADDRESSLINK_TYPE)
+
+        p = repo.create_object(PERSON_TYPE)
+        p.name = 'David'
+        p.id = 5
+        ab.owner = p
+
+        repo.commit(comment='testing commit')
+        ab = yield repo.checkout(branchname='master')
+        owner_key = ab.GetLink('owner').key
+
+        # Two copies into another repository, where the owner is not loaded, and a copy of a copy
+        repo2, ab2 = self.wb.init_repository(ADDRESSLINK_TYPE)
+        copy1 = repo2.copy_object(ab)
+        copy2 = repo2.copy_object(ab)
+        self.failIf(repo2._workspace.has_key(owner_key))
+        copy3 = repo2.copy_object(copy2)
+
+        copy1.owner.name = 'John'
+        self.assertEqual(copy1.owner.name, 'John')
+        self.assertEqual(copy2.owner.name, 'David')
+        self.assertEqual(copy3.owner.name, 'David')
+
+        copy3.owner.name = 'Mary'
+        self.assertEqual(copy2.owner.name, 'David')
+        self.assertEqual(ab.owner.name, 'David')
+
+    @defer.inlineCallbacks
+    def test_copy_loaded_children(self):
+
+        repo, ab = self.wb.init_repository(ADDRESSLINK_TYPE)
+
+        p = repo.create_object(PERSON_TYPE)
+        p.name = 'David'
+        p.id = 5
+        ab.owner = p
+
+        repo.commit(comment='testing commit')
+        ab = yield repo.checkout(branchname='master')
+
+        # The owner is loaded in the workspace - modifying the copy must not modify it
+        workspace = len(repo._workspace)
+        copy = repo.copy_object(ab)
+
+        # Only the copy itself is loaded, next to the original
+        self.assertEqual(len(repo._workspace), workspace + 1)
+        self.assertIdentical(repo._workspace[ab.MyId], ab)
+
+        self.assertNotIdentical(copy.owner, ab.owner)
+
+        copy.owner.name = 'John'
+        self.assertEqual(ab.owner.name, 'David')
+        self.assertEqual(copy.owner.name, 'John')
+
     @defer.inlineCallbacks 
     def test_merge(self):
         
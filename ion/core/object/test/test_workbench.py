@@ -268,6 +268,71 @@ class WorkBenchTest(unittest.TestCase):
         self.assertNotIn(key, self.wb._repo_cache)
 
 
+    def test_end_conversation_batch(self):
+
+        self.wb.release_batch = 2
+        self.wb.release_interval = 1000.0
+        self.wb.release_bytes = 10**9
+
+        key = self.repo.repository_key
+        context = self.repo.convid_context
+
+        self.wb.end_conversation(context)
+
+        # Waiting for the batch
+        self.assertIn(key, self.wb._repos)
+        self.assertEqual(self.wb.get_cache_stats()['pending'], 1)
+
+        self.wb.end_conversation('Another conversation')
+
+        self.assertNotIn(key, self.wb._repos)
+        stats = self.wb.get_cache_stats()
+        self.assertEqual(stats['conversations'], 2)
+        self.assertEqual(stats['releases'], 1)
+        self.assertEqual(stats['released'], 1)
+        self.assertEqual(stats['pending'], 0)
+
+
+    def test_end_conversation_bytes(self):
+
+        self.wb.release_batch = 100
+        self.wb.release_interval = 1000.0
+        self.wb.release_bytes = 1
+
+        self.repo.commit('junk')
+        key = self.repo.repository_key
+        self.repo.cached = True
+
+        self.wb.end_conversation(self.repo.convid_context)
+
+        self.assertNotIn(key, self.wb._repos)
+        self.assertIn(key, self.wb._repo_cache)
+
+
+    def test_end_conversation_get_repository(self):
+
+        self.wb.release_batch = 100
+        self.wb.release_interval = 1000.0
+        self.wb.release_bytes = 10**9
+
+        key = self.repo.repository_key
+        self.wb.end_conversation(self.repo.convid_context)
+
+        # Gone as if it was released already
+        self.assertEqual(self.wb.get_repository(key), None)
+        self.assertNotIn(key, self.wb._repos)
+
+        repo = self.wb.create_repository(ADDRESSLINK_TYPE)
+        repo.commit('junk')
+        repo.cached = True
+        self.wb.end_conversation(repo.convid_context)
+
+        # Taken back by the current conversation
+        self.assertEqual(self.wb.get_repository(repo.repository_key), repo)
+        self.wb.release_conversations()
+        self.assertIn(repo.repository_key, self.wb._repos)
+
+
 
 class WorkBenchProcess(Process):
     """
@@ -378,6 +443,28 @@ class WorkBenchProcessTest(IonTestCase):
         self.assertEqual(self.repo1.commit_head, repo2.commit_head)
         self.assertEqual(self.repo1.root_object, repo2.root_object)
 
+    @defer.inlineCallbacks
+    def test_checkout_partial(self):
+
+        self.repo1.persistent = True
+
+        result = yield self.proc2.workbench.pull(self.proc1.id.full, self.repo1.repository_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+        repo2 = self.proc2.workbench.get_repository(self.repo1.repository_key)
+
+        # Lose the owner - the rest of the addressbook is still local
+        owner_key = self.repo1.root_object.GetLink('owner').key
+        self.proc2.workbench._workbench_cache.pop(owner_key, None)
+        del repo2.index_hash[owner_key]
+        self.assertEqual(repo2.index_hash.has_key(owner_key), False)
+
+        repo2.upstream = self.proc1.id.full
+        ab = yield repo2.checkout('master')
+
+        self.assertEqual(ab.owner.name, 'David')
+        self.assertEqual(self.repo1.root_object, repo2.root_object)
+        self.assertEqual(repo2.index_hash.has_key(owner_key), True)
+
     @defer.inlineCallbacks
     def test_pull_invalid(self):
 
@@ -677,6 +764,61 @@ class WorkBenchProcessTest(IonTestCase):
         self.assertEqual(self.repo1.commit_head, repo2.commit_head)
         self.assertEqual(self.repo1.root_object, repo2.root_object)
 
+    @defer.inlineCallbacks
+    def test_push_delta(self):
+
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        all_keys = self.proc1.workbench.list_repository_blobs(self.repo1)
+
+        # Capture the second push message
+        sent = []
+        rpc_send = self.proc1.rpc_send
+        def capture_send(recv, operation, content, *args, **kwargs):
+            if operation == 'push':
+                for repostate in content.repositories:
+                    sent.extend(repostate.blob_keys)
+            return rpc_send(recv, operation, content, *args, **kwargs)
+        self.proc1.rpc_send = capture_send
+
+        self.repo1.root_object.title = 'New Addressbook'
+        self.repo1.commit('An updated addressbook')
+
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        # Only the new commit, the new root object and the previous head commit are advertised
+        self.assertEqual(len(sent), 3)
+        self.failUnless(len(sent) < len(all_keys))
+
+        repo2 = self.proc2.workbench.get_repository(self.repo1.repository_key)
+        ab = yield repo2.checkout('master')
+
+        self.assertEqual(self.repo1.commit_head, repo2.commit_head)
+        self.assertEqual(self.repo1.root_object, repo2.root_object)
+
+    @defer.inlineCallbacks
+    def test_push_delta_mismatch(self):
+
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        # The remote loses everything it was pushed
+        self.proc2.workbench.clear()
+
+        self.repo1.root_object.title = 'New Addressbook'
+        self.repo1.commit('An updated addressbook')
+
+        result = yield self.proc1.workbench.push(self.proc2.id.full, self.repo1)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo2 = self.proc2.workbench.get_repository(self.repo1.repository_key)
+        ab = yield repo2.checkout('master')
+
+        self.assertEqual(self.repo1.commit_head, repo2.commit_head)
+        self.assertEqual(self.repo1.root_object, repo2.root_object)
+
     @defer.inlineCallbacks
     def test_push_branch_same_head(self):
         """
@@ -6,6 +6,9 @@
 @test Service the protobuffers wrapper class
 """
 
+import array
+import weakref
+
 import ion.util.ionlog
 from twisted.trial.unittest import SkipTest
 log = ion.util.ionlog.getLogger(__name__)
@@ -18,6 +21,7 @@ from ion.core.object import gpb_wrapper
 from ion.core.object.gpb_wrapper import LINK_TYPE, CDM_DATASET_TYPE, OOIObjectError
 from ion.core.object import workbench
 from ion.core.object import object_utils
+from ion.core.object.repository import RepositoryError
 
 
 PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
@@ -146,6 +150,80 @@ class WrapperMethodsTest(unittest.TestCase):
 
         self.fail('Attribute Error not raised by invalid delete request')
 
+    def test_no_new_attributes(self):
+
+        ab = gpb_wrapper.Wrapper._create_object(ADDRESSBOOK_TYPE)
+        self.assertRaises(AttributeError, setattr, ab, 'not_a_field', 'String')
+        self.assertEqual(hasattr(ab, '__dict__'), False)
+        self.assertEqual(hasattr(ab.person, '__dict__'), False)
+
+        se = gpb_wrapper.StructureElement()
+        self.assertRaises(AttributeError, setattr, se, 'not_a_field', 'String')
+
+        # Wrappers can still be weak referenced
+        self.assertIdentical(weakref.ref(ab)(), ab)
+        person = ab.person.add()
+        self.assertIdentical(weakref.ref(person)(), person)
+
+        # Invalidating a container with a source keeps the source
+        source = gpb_wrapper.Wrapper._create_object(TEST_TYPE)
+        integers = gpb_wrapper.Wrapper._create_object(TEST_TYPE).integers
+        integers.Invalidate(source)
+        self.assertIdentical(integers._source, source)
+
+        persons = ab.person
+        persons.Invalidate(ab)
+        self.assertIdentical(persons._source, ab)
+
+    def test_read_only_set(self):
+
+        ab = gpb_wrapper.Wrapper._create_object(ADDRESSBOOK_TYPE)
+        ab.title = 'String'
+        ab.ReadOnly = True
+        self.assertRaises(OOIObjectError, setattr, ab, 'title', 'Other')
+        self.assertEqual(ab.title, 'String')
+
+
+    def test_scalar_buffer(self):
+
+        p = gpb_wrapper.Wrapper._create_object(TEST_TYPE)
+
+        p.floats.extend_from_buffer(array.array('d', [1.0, 2.0]))
+        p.floats.extend_from_buffer([3.0])
+        self.assertEqual(p.floats.to_list(), [1.0, 2.0, 3.0])
+        self.assertEqual(p.floats.to_buffer('d'), array.array('d', [1.0, 2.0, 3.0]))
+
+        p.integers.set_all(array.array('i', range(5)))
+        p.integers.set_all(array.array('i', [7, 8]))
+        self.assertEqual(p.integers.to_list(), [7, 8])
+        self.assertIn('integers', p.ListSetFields())
+
+        # Checked once for the buffer - nothing is added
+        self.assertRaises(TypeError, p.integers.extend_from_buffer, array.array('d', [1.0]))
+        self.assertRaises(ValueError, p.integers.extend_from_buffer, array.array('l', [1, 2**40]))
+        self.assertRaises(TypeError, p.integers.set_all, [1, 'two'])
+        self.assertEqual(p.integers.to_list(), [7, 8])
+
+        p.ReadOnly = True
+        self.assertRaises(OOIObjectError, p.floats.set_all, [1.0])
+        self.assertEqual(len(p.floats), 3)
+
+    def test_scalar_numpy_buffer(self):
+
+        try:
+            import numpy
+        except ImportError:
+            raise SkipTest('NumPy is not installed')
+
+        p = gpb_wrapper.Wrapper._create_object(TEST_TYPE)
+
+        p.integers.extend_from_buffer(numpy.array([1, 2, 3], dtype=numpy.int32))
+        self.assertEqual(p.integers.to_list(), [1, 2, 3])
+        self.assertEqual(list(p.integers.to_array()), [1, 2, 3])
+
+        # The items of an object array have their own types - each one is checked
+        self.assertRaises(TypeError, p.integers.extend_from_buffer, numpy.array([1, 2.5, 3], dtype=object))
+        self.assertEqual(p.integers.to_list(), [1, 2, 3])
 
     def test_myid(self):
 
@@ -1213,6 +1291,45 @@ class TestWrapperMethodsRequiringRepository(unittest.TestCase):
 
 
 
+    def test_set_all_links(self):
+
+        persons = [self.repo.create_object(PERSON_TYPE) for i in range(3)]
+        self.ab.person.set_all(persons)
+        self.assertEqual(len(self.ab.person), 3)
+        self.assertEqual(self.ab.person.to_list(), persons)
+        self.failUnless(persons[2].InParents(self.ab))
+
+        self.ab.person.set_all(persons[1:])
+        self.assertEqual(self.ab.person.to_list(), persons[1:])
+        self.failIf(persons[0].InParents(self.ab))
+
+        self.assertRaises(OOIObjectError, self.ab.person.set_all, ['not a wrapper'])
+
+        self.repo.commit('Linked persons')
+        self.assertEqual(self.repo.root_object.person.to_list(), persons[1:])
+
+    def test_shared_link_parents(self):
+
+        person = self.repo.create_object(PERSON_TYPE)
+        for i in range(5):
+            self.ab.person.add()
+            self.ab.person[i] = person
+        self.ab.owner = person
+        self.assertEqual(len(person.ParentLinks), 6)
+
+        # Reading the links again does not add parents
+        for i in range(5):
+            self.assertIdentical(self.ab.person[i], person)
+        self.assertEqual(len(person.ParentLinks), 6)
+        self.assertEqual(self.ab.owner.ObjectType, PERSON_TYPE)
+        self.assertEqual(self.ab.GetLink('owner').type.object_id, PERSON_TYPE.object_id)
+
+    def test_recursive_link(self):
+
+        ab2 = self.repo.create_object(ADDRESSLINK_TYPE)
+        self.ab.owner = ab2
+        self.assertRaises(RepositoryError, setattr, ab2, 'owner', self.ab)
+
     def test_listsetfields_composite(self):
 
 
@@ -10,6 +10,7 @@ Caching mechanisms are now in place. Consider changing the cache size test to lo
 but throw out repositories from the _repo_cache to clear it - that would be better!
 """
 import base64
+import time
 
 from twisted.internet import defer
 
@@ -20,6 +21,7 @@ from ion.core.object import object_utils
 from ion.core.object import repository
 from ion.core.object import gpb_wrapper
 from ion.core.object import association_manager
+from ion.core.object.blob_cache import BlobCache, BLOB_CACHE_SIZE
 from ion.util import procutils as pu
 
 from ion.core.exception import ReceivedError
@@ -32,6 +34,7 @@ import weakref
 # Static entry point for "thread local" context storage during request
 # processing, eg. to retaining user-id from request message
 from ion.core.ioninit import request
+from ion.core import ioninit
 from net.ooici.core.container import container_pb2
 
 
@@ -39,6 +42,10 @@ from ion.util.cache import LRUDict
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
 
+CONF = ioninit.config(__name__)
+CF_release_batch = CONF.getValue('release_batch', 32)
+CF_release_interval = CONF.getValue('release_interval', 1.0)
+CF_release_bytes = CONF.getValue('release_bytes', 10**7)
 
 STRUCTURE_ELEMENT_TYPE = object_utils.create_type_identifier(object_id=1, version=1)
 STRUCTURE_TYPE = object_utils.create_type_identifier(object_id=2, version=1)
@@ -76,6 +83,9 @@ DATA_CHUNK_MESSAGE_TYPE = object_utils.create_type_identifier(object_id=57, vers
 GET_OBJECT_REQUEST_MESSAGE_TYPE = object_utils.create_type_identifier(object_id=55, version=1)
 GET_OBJECT_REPLY_MESSAGE_TYPE = object_utils.create_type_identifier(object_id=56, version=1)
 
+# (repository, remote) pairs whose last acknowledged push is remembered for delta pushes
+PUSH_ACK_CACHE = 1000
+
 class WorkBenchError(ApplicationError):
     """
     An exception class for errors that occur in the Object WorkBench class
@@ -83,7 +93,7 @@ class WorkBenchError(ApplicationError):
 
 class WorkBench(object):
     
-    def __init__(self, process, cache_size=10**7):
+    def __init__(self, process, cache_size=10**7, blob_cache_size=BLOB_CACHE_SIZE):
     
         self._process = process
 
@@ -98,9 +108,32 @@ class WorkBench(object):
 
 
         """
-        A cache - shared between repositories for hashed objects
+        A cache - shared between repositories for hashed objects. Keeps up to
+        blob_cache_size bytes of them serialized once no repository holds them.
         """  
-        self._workbench_cache = weakref.WeakValueDictionary()
+        self._workbench_cache = BlobCache(blob_cache_size)
+
+        # (repository key, remote name) -> (head commit keys, blob keys) of the last push the remote acknowledged
+        self._push_acks = LRUDict(PUSH_ACK_CACHE)
+
+        # Base commit keys of the delta pushes in progress, with a flag set when a remote fetches one
+        self._delta_pushes = []
+
+        # Conversation context -> keys of the repositories tagged with it
+        self._context_repos = {}
+
+        # Ended conversation contexts whose repositories are not released yet -> generation they ended in
+        self._ended = {}
+        self._ended_bytes = 0
+        self._generation = 0
+        self._last_release = time.time()
+
+        self.release_batch = CF_release_batch
+        self.release_interval = CF_release_interval
+        self.release_bytes = CF_release_bytes
+
+        # Conversations ended, releases, repositories released and seconds spent managing them
+        self._release_stats = [0, 0, 0, 0.0]
 
         #@TODO Consider using an index store in the Workbench to keep a cache of associations and keep track of objects
 
@@ -110,6 +143,8 @@ class WorkBench(object):
         '''
         retstr = "/ ==== Workbench info (id:%s) ==========\n" % id(self)
         retstr += "++ Workbench Blob Cache, (len:%d)\n" % len(self._workbench_cache)
+        retstr += "\tserialized: %(blobs)d blobs, %(bytes)d bytes, hits %(hits)d, misses %(misses)d, evictions %(evictions)d\n" % \
+                  self._workbench_cache.stats()
         #for k,v in self._workbench_cache.iteritems():
         #    retstr += "\t%s: %s\n" % (base64.encodestring(k)[0:-1], '')
 
@@ -233,7 +268,15 @@ class WorkBench(object):
 
         repo = self._repos.get(rkey,None)
 
-        if repo is None:
+        if repo is not None and repo.convid_context in self._ended and repo.persistent is False:
+            # Its conversation ended - do what releasing it would have done
+            if repo.cached is False:
+                self.clear_repository(repo)
+                repo = None
+            else:
+                self.put_repository(repo)
+
+        elif repo is None:
 
             try:
                 repo = self._repo_cache.pop(rkey)
@@ -262,6 +305,7 @@ class WorkBench(object):
         repo.clear()
 
         del self._repos[key]
+        self._untag_repository(repo)
 
         # Remove the nickname too - this is dumb - nicknames may be removed anyway. Don't worry about it.
         for k,v in self._repository_nicknames.items():
@@ -282,6 +326,7 @@ class WorkBench(object):
 
         # Delete it from the deterministically held repo dictionary
         del self._repos[key]
+        self._untag_repository(repo)
 
         repo.purge_workspace()
 
@@ -315,6 +360,100 @@ class WorkBench(object):
                     self.cache_repository(repo)
 
 
+    def end_conversation(self, convid_context):
+        """
+        @Brief Mark the end of a conversation. Its repositories are released
+        like manage_workbench_cache does, together with those of the other
+        ended conversations: once release_batch conversations ended,
+        release_interval seconds passed since the last release or they hold
+        more than release_bytes of objects.
+        @param convid_context the conversation context the repositories are tagged with
+        """
+        start = time.time()
+
+        if convid_context not in self._ended:
+            self._ended[convid_context] = self._generation
+            for key in self._context_repos.get(convid_context, ()):
+                repo = self._repos.get(key)
+                if repo is not None:
+                    self._ended_bytes += repo.index_hash.__sizeof__()
+
+        stats = self._release_stats
+        stats[0] += 1
+
+        if len(self._ended) >= self.release_batch or self._ended_bytes >= self.release_bytes or \
+                start - self._last_release >= self.release_interval:
+            self.release_conversations()
+
+        stats[3] += time.time() - start
+
+    def release_conversations(self):
+        """
+        @Brief Clear or cache the repositories of all ended conversations which
+        are not persistent. Starts a new generation of ended conversations.
+        """
+        ended = self._ended
+        self._ended = {}
+        self._ended_bytes = 0
+        self._generation += 1
+        self._last_release = time.time()
+
+        released = 0
+        held = 0
+        for convid_context in ended:
+            kept = set()
+            for key in self._context_repos.pop(convid_context, ()):
+                repo = self._repos.get(key)
+                if repo is None or repo.convid_context != convid_context:
+                    continue
+                elif repo.persistent is True:
+                    kept.add(key)
+                elif repo.cached is False:
+                    self.clear_repository(repo)
+                    released += 1
+                else:
+                    self.cache_repository(repo)
+                    released += 1
+
+            if kept:
+                self._context_repos[convid_context] = kept
+            held += len(kept)
+
+        if held > 0:
+            # Print a warning if someone else is using the persistence tricks...
+            log.warn('The "%s" process is holding persistent state in %d repository objects!',
+                     getattr(self._process, 'proc_name', self._process), held)
+
+        stats = self._release_stats
+        stats[1] += 1
+        stats[2] += released
+
+    def get_cache_stats(self):
+        """
+        @retval dictionary of the cost of managing the repositories by conversation and of what the workbench holds
+        """
+        conversations, releases, released, seconds = self._release_stats
+        return {'conversations':conversations,
+                'releases':releases,
+                'released':released,
+                'seconds':seconds,
+                'generation':self._generation,
+                'pending':len(self._ended),
+                'repositories':len(self._repos),
+                'cached':len(self._repo_cache.d),
+                'cached_bytes':self._repo_cache.total_size,
+                'blobs':self._workbench_cache.stats(),
+                }
+
+    def _untag_repository(self, repo):
+
+        keys = self._context_repos.get(repo.convid_context)
+        if keys is not None:
+            keys.discard(repo.repository_key)
+            if not keys:
+                del self._context_repos[repo.convid_context]
+
+
     def clear(self):
         """
         Completely clean the state or the workbench, wipe any repositories and delete references to them.
@@ -336,6 +475,12 @@ class WorkBench(object):
         # This one is now safe to clear
         self._workbench_cache.clear()
 
+        self._push_acks = LRUDict(PUSH_ACK_CACHE)
+
+        self._context_repos.clear()
+        self._ended.clear()
+        self._ended_bytes = 0
+
 
 
     def put_repository(self,repo):
@@ -343,13 +488,23 @@ class WorkBench(object):
         if repo.repository_key in self._repo_cache:
             raise WorkBenchError('This repository already exists in the workbench cache - that should not happen!')
 
+        old_repo = self._repos.get(repo.repository_key)
+        if old_repo is not None:
+            self._untag_repository(old_repo)
+
         self._repos[repo.repository_key] = repo
         repo.index_hash.cache = self._workbench_cache
         repo._process = self._process
 
         wc = request.get('workbench_context',[])
 
-        repo.convid_context = pu.get_last_or_default(wc, 'Default Context')
+        convid_context = pu.get_last_or_default(wc, 'Default Context')
+        if convid_context in self._ended:
+            # The conversation goes on - keep its repositories until it ends again
+            del self._ended[convid_context]
+
+        repo.convid_context = convid_context
+        self._context_repos.setdefault(convid_context, set()).add(repo.repository_key)
 
        
     def reference_repository(self, repo_key, current_state=False):
@@ -710,11 +865,17 @@ class WorkBench(object):
 
 
     @defer.inlineCallbacks
-    def push(self, origin, repo_or_repos):
+    def push(self, origin, repo_or_repos, full=False):
         """
         Push the current state of the repository.
         When the operation is complete - the transfer of all objects in the
         repository is complete.
+
+        A repository pushed to the same remote before only advertises the keys
+        added since the last push the remote acknowledged, plus the head
+        commits of that push. A remote which no longer has those commits
+        fetches them - the push is then repeated with all keys.
+        @param full Advertise all keys of the repositories
         """
         targetname = self._process.get_scoped_name('system', origin)
 
@@ -744,6 +905,10 @@ class WorkBench(object):
         # Create push message
         pushmsg = yield self._process.message_client.create_instance(PUSH_MESSAGE_TYPE)
 
+        # Head commits of the acknowledged pushes the remote must still have, and what it has after this one
+        base = set()
+        sent = {}
+
 
         #Iterate the list and build the message to send
         for instance in instances:
@@ -768,18 +933,46 @@ class WorkBench(object):
             obj = repostate.Repository._wrap_message_object(head_element._element)
             repostate.repo_head_element = obj
 
-            repostate.blob_keys.extend(self.list_repository_blobs(repo))
+            blob_keys = self.list_repository_blobs(repo)
+            ack_key = (repo.repository_key, targetname)
+
+            ack = None
+            if not full:
+                ack = self._push_acks.get(ack_key)
+
+            if ack is None:
+                repostate.blob_keys.extend(blob_keys)
+            else:
+                base_commits, acked_keys = ack
+                repostate.blob_keys.extend([key for key in blob_keys if key not in acked_keys])
+                repostate.blob_keys.extend(base_commits)
+                base.update(base_commits)
+
+            sent[ack_key] = (frozenset([cref.MyId for cref in repo.current_heads()]), frozenset(blob_keys))
 
+        delta_push = {'base':base, 'mismatch':False}
+        self._delta_pushes.append(delta_push)
         try:
-            result, headers, msg = yield self._process.rpc_send(targetname,'push', pushmsg)
+            try:
+                result, headers, msg = yield self._process.rpc_send(targetname,'push', pushmsg)
 
-            # @TODO Return more info about the result - detect divergence?
-        except ReceivedError, re:
-            
-            log.debug('ReceivedError', str(re))
-            raise WorkBenchError('Push returned an exception! "%s"' % re.msg_content)
+                # @TODO Return more info about the result - detect divergence?
+            except ReceivedError, re:
 
-        
+                log.debug('ReceivedError', str(re))
+                raise WorkBenchError('Push returned an exception! "%s"' % re.msg_content)
+        finally:
+            self._delta_pushes.remove(delta_push)
+
+        if delta_push['mismatch']:
+            log.info('Remote %s is missing the base of a delta push - pushing all keys' % targetname)
+            for ack_key in sent:
+                if ack_key in self._push_acks:
+                    del self._push_acks[ack_key]
+            result = yield self.push(origin, repo_or_repos, full=True)
+            defer.returnValue(result)
+
+        self._push_acks.update(sent)
         defer.returnValue(result)
         # @TODO - check results?
 
@@ -814,9 +1007,7 @@ class WorkBench(object):
             # Get the set of keys in repostate that are not in repo_keys
             need_keys = set(repostate.blob_keys).difference(repo_keys)
 
-            workbench_keys = set(self._workbench_cache.keys())
-
-            local_keys = workbench_keys.intersection(need_keys)
+            local_keys = set([key for key in need_keys if self._workbench_cache.has_key(key)])
 
             for key in local_keys:
                 try:
@@ -917,6 +1108,10 @@ class WorkBench(object):
             if element is None:
                 raise WorkBenchError('Invalid fetch objects request. Key Not Found!', request.ResponseCodes.NOT_FOUND)
 
+            for delta_push in self._delta_pushes:
+                if key in delta_push['base']:
+                    delta_push['mismatch'] = True
+
             link = response.blob_elements.add()
             obj = response.Repository._wrap_message_object(element._element)
 
@@ -1045,35 +1240,35 @@ class WorkBench(object):
         Move everything in new into an updated existing!
         """
         log.debug('_resolve_branch_state: resolving branch state in repository heads!')
+
+        # Get the repository we are working from
+        repo = existing_branch.Repository
+
         for new_link in new_branch.commitrefs.GetLinks():
 
             # An indicator for a fast forward merge made on the existing branch
             found = False
             for existing_link in existing_branch.commitrefs.GetLinks():
 
-                # Get the repositories we are working from
-                repo = existing_branch.Repository
-
                 # test to see if we these are the same head ref!
                 if new_link == existing_link:
                     # If these branches have the same state we are good - continue to the next new cref in the new branch.
                     break
 
-                # Look in the commit index of the existing repo to see if the head of the received message is an old commit
-                # This works one way but not the other - it is a short cut!
-                elif repo._commit_index.has_key(new_link.key):
+                # A known commit may be in the history of the existing head
+                elif repo._commit_index.has_key(new_link.key) and repo.is_ancestor(new_link.key, existing_link.key):
                     # The branch in new_repo is out of date with what exists here.
                     # We can completely ignore the new link!
                     break
 
-                # Look in the commit index of the new repo to see if the existing link is an old commit in new repository
+                # Look in the history of the new head for the existing head
                 else:
 
-                    self._load_commits(new_link) # Load the new ancestors!
-                    existing_cref = repo.get_linked_object(existing_link)
-                    new_cref = repo.get_linked_object(new_link)
+                    # Load both heads - is_ancestor indexes the new ancestors which are not indexed yet
+                    repo.get_linked_object(new_link)
+                    repo.get_linked_object(existing_link)
 
-                    if existing_cref.InParents(new_cref):
+                    if repo.is_ancestor(existing_link.key, new_link.key):
 
                         # The existing repo can be fast forwarded to the new state!
                         # But we must keep looking through the existing_links to see if the push merges our state!
@@ -1090,7 +1285,7 @@ class WorkBench(object):
                 # The branch has diverged and must be reconciled!
                 if not found:
                     bref = existing_branch.commitrefs.add()
-                    new_cref = new_repo._commit_index.get(new_link.key)
+                    new_cref = repo.get_linked_object(new_link)
                     bref.SetLink(new_cref)
 
 
@@ -1114,29 +1309,3 @@ class WorkBench(object):
         # Note this in the branches merge on read field and punt this to some
         # other part of the process.
         return
-
-
-
-    def _load_commits(self, link):
-                
-        log.debug('_load_commits: Loading all commits in the repository')
-
-        repo = link.Repository
-
-        try:
-            cref = repo.get_linked_object(link)
-        except repository.RepositoryError, ex:
-            log.debug(ex)
-            raise WorkBenchError('Commit id not found while loding commits: \n %s' % link.key)
-            # This commit ref was not actually sent!
-            
-        if cref.ObjectType != COMMIT_TYPE:
-            raise WorkBenchError('This method should only load commits!')
-            
-        for parent in cref.parentrefs:
-            link = parent.GetLink('commitref')
-            # Call this method recursively for each link
-            self._load_commits(link)
-        
-        log.debug('_load_commits: Loaded all commits!')
-
@@ -6,6 +6,7 @@
 @brief base classes for processes within a capability container
 """
 
+import time
 import traceback
 from twisted.internet import defer
 from twisted.internet import reactor
@@ -17,7 +18,7 @@ import StringIO
 
 import logging
 import ion.util.ionlog
-log = ion.util.ionlog.getLogger(__name__)
+log = ion.util.ionlog.getIonLogger(__name__)
 
 from ion.core import ioninit
 from ion.core.exception import ReceivedError, ApplicationError, ReceivedApplicationError, ReceivedContainerError
@@ -34,6 +35,7 @@ from ion.interact.request import RequestType
 from ion.interact.rpc import RpcType, GenericType
 from ion.util.context import StackLocal
 import ion.util.procutils as pu
+from ion.util import metrics
 from ion.util.state_object import BasicLifecycleObject, BasicStates
 
 from ion.core.object import workbench
@@ -176,7 +178,8 @@ class Process(BasicLifecycleObject):
 
         #The data object Workbench for all object repositories used by this process
         cache_size = int(spawnargs.get('cache_size', 10**7))
-        self.workbench = workbench.WorkBench(self, cache_size=cache_size)
+        blob_cache_size = int(spawnargs.get('blob_cache_size', workbench.BLOB_CACHE_SIZE))
+        self.workbench = workbench.WorkBench(self, cache_size=cache_size, blob_cache_size=blob_cache_size)
 
         # Create a message Client
         self.message_client = MessageClient(proc=self)
@@ -192,8 +195,14 @@ class Process(BasicLifecycleObject):
         self._plcc_pub = ProcessLifecycleEventPublisher(origin=self.id.full, process=self)
         self.add_life_cycle_object(self._plcc_pub)
 
-        log.debug("NEW Process instance [%s]: id=%s, sup-id=%s, sys-name=%s" % (
-                self.proc_name, self.id, self.proc_supid, self.sys_name))
+        # Table of operation name -> op_ handler, shared by all instances of this class
+        self._op_table = self._get_op_table()
+
+        # Per operation statistics: op name -> [count, errors, cumulative seconds]
+        self._op_stats = {}
+
+        log.debug("NEW Process instance [%s]: id=%s, sup-id=%s, sys-name=%s",
+                self.proc_name, self.id, self.proc_supid, self.sys_name)
 
     # --- Life cycle management
     # Categories:
@@ -223,7 +232,7 @@ class Process(BasicLifecycleObject):
         @retval Deferred for the Id of the process (self.id)
         """
         assert not self.backend_receiver.consumer, "Process already initialized"
-        log.debug('Process [%s] id=%s initialize()' % (self.proc_name, self.id))
+        log.debug('Process [%s] id=%s initialize()', self.proc_name, self.id)
 
         # Create queue only for process receiver
         yield self.receiver.initialize()
@@ -243,9 +252,9 @@ class Process(BasicLifecycleObject):
         try:
             #import pdb; pdb.set_trace()
             yield defer.maybeDeferred(self.plc_init)
-            log.info('Process [%s] id=%s: INIT OK' % (self.proc_name, self.id))
+            log.info('Process [%s] id=%s: INIT OK', self.proc_name, self.id)
         except Exception, ex:
-            log.exception('----- Process %s INIT ERROR -----' % (self.id))
+            log.exception('----- Process %s INIT ERROR -----', self.id)
             raise ex
 
         if len(self._registered_life_cycle_objects) > pre_init_lco_len:
@@ -282,7 +291,7 @@ class Process(BasicLifecycleObject):
         LifeCycleObject callback for activate
         @retval Deferred
         """
-        log.debug('Process [%s] id=%s activate()' % (self.proc_name, self.id))
+        log.debug('Process [%s] id=%s activate()', self.proc_name, self.id)
 
         # Create consumer for process receiver
         yield self.receiver.activate()
@@ -298,7 +307,7 @@ class Process(BasicLifecycleObject):
         try:
             yield defer.maybeDeferred(self.plc_activate)
         except Exception, ex:
-            log.exception('----- Process %s ACTIVATE ERROR -----' % (self.id))
+            log.exception('----- Process %s ACTIVATE ERROR -----', self.id)
             raise ex
 
         if len(self._registered_life_cycle_objects) > pre_active_lco_len:
@@ -315,7 +324,7 @@ class Process(BasicLifecycleObject):
         """
 
     def shutdown(self):
-        log.debug("[%s] shutdown()" % self.proc_name)
+        log.debug("[%s] shutdown()", self.proc_name)
         return self.terminate()
 
     @defer.inlineCallbacks
@@ -329,7 +338,7 @@ class Process(BasicLifecycleObject):
                 yield self.reply_ok(msg)
         except Exception, ex:
 
-            log.error('Error during op_terminate: ' + str(ex))
+            log.error('Error during op_terminate: %s', ex)
             raise ProcessError("Process %s TERMINATE ERROR" % (self.id))
             ### Let the mesg dispatcher catch the error
             #if msg != None:
@@ -376,7 +385,7 @@ class Process(BasicLifecycleObject):
         yield self.shutdown_child_procs()
 
         yield defer.maybeDeferred(self.plc_terminate)
-        log.info('----- Process %s TERMINATED -----' % (self.proc_name))
+        log.info('----- Process %s TERMINATED -----', self.proc_name)
 
     def plc_terminate(self):
         """
@@ -398,7 +407,7 @@ class Process(BasicLifecycleObject):
                 log.debug("Error terminating registered LCOs, ignoring...")
 
         if cause:
-            log.error("Process error: %s" % cause)
+            log.error("Process error: %s", cause)
             pass
         else:
             raise RuntimeError("Illegal process state change")
@@ -417,6 +426,12 @@ class Process(BasicLifecycleObject):
         """
         yield self.reply_ok(msg, {'pong':'pong'}, {'quiet':True})
 
+    def op_stats(self, content, headers, msg):
+        """
+        Service operation: reply with the per operation message statistics of this process
+        """
+        return self.reply_ok(msg, self.get_op_stats())
+
     #    @defer.inlineCallbacks
     def op_sys_procexit(self, content, headers, msg):
         """
@@ -497,7 +512,7 @@ class Process(BasicLifecycleObject):
         transitions = [BasicStates.E_INITIALIZE,    BasicStates.E_ACTIVATE,     BasicStates.E_TERMINATE]
 
         curidx = states.index(curstate)
-        log.debug("_advance_lco owning process (%s) is in state %s" % (self.id.full, curstate))
+        log.debug("_advance_lco owning process (%s) is in state %s", self.id.full, curstate)
 
         @defer.inlineCallbacks
         def helper(idx, lco):
@@ -508,12 +523,12 @@ class Process(BasicLifecycleObject):
             LCOs that happen to be later in the registered list.
             """
             lcoidx = states.index(lco._get_state())
-            log.debug("_advance_lco cur lco #%d is in state %s" % (idx, lco._get_state()))
+            log.debug("_advance_lco cur lco #%d is in state %s", idx, lco._get_state())
 
             for i in range(lcoidx, curidx):
                 input = transitions[i]
 
-                log.debug("_advance_lco cur lco #%d about to put transition %s to %s" % (idx, input, str(lco)))
+                log.debug("_advance_lco cur lco #%d about to put transition %s to %s", idx, input, lco)
                 try:
                     yield defer.maybeDeferred(lco._so_process, input)
 
@@ -521,10 +536,10 @@ class Process(BasicLifecycleObject):
                     # @TODO: should not be catching this exception.
                     # This should cause the deferred gen'd by inlineCallbacks to errback, which then gets wrapped
                     # nicely by the deferred list. It should not throw an exception in the state object?!?
-                    log.debug("Exception occured in transition! Leaving this LCO as is. Ex: %s" % str(ex))
+                    log.debug("Exception occured in transition! Leaving this LCO as is. Ex: %s", ex)
                     break
 
-                log.debug("lco #%d is now at %s" % (idx, lco._get_state()))
+                log.debug("lco #%d is now at %s", idx, lco._get_state())
 
             defer.returnValue(None)
 
@@ -552,40 +567,27 @@ class Process(BasicLifecycleObject):
             # Check if there is a user id in the header, stash if so
             _pre_uid = payload.get('user-id', None)
             _pre_exp = payload.get('expiry', None)
-            _action = ''
             if 'user-id' in payload:
-                request.user_id = payload.get('user-id')
-                _action = 'set user_id'
-            else:
-                log.debug('[%s] receive(): payload anonymous request' % (self.proc_name))
-                if request.get('user_id', 'Not set') == 'Not set':
-                    request.user_id = 'ANONYMOUS'
-                    _action = 'set ANONYMOUS user_id'
-                else:
-                    _action = "keep stashed user_id='%s'" % request.get('user_id')
-            _post_uid = request.get('user_id')
+                request.user_id = _pre_uid
+            elif request.get('user_id', 'Not set') == 'Not set':
+                request.user_id = 'ANONYMOUS'
 
             # User session expiry.
             if 'expiry' in payload:
-                request.expiry = payload.get('expiry')
-                _action = _action + '/set expiry'
-            else:
-                if request.get('expiry', 'Not set') == 'Not set':
-                    request.expiry = '0'
-                    _action = _action + '/set 0 expiry'
-                else:
-                    _action = _action + "/keep stashed expiry='%s'" % request.get('expiry')
-            _post_exp = request.get('expiry')
+                request.expiry = _pre_exp
+            elif request.get('expiry', 'Not set') == 'Not set':
+                request.expiry = '0'
 
-            log.debug("[%s] receive(): IN:user-id='%s',expiry='%s' ACTION:%s SET:user-id='%s',expiry='%s'" % (
-                self.proc_name, _pre_uid, _pre_exp, _action, _post_uid, _post_exp))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("[%s] receive(): IN:user-id='%s',expiry='%s' SET:user-id='%s',expiry='%s'",
+                    self.proc_name, _pre_uid, _pre_exp, request.get('user_id'), request.get('expiry'))
 
             # Extract some headers and make log statement.
             fromname = payload['sender']
             if 'sender-name' in payload:
                 fromname = payload['sender-name']   # Legible sender alias
-            log.info('>>> [%s] receive(): Message from [%s] ... >>>' % (
-                     self.proc_name, fromname))
+            log.info('>>> [%s] receive(): Message from [%s] ... >>>',
+                     self.proc_name, fromname)
             convid = payload.get('conv-id', None)
             protocol = payload.get('protocol', None)
 
@@ -675,8 +677,8 @@ class Process(BasicLifecycleObject):
             # In case of an application error - do not terminate the process!
             if log.getEffectiveLevel() <= logging.INFO:    # only output all this stuff when debugging
                 log.exception("*****Non Conversation Application error in message processing*****")
-                log.error('*** Message Payload which cause the error: \n%s' % pu.pprint_to_string(headers))
-                log.error('*** Message Content: \n%s' % str(headers.get('content', '## No Content! ##')))
+                log.error('*** Message Payload which cause the error: \n%s', ion.util.ionlog.DeferredStr(pu.pprint_to_string, headers))
+                log.error('*** Message Content: \n%s', headers.get('content', '## No Content! ##'))
                 log.error("*****End Non Conversation Application error in message processing*****")
 
             # @todo Should we send an err or rather reject the msg?
@@ -688,9 +690,9 @@ class Process(BasicLifecycleObject):
             # *** PROBLEM. Here the conversation is in ERROR state
 
             log.exception("*****Non Conversation Application error in message processing*****")
-            log.error('*** Message Payload which cause the error: \n%s' % pu.pprint_to_string(headers))
+            log.error('*** Message Payload which cause the error: \n%s', ion.util.ionlog.DeferredStr(pu.pprint_to_string, headers))
             if log.getEffectiveLevel() <= logging.WARN:
-                log.error('*** Message Content: \n%s' % str(headers.get('content', '## No Content! ##')))
+                log.error('*** Message Content: \n%s', headers.get('content', '## No Content! ##'))
             log.error("*****End Non Conversation Application error in message processing*****")
 
             # @todo Should we send an err or rather reject the msg?
@@ -711,37 +713,88 @@ class Process(BasicLifecycleObject):
                 yield msg.ack()
 
 
+    @classmethod
+    def _get_op_table(cls):
+        """
+        Returns the dispatch table of operation name -> op_ function for this
+        class. The table is built once per class, on first use.
+        """
+        # Look in the class dict only - a subclass must not reuse the table of its base class
+        table = cls.__dict__.get('_op_dispatch_table', None)
+        if table is None:
+            table = {}
+            for name in dir(cls):
+                if name.startswith('op_'):
+                    func = getattr(cls, name)
+                    if callable(func):
+                        table[name[3:]] = func
+            cls._op_dispatch_table = table
+        return table
+
     def _dispatch_message_op(self, payload, msg, conv):
         if "op" in payload:
-            op = payload['op']
-            opname = 'op_' + str(op)
-            return self._dispatch_message_call(payload, msg, conv, opname)
+            op = str(payload['op'])
+            return self._dispatch_message_call(payload, msg, conv, op)
         else:
             log.error("Invalid message. No 'op' in header", payload)
 
     @defer.inlineCallbacks
-    def _dispatch_message_call(self, payload, msg, conv, opname):
+    def _dispatch_message_call(self, payload, msg, conv, op):
         """
         Dispatch of messages to handler callback functions within this
         Process instance. If handler is not present, use op_none.
+        Records the count, errors and cumulative time of each operation, and
+        the latency in the metrics registry if enabled.
         @retval Deferred
         """
         content = payload.get('content','')
-        # dynamically invoke the operation in the given class
-        if hasattr(self, opname):
-            opf = getattr(self, opname)
+
+        # An op_ handler set on the instance takes precedence over the class
+        opf = self.__dict__.get('op_' + op, None)
+        if opf is None:
+            func = self._op_table.get(op, None)
+            if func is None:
+                func = self._op_table.get('none', None)
+                if func is None:
+                    # Change to Raise?
+                    assert False, "Cannot dispatch to operation"
+            opf = func.__get__(self, self.__class__)
+
+        stats = self._op_stats.get(op, None)
+        if stats is None:
+            stats = self._op_stats[op] = [0, 0, 0.0]
+
+        start = time.time()
+        try:
             yield defer.maybeDeferred(opf, content, payload, msg)
-        elif hasattr(self,'op_none'):
-            yield defer.maybeDeferred(self.op_none, content, payload, msg)
-        else:
-            # Change to Raise?
-            assert False, "Cannot dispatch to operation"
+        except Exception:
+            stats[1] += 1
+            raise
+        finally:
+            elapsed = time.time() - start
+            stats[0] += 1
+            stats[2] += elapsed
+            if metrics.registry.enabled:
+                metrics.registry.record('op.%s.%s' % (self.__class__.__name__, op), elapsed)
+
+    def get_op_stats(self):
+        """
+        Returns the message statistics of this process as a dict of
+        op name -> dict(count, errors, total_ms, avg_ms)
+        """
+        result = {}
+        for op, (count, errors, total) in self._op_stats.iteritems():
+            result[op] = {'count':count,
+                          'errors':errors,
+                          'total_ms':total * 1000.0,
+                          'avg_ms':(total * 1000.0 / count) if count else 0.0}
+        return result
 
     def op_none(self, content, headers, msg):
         """
         The method called if operation callback handler is not existing
         """
-        log.error('Process does not define op=%s' % headers.get('op',None))
+        log.error('Process does not define op=%s', headers.get('op',None))
 
     # --- Standard conversation type support: RPC, Request
 
@@ -753,16 +806,31 @@ class Process(BasicLifecycleObject):
         rpc_conv.bind_role_local(RpcType.ROLE_INITIATOR.role_id, self)
         rpc_conv.bind_role(RpcType.ROLE_PARTICIPANT.role_id, recv)
 
-        log.debug("[%s] request(): NEW conversation type=%s as initiator -> participant=%s" % (
-                self.proc_name, rpc_conv.protocol, recv))
+        log.debug("[%s] request(): NEW conversation type=%s as initiator -> participant=%s",
+                self.proc_name, rpc_conv.protocol, recv)
 
         if headers is None:
             headers = {}
         headers['protocol'] = rpc_conv.protocol
         headers['performative'] = 'request'
-        return self._blocking_send(recv=recv, operation=operation,
-                                   content=content, headers=headers,
-                                   conv=rpc_conv, **kwargs)
+        d = self._blocking_send(recv=recv, operation=operation,
+                                content=content, headers=headers,
+                                conv=rpc_conv, **kwargs)
+        if metrics.registry.enabled:
+            d.addBoth(self._record_rpc, operation, time.time())
+        return d
+
+    def _record_rpc(self, result, operation, start):
+        """
+        Records the round trip time of an RPC in the metrics registry
+        """
+        metrics.registry.record('rpc.%s' % operation, time.time() - start)
+        if isinstance(result, failure.Failure):
+            if result.check(defer.TimeoutError):
+                metrics.registry.inc('rpc.timeouts')
+            else:
+                metrics.registry.inc('rpc.errors')
+        return result
 
     def request(self, receiver, action, content, headers=None, **kwargs):
         """
@@ -778,8 +846,8 @@ class Process(BasicLifecycleObject):
         req_conv.bind_role_local(RequestType.ROLE_INITIATOR.role_id, self)
         req_conv.bind_role(RequestType.ROLE_PARTICIPANT.role_id, receiver)
 
-        log.debug("[%s] request(): NEW conversation type=%s as initiator -> participant=%s" % (
-                self.proc_name, req_conv.protocol, receiver))
+        log.debug("[%s] request(): NEW conversation type=%s as initiator -> participant=%s",
+                self.proc_name, req_conv.protocol, receiver)
 
         if headers is None:
             headers = {}
@@ -809,14 +877,14 @@ class Process(BasicLifecycleObject):
         # Timeout handling
         timeout = float(kwargs.get('timeout', CF_rpc_timeout))
         def _timeoutf():
-            log.warn("Process %s RPC conv-id=%s timed out! " % (self.proc_name,conv.conv_id))
-            p_headers = pu.pprint_to_string(headers)
-            p_content = pu.pprint_to_string(content)
+            log.warn("Process %s RPC conv-id=%s timed out! ", self.proc_name,conv.conv_id)
+            p_headers = ion.util.ionlog.DeferredStr(pu.pprint_to_string, headers)
+            p_content = ion.util.ionlog.DeferredStr(pu.pprint_to_string, content)
 
-            log.info('Timedout Message Receive: %s' % recv)
-            log.info('Timedout Message Headers: %s' % p_headers)
-            log.info('Timedout Message Operation: %s' % operation)
-            log.info('Timedout Message Content: %s' % p_content)
+            log.info('Timedout Message Receive: %s', recv)
+            log.info('Timedout Message Headers: %s', p_headers)
+            log.info('Timedout Message Operation: %s', operation)
+            log.info('Timedout Message Content: %s', p_content)
 
             # Remove RPC. Delayed result will go to catch operation
             conv.timeout = str(pu.currenttime_ms())
@@ -865,14 +933,14 @@ class Process(BasicLifecycleObject):
 
         if not 'user-id' in msgheaders:
             msgheaders['user-id'] = request.get('user_id', 'ANONYMOUS')
-            log.debug('[%s] send(): set user id in msgheaders from stashed user_id [%s]' % (self.proc_name, msgheaders['user-id']))
+            log.debug('[%s] send(): set user id in msgheaders from stashed user_id [%s]', self.proc_name, msgheaders['user-id'])
         else:
-            log.debug('[%s] send(): using user id from msgheaders [%s]' % (self.proc_name, msgheaders['user-id']))
+            log.debug('[%s] send(): using user id from msgheaders [%s]', self.proc_name, msgheaders['user-id'])
         if not 'expiry' in msgheaders:
             msgheaders['expiry'] = request.get('expiry', '0')
-            log.debug('[%s] send(): set expiry in msgheaders from stashed expiry [%s]' % (self.proc_name, msgheaders['expiry']))
+            log.debug('[%s] send(): set expiry in msgheaders from stashed expiry [%s]', self.proc_name, msgheaders['expiry'])
         else:
-            log.debug('[%s] send(): using expiry from msgheaders [%s]' % (self.proc_name, msgheaders['expiry']))
+            log.debug('[%s] send(): using expiry from msgheaders [%s]', self.proc_name, msgheaders['expiry'])
 
         if quiet:
             msgheaders['quiet'] = True
@@ -916,7 +984,7 @@ class Process(BasicLifecycleObject):
 
             res = res1
         except Exception, ex:
-            log.exception("ERROR [%s] send() in FSM - Message not sent" % self.proc_name)
+            log.exception("ERROR [%s] send() in FSM - Message not sent", self.proc_name)
             raise ex
 
         defer.returnValue(res)
@@ -937,7 +1005,7 @@ class Process(BasicLifecycleObject):
         msgheaders['protocol'] = req_msg['protocol']
 
         if recv is None:
-            log.error('No reply-to given for message '+str(msg))
+            log.error('No reply-to given for message %s', msg)
         else:
             msgheaders['conv-id'] = req_msg.get('conv-id','')
             msgheaders['conv-seq'] = int(req_msg.get('conv-seq',0)) + 1
@@ -1093,13 +1161,13 @@ class Process(BasicLifecycleObject):
     @defer.inlineCallbacks
     def shutdown_child_procs(self):
         if len(self.child_procs) > 0:
-            log.info("Shutting down %s child processes" % (len(self.child_procs)))
+            log.info("Shutting down %s child processes", len(self.child_procs))
         while len(self.child_procs) > 0:
             child = self.child_procs.pop()
             try:
                 res = yield self.shutdown_child(child)
             except Exception, ex:
-                log.exception("Error terminating child %s" % child.proc_id)
+                log.exception("Error terminating child %s", child.proc_id)
 
 
     def shutdown_child(self, childproc):
@@ -1268,7 +1336,7 @@ class ProcessDesc(BasicLifecycleObject):
                 node=self.proc_node,
                 activate=activate)
 
-        log.info("Process %s ID: %s" % (self.proc_class, self.proc_id))
+        log.info("Process %s ID: %s", self.proc_class, self.proc_id)
 
         defer.returnValue(self.proc_id)
 
@@ -1294,7 +1362,7 @@ class ProcessDesc(BasicLifecycleObject):
 
     def on_error(self, cause=None, *args, **kwargs):
         if cause:
-            log.error("ProcessDesc error: %s" % cause)
+            log.error("ProcessDesc error: %s", cause)
             pass
         else:
             raise RuntimeError("Illegal state change for ProcessDesc")
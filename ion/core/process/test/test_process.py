@@ -28,6 +28,7 @@ import ion.util.procutils as pu
 
 from ion.core.process.test import life_cycle_process
 from ion.util import state_object
+from ion.util import metrics
 
 class ProcessTest(IonTestCase):
     """
@@ -227,6 +228,58 @@ class ProcessTest(IonTestCase):
         yield self.failUnlessFailure(self.test_sup.rpc_send(pid1,'echo_apperror','content123'), ReceivedApplicationError)
 
 
+    def test_op_table(self):
+        table = EchoProcess._get_op_table()
+        self.assertIn('echo', table)
+        self.assertIn('ping', table)
+        self.assertIn('stats', table)
+
+        # The table is built once per class and is not shared with the base class
+        self.assertIdentical(EchoProcess._get_op_table(), table)
+        self.assertNotIn('echo', Process._get_op_table())
+
+    @defer.inlineCallbacks
+    def test_op_stats(self):
+        child1 = ProcessDesc(name='echo', module='ion.core.process.test.test_process')
+        pid1 = yield self.test_sup.spawn_child(child1)
+
+        yield self.test_sup.rpc_send(pid1,'echo','content123')
+        yield self.test_sup.rpc_send(pid1,'echo','content123')
+        yield self.failUnlessFailure(self.test_sup.rpc_send(pid1,'echo_exception','content123'), ReceivedContainerError)
+
+        (stats,hdrs,msg) = yield self.test_sup.rpc_send(pid1,'stats',None)
+        self.assertEqual(stats['echo']['count'], 2)
+        self.assertEqual(stats['echo']['errors'], 0)
+        self.assertEqual(stats['echo_exception']['count'], 1)
+        self.assertEqual(stats['echo_exception']['errors'], 1)
+        self.assertTrue(stats['echo']['total_ms'] >= 0)
+
+    @defer.inlineCallbacks
+    def test_metrics(self):
+        child1 = ProcessDesc(name='echo', module='ion.core.process.test.test_process')
+        pid1 = yield self.test_sup.spawn_child(child1)
+
+        metrics.registry.enable()
+        metrics.registry.clear()
+        try:
+            yield self.test_sup.rpc_send(pid1,'echo','content123')
+            yield self.failUnlessFailure(self.test_sup.rpc_send(pid1,'echo_exception','content123'), ReceivedContainerError)
+        finally:
+            metrics.registry.disable()
+
+        snapshot = metrics.registry.snapshot()
+        histograms = snapshot['histograms']
+        self.assertEqual(histograms['rpc.echo']['count'], 1)
+        self.assertEqual(histograms['op.EchoProcess.echo']['count'], 1)
+        self.assertEqual(histograms['op.EchoProcess.echo_exception']['count'], 1)
+        self.assertTrue(histograms['receiver.receive']['count'] >= 2)
+        self.assertTrue(histograms['interceptor.in.ionmessage']['count'] >= 2)
+        self.assertEqual(snapshot['counters']['rpc.errors'], 1)
+
+        # Nothing is recorded while disabled
+        yield self.test_sup.rpc_send(pid1,'echo','content123')
+        self.assertEqual(metrics.registry.histogram('rpc.echo').count, 1)
+
     @defer.inlineCallbacks
     def test_send_byte_string(self):
         """
@@ -7,6 +7,8 @@
     interaction patterns)
 """
 
+from collections import deque
+
 from twisted.python import failure
 from twisted.python.reflect import namedAny
 from zope.interface import implements, Interface
@@ -22,9 +24,56 @@ import ion.util.procutils as pu
 CONF = ioninit.config(__name__)
 CF_basic_conv_types = CONF['basic_conv_types']
 
+# Conversation message log levels
+CONV_LOG_OFF = 'off'          # Do not log conversation messages
+CONV_LOG_HEADERS = 'headers'  # Log only the summary headers (sender, receiver, protocol, performative, op, user-id, status)
+CONV_LOG_RING = 'ring'        # Log the headers of the last conv_log_size messages of each conversation
+CONV_LOG_FULL = 'full'        # Log the headers of all messages of each conversation
+
+CF_conv_log_mode = CONF.getValue('conv_log_mode', CONV_LOG_RING)
+CF_conv_log_size = CONF.getValue('conv_log_size', 16)
+
 # Conversation type id for no conversation use.
 CONV_TYPE_NONE = "none"
 
+# Header fields kept when logging with CONV_LOG_HEADERS, in order
+SUMMARY_HEADERS = ('sender', 'receiver', 'protocol', 'performative', 'op', 'user-id', 'status')
+
+
+class HeaderSnapshot(dict):
+    """
+    Immutable copy of the headers of a message, without the content, so
+    that a conversation log record does not keep the message content alive.
+    """
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('HeaderSnapshot is immutable')
+
+    __setitem__ = __delitem__ = clear = update = setdefault = pop = popitem = _immutable
+
+EMPTY_HEADERS = HeaderSnapshot()
+
+def header_snapshot(message):
+    """
+    @brief Returns a HeaderSnapshot of the headers of an in-memory standard
+        message object.
+    """
+    hdrs = message.get('headers', None)
+    if hdrs and type(hdrs) is dict:
+        return HeaderSnapshot((k, v) for (k, v) in hdrs.iteritems() if k != 'content')
+    elif isinstance(hdrs, HeaderSnapshot):
+        return hdrs
+    return EMPTY_HEADERS
+
+def summary_headers(message):
+    """
+    @brief Returns the SUMMARY_HEADERS values of an in-memory standard message
+        object as a tuple.
+    """
+    hdrs = message.get('headers', None)
+    if not hdrs or not hasattr(hdrs, 'get'):
+        hdrs = EMPTY_HEADERS
+    return tuple(hdrs.get(key, None) for key in SUMMARY_HEADERS)
+
 class IConversationType(Interface):
     """
     Interface for all conversation type instances
@@ -89,6 +138,7 @@ class Conversation(object):
         self.blocking_deferred = None
         # Marks a timeout in the conversation processing
         self.timeout = None
+        # Log of message records, see ProcessConversationManager.log_conv_message
         self.conv_log = []
 
     def bind_role_local(self, role_id, process):
@@ -115,10 +165,12 @@ class Conversation(object):
             self.protocol, self.conv_id, self.local_fsm._get_state(), self.local_process.proc_name, len(self.conv_log))
         for msg_rec in self.conv_log:
             (ts, mtype, cstate, mhdrs) = msg_rec
-            hstr = "%s -> %s %s:%s:%s; uid=%s, status=%s" % (mhdrs.get('sender',None),
-                    mhdrs.get('receiver',None), mhdrs.get('protocol',None),
-                    mhdrs.get('performative',None), mhdrs.get('op',None),
-                    mhdrs.get('user-id',None), mhdrs.get('status',None))
+            if isinstance(mhdrs, tuple):
+                # Logged with CONV_LOG_HEADERS - the values of SUMMARY_HEADERS
+                summary = mhdrs
+            else:
+                summary = tuple(mhdrs.get(key, None) for key in SUMMARY_HEADERS)
+            hstr = "%s -> %s %s:%s:%s; uid=%s, status=%s" % summary
             mstr = " %d %s: %s >> %s\n" % (ts, mtype, hstr, cstate)
             res = res + mstr
         res = res + "]"
@@ -271,11 +323,23 @@ class ProcessConversationManager(object):
     @brief Oversees a set of conversations, e.g. within a process instance
     """
 
-    def __init__(self, process):
+    def __init__(self, process, log_mode=None, log_size=None):
+        """
+        @param process the process owning the conversations
+        @param log_mode the conversation message log level, one of the CONV_LOG_* values. Defaults to the
+            conv_log_mode config value.
+        @param log_size the number of messages kept per conversation for CONV_LOG_RING. Defaults to the
+            conv_log_size config value.
+        """
         self.process = process
         self.conversations = {}
         self.conv_mgr = conv_mgr_instance
 
+        self.log_mode = log_mode or CF_conv_log_mode
+        self.log_size = int(log_size or CF_conv_log_size)
+        if self.log_mode not in (CONV_LOG_OFF, CONV_LOG_HEADERS, CONV_LOG_RING, CONV_LOG_FULL):
+            raise ConversationError("Invalid conversation log mode: %s" % self.log_mode)
+
     def msg_send(self, message):
         """
         @brief Trigger the FSM for a to-be-sent message and delegate all checking
@@ -308,6 +372,8 @@ class ProcessConversationManager(object):
     def new_conversation(self, conv_type_id, conv_id=None):
         conv_id = conv_id or self.create_conversation_id()
         conv_inst = self.conv_mgr.new_conversation(conv_type_id, conv_id)
+        if self.log_mode == CONV_LOG_RING:
+            conv_inst.conv_log = deque(maxlen=self.log_size)
         self.conversations[conv_inst.conv_id] = conv_inst
         return conv_inst
 
@@ -346,16 +412,18 @@ class ProcessConversationManager(object):
         return conv
 
     def log_conv_message(self, conv, message, msgtype):
-        # Tuple of Timestamp (MS), type, message
-        if conv is None:
+        """
+        @brief Records a message in the conversation log according to the log mode.
+            The record is a tuple of timestamp (ms), type, conversation state and
+            headers - either the HeaderSnapshot of the message or, for
+            CONV_LOG_HEADERS, the tuple of SUMMARY_HEADERS values.
+        """
+        if conv is None or self.log_mode == CONV_LOG_OFF:
             return
-        hdrs = message.get('headers',{})
-        if hdrs and type(hdrs) is dict:
-            mhdrs = hdrs.copy()
-            if 'content' in mhdrs:
-                del mhdrs['content']
+        if self.log_mode == CONV_LOG_HEADERS:
+            mhdrs = summary_headers(message)
         else:
-            mhdrs = {}
+            mhdrs = header_snapshot(message)
         msg_rec = (pu.currenttime_ms(), msgtype, conv.local_fsm._get_state(), mhdrs)
         conv.conv_log.append(msg_rec)
 
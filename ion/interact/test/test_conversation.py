@@ -15,7 +15,8 @@ from ion.core import ioninit
 from ion.core.process.process import Process, ProcessDesc, ProcessFactory
 from ion.core.cc.container import Container
 from ion.core.exception import ReceivedError, ConversationError
-from ion.interact.conversation import Conversation, ConversationType, conv_mgr_instance
+from ion.interact.conversation import Conversation, ConversationType, conv_mgr_instance, ProcessConversationManager, \
+        HeaderSnapshot, CONV_LOG_OFF, CONV_LOG_HEADERS, CONV_LOG_RING, CONV_LOG_FULL
 from ion.interact.request import RequestType, Request
 from ion.interact.rpc import RpcType, Rpc
 from ion.test.iontest import IonTestCase, ReceiverProcess
@@ -73,3 +74,40 @@ class ConversationTest(IonTestCase):
         req_conv = conv_mgr.new_conversation(RequestType.CONV_TYPE_REQUEST)
         req_conv.bind_role_local(RequestType.ROLE_INITIATOR.role_id, proc1)
         req_conv.bind_role(RequestType.ROLE_PARTICIPANT.role_id, pid2)
+
+    @defer.inlineCallbacks
+    def test_conv_log_modes(self):
+        proc1 = Process()
+        pid1 = yield proc1.spawn()
+
+        def log_messages(conv_mgr, count):
+            conv = conv_mgr.new_conversation(RpcType.CONV_TYPE_RPC)
+            conv.bind_role_local(RpcType.ROLE_INITIATOR.role_id, proc1)
+            for i in range(count):
+                message = dict(headers={'sender':'me', 'receiver':'you', 'op':'op%d' % i, 'content':'big'})
+                conv_mgr.log_conv_message(conv, message, msgtype='SENT')
+            return conv
+
+        conv = log_messages(ProcessConversationManager(proc1, log_mode=CONV_LOG_OFF), 5)
+        self.assertEqual(len(conv.conv_log), 0)
+
+        conv = log_messages(ProcessConversationManager(proc1, log_mode=CONV_LOG_HEADERS), 5)
+        self.assertEqual(len(conv.conv_log), 5)
+        (ts, mtype, cstate, mhdrs) = conv.conv_log[0]
+        self.assertEqual(mhdrs, ('me', 'you', None, None, 'op0', None, None))
+
+        conv = log_messages(ProcessConversationManager(proc1, log_mode=CONV_LOG_RING, log_size=3), 5)
+        self.assertEqual(len(conv.conv_log), 3)
+        self.assertEqual([rec[3]['op'] for rec in conv.conv_log], ['op2', 'op3', 'op4'])
+
+        conv = log_messages(ProcessConversationManager(proc1, log_mode=CONV_LOG_FULL), 5)
+        self.assertEqual(len(conv.conv_log), 5)
+        (ts, mtype, cstate, mhdrs) = conv.conv_log[0]
+        self.assertIsInstance(mhdrs, HeaderSnapshot)
+        self.assertNotIn('content', mhdrs)
+        self.assertRaises(TypeError, mhdrs.__setitem__, 'op', 'other')
+
+        # The log string works for both kinds of record
+        self.assertIn('me -> you', conv.get_conv_log_str())
+
+        self.assertRaises(ConversationError, ProcessConversationManager, proc1, log_mode='bogus')
@@ -10,13 +10,17 @@ there but resource types are not...
 
 """
 import math
+import time
+import logging
 from ion.core.object.object_utils import CDM_ARRAY_INT32_TYPE, CDM_ARRAY_INT64_TYPE, CDM_ARRAY_UINT64_TYPE, CDM_ARRAY_FLOAT32_TYPE, CDM_ARRAY_FLOAT64_TYPE, CDM_ARRAY_STRING_TYPE, CDM_ARRAY_OPAQUE_TYPE, CDM_ARRAY_UINT32_TYPE, ARRAY_STRUCTURE_TYPE
 
 import ion.util.ionlog
-log = ion.util.ionlog.getLogger(__name__)
+log = ion.util.ionlog.getIonLogger(__name__)
 from twisted.internet import defer
 
 import ion.util.procutils as pu
+from ion.util import metrics
+from ion.util.cache import LRUDict
 from ion.core.process.process import ProcessFactory
 from ion.core.process.service_process import ServiceProcess, ServiceClient
 from ion.core.exception import ReceivedError, ApplicationError
@@ -28,8 +32,11 @@ from types import FunctionType
 from ion.core.object import object_utils
 from ion.core.object import gpb_wrapper, repository
 from ion.core.object.workbench import WorkBench, WorkBenchError, PUSH_MESSAGE_TYPE, PULL_MESSAGE_TYPE, PULL_RESPONSE_MESSAGE_TYPE, BLOBS_REQUSET_MESSAGE_TYPE, REQUEST_COMMIT_BLOBS_MESSAGE_TYPE, BLOBS_MESSAGE_TYPE, GET_OBJECT_REQUEST_MESSAGE_TYPE, GET_OBJECT_REPLY_MESSAGE_TYPE, GPBTYPE_TYPE, DATA_REQUEST_MESSAGE_TYPE, DATA_REPLY_MESSAGE_TYPE, DATA_CHUNK_MESSAGE_TYPE
+from ion.core.object.blob_cache import BLOB_CACHE_SIZE
 from ion.core.data import store
 from ion.core.data import cassandra
+from ion.core.data import sqlite_store
+from ion.core.data import compressed_store
 #from ion.core.data import cassandra_bootstrap
 from ion.core.data.store import Query
 
@@ -68,6 +75,19 @@ RESOURCE_TYPE = object_utils.create_type_identifier(object_id=1102, version=1)
 
 CDM_BOUNDED_ARRAY_TYPE = object_utils.create_type_identifier(object_id=10021, version=1)
 
+# Repository keys per IN query checking which preload entries exist
+EXISTENCE_QUERY_KEYS = 200
+
+# Bytes per value of the fixed width ndarray types, by object id - used to size extracted data chunks
+NDARRAY_VALUE_BYTES = {CDM_ARRAY_INT32_TYPE.object_id:4,
+                       CDM_ARRAY_UINT32_TYPE.object_id:4,
+                       CDM_ARRAY_INT64_TYPE.object_id:8,
+                       CDM_ARRAY_UINT64_TYPE.object_id:8,
+                       CDM_ARRAY_FLOAT32_TYPE.object_id:4,
+                       CDM_ARRAY_FLOAT64_TYPE.object_id:8}
+# Values sampled to estimate the size of string and opaque values
+NDARRAY_SAMPLE_VALUES = 1000
+
 
 class DataStoreWorkBenchError(WorkBenchError):
     """
@@ -77,13 +97,26 @@ class DataStoreWorkBenchError(WorkBenchError):
 class DataStoreWorkbench(WorkBench):
 
 
-    def __init__(self, process, blob_store, commit_store, cache_size=10**8):
+    def __init__(self, process, blob_store, commit_store, cache_size=10**8, head_cache_size=0,
+                 extract_window=4, extract_chunk_bytes=2**17, blob_cache_size=BLOB_CACHE_SIZE):
 
-        WorkBench.__init__(self, process, cache_size)
+        WorkBench.__init__(self, process, cache_size, blob_cache_size)
+
+        # Data chunks of an extraction sent without waiting for the send to complete, and their target size
+        self._extract_window = extract_window
+        self._extract_chunk_bytes = extract_chunk_bytes
 
         self._blob_store = blob_store
         self._commit_store = commit_store
 
+        # Resolved head commits by repository key: (version, [(structure element, branch names), ...])
+        self._head_cache = None
+        if head_cache_size:
+            self._head_cache = LRUDict(head_cache_size)
+
+        # Incremented for a repository whenever this workbench changes its commits in the commit store
+        self._head_versions = {}
+
 
     def pull(self, *args, **kwargs):
 
@@ -93,6 +126,22 @@ class DataStoreWorkbench(WorkBench):
 
         raise NotImplementedError("The Datastore Service can not Push")
 
+    def _store_calls(self, name, def_list):
+        """
+        Waits for a batch of backend store calls. Records the number of calls
+        and the time to complete the batch in the metrics registry if enabled.
+        @retval DeferredList of def_list
+        """
+        d = defer.DeferredList(def_list)
+        if metrics.registry.enabled and def_list:
+            metrics.registry.inc('datastore.%s' % name, len(def_list))
+            start = time.time()
+            def _record(result):
+                metrics.registry.record('datastore.%s' % name, time.time() - start)
+                return result
+            d.addBoth(_record)
+        return d
+
     @defer.inlineCallbacks
     def _get_blobs(self, repo, startkeys, filtermethod=None):
         """
@@ -134,7 +183,7 @@ class DataStoreWorkbench(WorkBench):
 
             result_list = []
             if def_list:
-                result_list = yield defer.DeferredList(def_list)
+                result_list = yield self._store_calls('blob_store.get', def_list)
 
             for result, blob in result_list:
                 assert result==True, 'Error getting link from blob store!'
@@ -156,9 +205,99 @@ class DataStoreWorkbench(WorkBench):
 
         defer.returnValue(blobs)
 
+    def _heads_changed(self, repository_key):
+        """
+        Invalidates the cached heads of a repository. Must be called when its
+        commits are written to the commit store.
+        """
+        self._head_versions[repository_key] = self._head_versions.get(repository_key, 0) + 1
+        if self._head_cache is not None and self._head_cache.has_key(repository_key):
+            del self._head_cache[repository_key]
+
+    @defer.inlineCallbacks
+    def _get_repo_heads(self, repository_key):
+        """
+        Reads the head commits of a repository from the commit store, using
+        the branch name index, so the cost does not depend on the length of
+        the repository history. With a head_cache_size, results are cached
+        until this workbench changes the repository.
+
+        @note The cache assumes this workbench is the only writer of the
+        commit store, so it is off by default. Only set head_cache_size when
+        no other datastore shares the backend.
+        @returns list of (structure element, branch names) for each head
+            commit. Empty if the repository does not exist.
+        """
+        version = self._head_versions.get(repository_key, 0)
+        if self._head_cache is not None:
+            cached = self._head_cache.get(repository_key)
+            if cached is not None and cached[0] == version:
+                defer.returnValue(cached[1])
+
+        q = Query()
+        q.add_predicate_eq(REPOSITORY_KEY, repository_key)
+        q.add_predicate_gt(BRANCH_NAME, '')
+
+        rows = yield self._commit_store.query(q)
+
+        heads = []
+        for key, columns in rows.items():
+            wse = gpb_wrapper.StructureElement.parse_structure_element(columns[VALUE])
+            # Deal with the possiblity that more than one branch points to the same commit
+            heads.append((wse, columns[BRANCH_NAME].split(',')))
+
+        # Do not cache a result which raced with a change to the repository
+        if heads and self._head_cache is not None and self._head_versions.get(repository_key, 0) == version:
+            self._head_cache[repository_key] = (version, heads)
+
+        defer.returnValue(heads)
+
+    @defer.inlineCallbacks
+    def _load_commit_history(self, repo, commit_keys, stop_keys=()):
+        """
+        Walks the history of a repository back from the given commits and
+        makes sure each commit is in the repository index hash. Commits which
+        are not local are read from the commit store, a generation at a time.
+
+        @param stop_keys Commits at which to stop the walk, e.g. the commits
+            a puller already has (and therefore their ancestors too).
+        @returns set of the commit keys walked, not including stop_keys.
+        """
+        walked = set()
+        to_walk = set(commit_keys).difference(stop_keys)
+
+        while to_walk:
+            missing = [key for key in to_walk if not repo.index_hash.has_key(key)]
+            if missing:
+                results = yield self._store_calls('commit_store.get', [self._commit_store.get(key) for key in missing])
+                for key, (success, blob) in zip(missing, results):
+                    if not success or blob is None:
+                        raise DataStoreWorkBenchError('Repository commit object not found in the commit store', 404)   # @TODO: constant
+                    repo.index_hash[key] = gpb_wrapper.StructureElement.parse_structure_element(blob)
+
+            walked.update(to_walk)
+
+            next_walk = set()
+            for key in to_walk:
+                cref = repo._commit_index.get(key, None)
+                if cref is None:
+                    cref = repo._load_element(repo.index_hash.get(key))
+
+                for pref in cref.parentrefs:
+                    parent_key = pref.GetLink('commitref').key
+                    if parent_key not in walked and parent_key not in stop_keys:
+                        next_walk.add(parent_key)
+
+            to_walk = next_walk
+
+        defer.returnValue(walked)
+
     @defer.inlineCallbacks
     def _resolve_repo_state(self, repository_key):
         """
+        Loads the head commits of the repository and merges them with any
+        existing state in the workbench. Older commits are not loaded; use
+        _load_commit_history for operations which need them.
         @returns Repo.
         """
 
@@ -173,47 +312,33 @@ class DataStoreWorkbench(WorkBench):
         new_head = repo._wrap_message_object(mutable_cls(), addtoworkspace=False)
         new_head.repositorykey = repository_key
 
-        q = Query()
-        q.add_predicate_eq(REPOSITORY_KEY, repository_key)
-
-        rows = yield self._commit_store.query(q)
+        heads = yield self._get_repo_heads(repository_key)
 
-        if len(rows) == 0:
+        if len(heads) == 0:
             raise DataStoreWorkBenchError('Repository Key "%s" not found in Datastore' % repository_key, 404)   # @TODO: constant
 
-        for key, columns in rows.items():
-
-            blob = columns[VALUE]
-            wse = gpb_wrapper.StructureElement.parse_structure_element(blob)
-            repo.index_hash[key] = wse
-
-            if columns[BRANCH_NAME]:
-                # If this appears to be a head commit
+        for wse, branch_names in heads:
 
-                # Deal with the possiblity that more than one branch points to the same commit
-                branch_names = columns[BRANCH_NAME].split(',')
+            repo.index_hash[wse.key] = wse
 
+            for name in branch_names:
 
-                for name in branch_names:
-
-                    for branch in new_head.branches:
-                        # if the branch already exists in the new_head just add a commitref
-                        if branch.branchkey == name:
-                            link = branch.commitrefs.add()
-                            break
-                    else:
-                        # If not add a new branch
-                        branch = new_head.branches.add()
-                        branch.branchkey = name
+                for branch in new_head.branches:
+                    # if the branch already exists in the new_head just add a commitref
+                    if branch.branchkey == name:
                         link = branch.commitrefs.add()
+                        break
+                else:
+                    # If not add a new branch
+                    branch = new_head.branches.add()
+                    branch.branchkey = name
+                    link = branch.commitrefs.add()
 
-                    cref = repo._load_element(wse)
-                    repo._commit_index[cref.MyId]=cref
-                    cref.ReadOnly = True
-
-                    link.SetLink(cref)
+                cref = repo._load_element(wse)
+                repo._commit_index[cref.MyId]=cref
+                cref.ReadOnly = True
 
-                # Check to make sure the mutable is upto date with the commits...
+                link.SetLink(cref)
 
         # Do the update!
         self._update_repo_to_head(repo, new_head)
@@ -243,11 +368,10 @@ class DataStoreWorkbench(WorkBench):
         # Back to boiler plate op_pull
         ####
 
-        my_commits = self.list_repository_commits(repo)
-
-        puller_has = request.commit_keys
+        head_keys = [link.key for branch in repo.branches for link in branch.commitrefs.GetLinks()]
 
-        puller_needs = set(my_commits).difference(puller_has)
+        # Only walk back to the commits the puller already has
+        puller_needs = yield self._load_commit_history(repo, head_keys, stop_keys=set(request.commit_keys))
 
         response = yield self._process.message_client.create_instance(PULL_RESPONSE_MESSAGE_TYPE)
 
@@ -325,47 +449,36 @@ class DataStoreWorkbench(WorkBench):
                 repo_keys = set(self.list_repository_blobs(repo))
 
             # Get the latest commits in the repository
-            q = Query()
-            q.add_predicate_eq(REPOSITORY_KEY, repostate.repository_key)
+            heads = yield self._get_repo_heads(repostate.repository_key)
 
-            rows = yield self._commit_store.query(q)
-    
-            for key, columns in rows.items():
+            for wse, branch_names in heads:
 
-                blob = columns[VALUE]
-                wse = gpb_wrapper.StructureElement.parse_structure_element(blob)
-                if wse.key in repo._commit_index.keys():
+                if repo._commit_index.has_key(wse.key):
                     # No thanks, he's already got one!
                     continue
 
-                repo.index_hash[key] = wse
-
-                if columns[BRANCH_NAME]:
-                    # If this appears to be a head commit
-
-                    # Deal with the possibility that more than one branch points to the same commit
-                    branch_names = columns[BRANCH_NAME].split(',')
+                repo.index_hash[wse.key] = wse
 
-                    for name in branch_names:
+                for name in branch_names:
 
-                        for branch in repo.branches:
-                            # if the branch already exists in the new_head just add a commitref
-                            if branch.branchkey == name:
-                                link = branch.commitrefs.add()
-                                #  Link is set below...
-                                break
-                        else:
-                            # If not add a new branch
-                            branch = repo._dotgit.branches.add()
-                            branch.branchkey = name
+                    for branch in repo.branches:
+                        # if the branch already exists in the new_head just add a commitref
+                        if branch.branchkey == name:
                             link = branch.commitrefs.add()
-                            # Link is set below...
+                            #  Link is set below...
+                            break
+                    else:
+                        # If not add a new branch
+                        branch = repo._dotgit.branches.add()
+                        branch.branchkey = name
+                        link = branch.commitrefs.add()
+                        # Link is set below...
 
-                        cref = repo._load_element(wse)
-                        repo._commit_index[cref.MyId]=cref
-                        cref.ReadOnly = True
+                    cref = repo._load_element(wse)
+                    repo._commit_index[cref.MyId]=cref
+                    cref.ReadOnly = True
 
-                        link.SetLink(cref)
+                    link.SetLink(cref)
 
             # Now the repo is up to date on the data store side...
 
@@ -377,36 +490,27 @@ class DataStoreWorkbench(WorkBench):
             # Get the set of keys in repostate that are not in repo_keys
             need_keys = set(repostate.blob_keys).difference(repo_keys)
 
-            workbench_keys = set(self._workbench_cache.keys())
-
-            local_keys = workbench_keys.intersection(need_keys)
+            local_keys = set([key for key in need_keys if self._workbench_cache.has_key(key)])
 
-
-            def_commit_list = []
-            def_blob_list = []
-            key_list = []
+            # Keys which are not in the workbench may still be in the backend - older commits in particular are not
+            # read when resolving the repository heads.
+            key_list = list(need_keys.difference(local_keys))
             for key in local_keys:
-                try:
-                    repo.index_hash.get(key)
+                if repo.index_hash.get(key) is not None:
                     need_keys.remove(key)
-                    continue
-                except KeyError, ke:
-                    log.info('Key disappeared - get it from the remote after all')
-
-                # @TODO Assumption is that this check is less costly than getting it from the remote service
-                key_list.append(key)
-                def_commit_list.append(self._commit_store.has_key(key))
-                def_blob_list.append(self._blob_store.has_key(key))
+                else:
+                    log.info('Key disappeared - check the backend after all')
+                    key_list.append(key)
 
             if key_list:
-                result_commit_list = yield defer.DeferredList(def_commit_list)
-                result_blob_list = yield defer.DeferredList(def_blob_list)
-
-                # Remove
-                for key, res1, have_blob, res2, have_commit in zip(key_list, result_blob_list, result_commit_list):
-
-                    if have_blob or have_commit:
-                        need_keys.remove(key)
+                # @TODO Assumption is that this check is less costly than getting it from the remote service
+                # One existence check of all keys per store rather than one per key
+                results = yield self._store_calls('multi_has_key', [self._commit_store.multi_has_key(key_list),
+                                                                    self._blob_store.multi_has_key(key_list)])
+                for success, found in results:
+                    if not success:
+                        found.raiseException()
+                    need_keys.difference_update(found)
 
             if len(need_keys) > 0:
                 blobs_request = yield self._process.message_client.create_instance(BLOBS_REQUSET_MESSAGE_TYPE)
@@ -416,7 +520,7 @@ class DataStoreWorkbench(WorkBench):
                     blobs_msg = yield self.fetch_blobs(headers.get('reply-to'), blobs_request)
                 except ReceivedError, re:
 
-                   log.debug('ReceivedError', str(re))
+                   log.debug('ReceivedError: %s', re)
                    raise DataStoreWorkBenchError('Fetch Objects returned an exception! "%s"' % re.msg_content)
 
 
@@ -437,9 +541,23 @@ class DataStoreWorkbench(WorkBench):
             new_head.Modified = True
             new_head.MyId = repo.new_id()
 
+            # Merging walks the ancestry of the pushed heads - load any older commits from the backend
+            if len(repo.branches) > 0:
+                pushed_keys = [link.key for branch in new_head.branches for link in branch.commitrefs.GetLinks()]
+                pushed_history = yield self._load_commit_history(repo, pushed_keys)
+
+                # A pushed branch which is behind or diverged from a head here is resolved by walking that head
+                # back to where it meets the pushed history
+                head_keys = [link.key for branch in repo.branches for link in branch.commitrefs.GetLinks()]
+                yield self._load_commit_history(repo, head_keys, stop_keys=pushed_history)
+
             # Now merge the state!
             self._update_repo_to_head(repo,new_head)
 
+        # Cached heads of the pushed repositories are invalid from here until the commits are written
+        for repo_key in new_commits:
+            self._heads_changed(repo_key)
+
         # Put any new blobs
         def_list = []
         for key in new_blob_keys:
@@ -447,7 +565,7 @@ class DataStoreWorkbench(WorkBench):
             element = self._workbench_cache.get(key)
 
             def_list.append(self._blob_store.put(key, element.serialize()))
-        yield defer.DeferredList(def_list)
+        yield self._store_calls('blob_store.put', def_list)
         # @TODO - check the results - for what?
 
 
@@ -559,7 +677,7 @@ class DataStoreWorkbench(WorkBench):
                     # Any commit which is currently a head will have the correct branch names set.
                     # Just delete the branch names for the ones that are no longer heads.
 
-        yield defer.DeferredList(def_list)
+        yield self._store_calls('commit_store.put', def_list)
         #@TODO - check the return vals?
 
         def_list = []
@@ -567,7 +685,7 @@ class DataStoreWorkbench(WorkBench):
 
             def_list.append(self._commit_store.put(**new_head))
 
-        yield defer.DeferredList(def_list)
+        yield self._store_calls('commit_store.put', def_list)
         #@TODO - check the return vals?
 
         def_list = []
@@ -575,7 +693,11 @@ class DataStoreWorkbench(WorkBench):
 
             def_list.append(self._commit_store.update_index(key=key, index_attributes={BRANCH_NAME:''}))
 
-        yield defer.DeferredList(def_list)
+        yield self._store_calls('commit_store.update_index', def_list)
+
+        # Drop anything cached while the commits were being written
+        for repo_key in new_commits:
+            self._heads_changed(repo_key)
 
         #import pprint
         #print 'After update to heads'
@@ -599,7 +721,7 @@ class DataStoreWorkbench(WorkBench):
         for blob in request.blob_elements:
             def_list.append(self._blob_store.put(blob.key, blob.SerializeToString() ))
 
-        yield defer.DeferredList(def_list)
+        yield self._store_calls('blob_store.put', def_list)
 
         yield self._process.reply_ok(message)
         log.info("op_put_blobs: Complete!")
@@ -632,7 +754,7 @@ class DataStoreWorkbench(WorkBench):
 
             def_list.append(self._blob_store.get(key))
 
-        res_list = yield defer.DeferredList(def_list)
+        res_list = yield self._store_calls('blob_store.get', def_list)
 
         for result, blob in res_list:
 
@@ -652,12 +774,18 @@ class DataStoreWorkbench(WorkBench):
         log.info('op_fetch_blobs: Complete!')
 
     @defer.inlineCallbacks
-    def flush_initialization_to_backend(self):
+    def flush_initialization_to_backend(self, flushed=None):
         """
         Flush any repositories in the backend to the the workbench backend storage
+        @param flushed dict of repository key to the commit keys it had when it was flushed already -
+            those repositories are skipped unless they have new commits
         """
+        flushed = flushed or {}
         def_list=[]
-        for repo in self._repos.itervalues():
+        for key, repo in self._repos.iteritems():
+
+            if flushed.get(key) == frozenset(repo._commit_index.keys()):
+                continue
 
             def_list.append(self.flush_repo_to_backend(repo))
 
@@ -666,11 +794,11 @@ class DataStoreWorkbench(WorkBench):
         #import pprint
         #print 'After update to heads'
         #pprint.pprint(self._commit_store.kvs)
-        log.info("Number of repositories:  %s" % len(self._repos))
-        log.info("Number of blobs: %s " % len(self._workbench_cache))
+        log.info("Number of repositories:  %s", len(self._repos))
+        log.info("Number of blobs: %s ", len(self._workbench_cache))
         
         num_commit_keys = map(lambda repo: len(repo._commit_index.keys()), self._repos.values())
-        log.info("Number of commits: %s " % sum(num_commit_keys))
+        log.info("Number of commits: %s ", sum(num_commit_keys))
 
         # Now clear the in memory workbench
         self.clear()
@@ -767,11 +895,43 @@ class DataStoreWorkbench(WorkBench):
                                    value = wse.serialize(),
                                    index_attributes = attributes)
                 def_list.append(defd)
-        return defer.DeferredList(def_list)
+
+        repository_key = repo.repository_key
+        self._heads_changed(repository_key)
+        def _written(result):
+            self._heads_changed(repository_key)
+            return result
+        return defer.DeferredList(def_list).addCallback(_written)
 
 
 
 
+    @defer.inlineCallbacks
+    def existing_repositories(self, repo_keys):
+        """
+        For use in initialization - find which of the repositories already exist in the backend
+        with IN queries of up to EXISTENCE_QUERY_KEYS keys, all in flight at once
+        @retval set of the keys in repo_keys which have commits in the backend
+        """
+        repo_keys = list(set(repo_keys))
+
+        def_list = []
+        for i in range(0, len(repo_keys), EXISTENCE_QUERY_KEYS):
+            q = Query()
+            q.add_predicate_in(REPOSITORY_KEY, repo_keys[i:i + EXISTENCE_QUERY_KEYS])
+            def_list.append(self._commit_store.query(q))
+
+        results = yield self._store_calls('commit_store.query', def_list)
+
+        existing = set()
+        for success, rows in results:
+            if not success:
+                rows.raiseException()
+            for row in rows.itervalues():
+                existing.add(row[REPOSITORY_KEY])
+
+        defer.returnValue(existing)
+
     @defer.inlineCallbacks
     def test_existence(self,repo_key):
         """
@@ -802,7 +962,8 @@ class DataStoreWorkbench(WorkBench):
 
         response = yield self._process.message_client.create_instance(DATA_REPLY_MESSAGE_TYPE)
 
-        log.debug("Extract data request bounds: %s", ["%d+%d,%d" % (x.origin, x.size, x.stride) for x in request.request_bounds])
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Extract data request bounds: %s", ["%d+%d,%d" % (x.origin, x.size, x.stride) for x in request.request_bounds])
 
         # create an anonymous repo to load things into
         repo = self.create_repository(root_type=ARRAY_STRUCTURE_TYPE)
@@ -840,7 +1001,7 @@ class DataStoreWorkbench(WorkBench):
 
         # now onto the fun.  let's traverse all the bounded arrays we find!
 
-        log.debug("op_extract_data: obj has %d bounded arrays" % len(obj.bounded_arrays))
+        log.debug("op_extract_data: obj has %d bounded arrays", len(obj.bounded_arrays))
 
         # get the type of bounded array we have here
         assert len(obj.bounded_arrays) > 0
@@ -906,12 +1067,12 @@ class DataStoreWorkbench(WorkBench):
         # retrieve and extract slices from each matching array, build data chunk messages, send them to requester
         # before sending response to this rpc method
 
-        log.debug("Matching Bounded Arrays: %d" % len(bounded_includes_list))
+        log.debug("Matching Bounded Arrays: %d", len(bounded_includes_list))
 
         # get a clear set of the keys we have to get
         ndarrayset = set([ba[0].GetLink('ndarray').key for ba in bounded_includes_list])
 
-        log.debug("Requesting %d keys from the datastore" % len(ndarrayset))
+        log.debug("Requesting %d keys from the datastore", len(ndarrayset))
 
         # actually get those keys from the datastore, put them in the repo
         ndblobs = yield self._get_blobs(repo, ndarrayset, lambda x: True)
@@ -939,7 +1100,7 @@ class DataStoreWorkbench(WorkBench):
 
                 log.debug("BEGIN DATA COPY")
                 for targetslice, srcslice in self._get_slices(targetshape, ba_shape, targetranges, srcranges):
-                    log.debug("copying src range %s to target range %s" % (srcslice, targetslice))
+                    log.debug("copying src range %s to target range %s", srcslice, targetslice)
 
                     targetarray[targetslice[0]:targetslice[1]] = ndobj.value[srcslice[0]:srcslice[1]]
 
@@ -950,7 +1111,7 @@ class DataStoreWorkbench(WorkBench):
 
         # if we have anything but 1s in all dimensions
         if strides != [1] * len(request.request_bounds):
-            log.debug("striding requested %s" % strides)
+            log.debug("striding requested %s", strides)
 
             # create ranges with strides
             strideranges = [(0, x.size, x.stride or 1) for x in request.request_bounds]
@@ -1024,13 +1185,19 @@ class DataStoreWorkbench(WorkBench):
 
         # CREATE RESPONSE CHUNKS OUT OF BIG ORIGINAL RESPONSE MESSAGE
 
-        CHUNK_FACTOR = 10000
+        ndarray_type = bounded_includes_list[0][0].GetLink('ndarray').type
+        CHUNK_FACTOR = self._chunk_values(ndarray_type, targetarray)
         totalchunks = int(math.ceil(totalelems / float(CHUNK_FACTOR)))
 
-        log.debug("Chunking %d values into %d messages (factor %d)" % (totalelems, totalchunks, CHUNK_FACTOR))
+        log.debug("Chunking %d values into %d messages (factor %d)", totalelems, totalchunks, CHUNK_FACTOR)
 
+        # Up to extract_window chunks are in flight while the next is built - a send which does not complete,
+        # because the broker holds back a slow receiver, stops the extraction until it does
+        window = _ChunkWindow(self._extract_window)
         for i in xrange(totalchunks):
 
+            yield window.ready()
+
             # create new message to send
             chunkmsg = yield self._process.message_client.create_instance(DATA_CHUNK_MESSAGE_TYPE)
             chunkmsg.seq_number = i+1
@@ -1039,14 +1206,14 @@ class DataStoreWorkbench(WorkBench):
             curoffset = i * CHUNK_FACTOR
             slicelen = min(CHUNK_FACTOR, totalelems - curoffset)
 
-            log.debug("Chunk #%d: offset %d, length %d" % (i, curoffset, slicelen))
+            log.debug("Chunk #%d: offset %d, length %d", i, curoffset, slicelen)
 
             # set info in this chunk
             chunkmsg.start_index = curoffset
             chunkmsg.done = (i==totalchunks-1)      # last chunk message?  set the done flag
 
             # create the ndarray in this chunk
-            chunkndarray = chunkmsg.CreateObject(bounded_includes_list[0][0].GetLink('ndarray').type)
+            chunkndarray = chunkmsg.CreateObject(ndarray_type)
 
             # these lines blow up with a TypeError if we screwed up the bounds and didn't fill in the targetarray fully,
             # aka it contains Nones
@@ -1054,18 +1221,31 @@ class DataStoreWorkbench(WorkBench):
             chunkmsg.ndarray = chunkndarray
 
             # send this message to the passed in routing key
-            yield self._send_data_chunk(request.data_routing_key, chunkmsg)
+            window.send(self._send_data_chunk, request.data_routing_key, chunkmsg)
+
+        yield window.close()
 
         self._process.reply_ok(message, response)
         log.info("/op_extract_data")
 
+    def _chunk_values(self, ndarray_type, values):
+        """
+        @retval Number of values of an ndarray of the given type per data chunk of about extract_chunk_bytes
+        """
+        value_bytes = NDARRAY_VALUE_BYTES.get(ndarray_type.object_id)
+        if value_bytes is None:
+            # Strings and opaque values: a length prefix each, and the average length of a sample
+            sample = values[:NDARRAY_SAMPLE_VALUES]
+            value_bytes = 2 + sum([len(value or '') for value in sample]) / float(len(sample) or 1)
+        return max(1, int(self._extract_chunk_bytes / value_bytes))
+
     @defer.inlineCallbacks
     def _send_data_chunk(self, data_routing_key, chunkmsg):
         """
         Sends a data chunk message (from op_extract_data).  This is split out to facilitate
         testing via monkeypatching this method.
         """
-        log.debug("_send_data_chunk to %s" % data_routing_key)
+        log.debug("_send_data_chunk to %s", data_routing_key)
         yield self._process.send(data_routing_key, 'noop', chunkmsg)
 
 
@@ -1219,6 +1399,101 @@ class DataStoreError(ApplicationError):
     """
 
 
+class _ChunkWindow(object):
+    """
+    Sends the data chunks of an extraction with a bounded number of sends in
+    flight. The first failed send fails ready and close, so no more chunks
+    are built after it.
+    """
+
+    def __init__(self, size):
+        self.semaphore = defer.DeferredSemaphore(max(int(size), 1))
+        self.pending = []
+        self.failure = None
+
+    def ready(self):
+        """
+        @retval Deferred fired when there is room for another send, which must follow
+        """
+        d = self.semaphore.acquire()
+        d.addCallback(self._check)
+        return d
+
+    def _check(self, semaphore):
+        if self.failure is not None:
+            semaphore.release()
+            return self.failure
+
+    def send(self, func, *args):
+        """
+        Call func(*args), which returns a deferred, in the room taken by ready
+        """
+        d = defer.maybeDeferred(func, *args)
+        d.addErrback(self._failed)
+        d.addBoth(self._sent)
+        self.pending.append(d)
+
+    def _failed(self, reason):
+        if self.failure is None:
+            self.failure = reason
+
+    def _sent(self, result):
+        self.semaphore.release()
+
+    def close(self):
+        """
+        @retval Deferred fired when all sends are complete, failed if one failed
+        """
+        d = defer.DeferredList(self.pending)
+        d.addCallback(self._check_closed)
+        return d
+
+    def _check_closed(self, result):
+        if self.failure is not None:
+            return self.failure
+
+
+class _FlushPipeline(object):
+    """
+    Flushes the repositories created in a workbench during initialization to
+    the backend while more are created, with a bounded number of flushes in
+    flight.
+    """
+
+    def __init__(self, workbench, concurrency):
+        self.workbench = workbench
+        self.semaphore = defer.DeferredSemaphore(max(int(concurrency), 1))
+        # Repository key to the commit keys it had when its flush started
+        self.flushed = {}
+        self.known = set(workbench._repos.keys())
+        self.pending = []
+
+    def ready(self):
+        """
+        @retval Deferred fired once every flush started so far is in flight and there is room for another
+        """
+        d = self.semaphore.acquire()
+        d.addCallback(lambda semaphore: semaphore.release())
+        return d
+
+    def flush_new(self):
+        """
+        Start flushing the repositories created since the last call
+        """
+        for key, repo in self.workbench._repos.items():
+            if key in self.known:
+                continue
+            self.known.add(key)
+            self.flushed[key] = frozenset(repo._commit_index.keys())
+            self.pending.append(self.semaphore.run(self.workbench.flush_repo_to_backend, repo))
+
+    def close(self):
+        """
+        @retval Deferred fired when all flushes are complete
+        """
+        return defer.DeferredList(self.pending, fireOnOneErrback=True)
+
+
 class DataStoreService(ServiceProcess):
     """
     The data store is not yet persistent. At the moment all its stored objects
@@ -1247,12 +1522,24 @@ class DataStoreService(ServiceProcess):
         self._backend_cls_names[BLOB_CACHE] = self.spawn_args.get(BLOB_CACHE, CONF.getValue(BLOB_CACHE, default='ion.core.data.store.Store'))
 
         self._cache_size = self.spawn_args.get('cache_size', CONF.getValue('cache_size', default=10**8))
+        self._head_cache_size = self.spawn_args.get('head_cache_size', CONF.getValue('head_cache_size', default=0))
+        self._blob_cache_size = int(self.spawn_args.get('blob_cache_size', CONF.getValue('blob_cache_size', default=BLOB_CACHE_SIZE)))
+        self._extract_window = self.spawn_args.get('extract_window', CONF.getValue('extract_window', default=4))
+        self._extract_chunk_bytes = self.spawn_args.get('extract_chunk_bytes', CONF.getValue('extract_chunk_bytes', default=2**17))
 
         self._backend_classes={}
 
         self._username = self.spawn_args.get("username", CONF.getValue("username", None))
         self._password = self.spawn_args.get("password", CONF.getValue("password",None))
 
+        # Database file of the sqlite stores - may or may not be used depending on the backend class
+        self._database = self.spawn_args.get('database', CONF.getValue('database', None))
+
+        # Compress blobs above a size threshold - levels and thresholds default to those of ion.core.data.compressed_store
+        self._compress_blobs = self.spawn_args.get('compress_blobs', CONF.getValue('compress_blobs', False))
+        self._compression_level = self.spawn_args.get('compression_level', CONF.getValue('compression_level', None))
+        self._compression_threshold = self.spawn_args.get('compression_threshold', CONF.getValue('compression_threshold', None))
+
         self._backend_classes[COMMIT_CACHE] = pu.get_class(self._backend_cls_names[COMMIT_CACHE])
         assert store.IIndexStore.implementedBy(self._backend_classes[COMMIT_CACHE]), \
             'The back end class to store commit objects passed to the data store does not implement the required IIndexSTORE interface.'
@@ -1279,6 +1566,9 @@ class DataStoreService(ServiceProcess):
         self.preload.update(CONF.getValue(PRELOAD_CFG, {}))
         self.preload.update(self.spawn_args.get(PRELOAD_CFG, {}))
 
+        # Number of preloaded repositories flushed to the backend at once
+        self._preload_concurrency = self.spawn_args.get('preload_concurrency', CONF.getValue('preload_concurrency', 8))
+
 
 
         log.info('DataStoreService.__init__()')
@@ -1300,7 +1590,18 @@ class DataStoreService(ServiceProcess):
             yield self.c_store.activate()
 
             yield self.register_life_cycle_object(self.c_store)
-            
+
+        elif issubclass(self._backend_classes[COMMIT_CACHE], sqlite_store.SqliteStore):
+            log.info("Instantiating Sqlite Index Store")
+
+            self.c_store = self._backend_classes[COMMIT_CACHE](database=self._database, table=COMMIT_CACHE,
+                                                               indices=COMMIT_INDEXED_COLUMNS)
+
+            yield self.c_store.initialize()
+            yield self.c_store.activate()
+
+            yield self.register_life_cycle_object(self.c_store)
+
         else:
 
             log.info("Clearing The In Memeory Index Store")
@@ -1325,6 +1626,17 @@ class DataStoreService(ServiceProcess):
             yield self.b_store.activate()
 
             yield self.register_life_cycle_object(self.b_store)
+
+        elif issubclass(self._backend_classes[BLOB_CACHE], sqlite_store.SqliteStore):
+            log.info("Instantiating Sqlite Store")
+
+            self.b_store = self._backend_classes[BLOB_CACHE](database=self._database, table=BLOB_CACHE)
+
+            yield self.b_store.initialize()
+            yield self.b_store.activate()
+
+            yield self.register_life_cycle_object(self.b_store)
+
         else:
 
             log.info("Clearing The In Memeory Store")
@@ -1336,8 +1648,17 @@ class DataStoreService(ServiceProcess):
             self.b_store = self._backend_classes[BLOB_CACHE](self)
 
         
+        if self._compress_blobs:
+            log.info("Compressing blobs")
+            self.b_store = compressed_store.CompressedStore(self.b_store, level=self._compression_level,
+                                                            threshold=self._compression_threshold)
+
         log.info("Created stores")
-        self.workbench = DataStoreWorkbench(self, self.b_store, self.c_store, cache_size=self._cache_size)
+        self.workbench = DataStoreWorkbench(self, self.b_store, self.c_store, cache_size=self._cache_size,
+                                            head_cache_size=self._head_cache_size,
+                                            extract_window=self._extract_window,
+                                            extract_chunk_bytes=self._extract_chunk_bytes,
+                                            blob_cache_size=self._blob_cache_size)
 
         yield self.initialize_datastore()
 
@@ -1358,121 +1679,91 @@ class DataStoreService(ServiceProcess):
     def initialize_datastore(self):
         """
         This method is used to preload required content into the datastore
-        """
-
-        if self.preload[ION_PREDICATES_CFG]:
-
-            log.info('Preloading Predicates')
-            for key, value in ION_PREDICATES.items():
-
-                exists = yield self.workbench.test_existence(value[ID_CFG])
-                if not exists:
-                    log.info('Preloading Predicate:' + str(value.get(PREDICATE_CFG)))
-                    predicate_repo = self._create_predicate(value)
-                    if predicate_repo is None:
-                        raise DataStoreError('Failed to create predicate: %s' % str(value))
-                    #@TODO make associations to predicates!
-
 
+        Which preload entries already exist is checked up front, in bulk. The
+        missing ones are created in order, and each one's repositories are
+        flushed to the backend while the next entries are created, with at
+        most preload_concurrency flushes in flight.
+        """
+        entries = self._preload_entries()
 
-        # Load the Root User!
-        if self.preload[ION_IDENTITIES_CFG]:
-            log.info('Preloading Identities')
+        existing = yield self.workbench.existing_repositories([entry[3][ID_CFG] for entry in entries])
+        log.info('Preloading %d of %d entries - the others exist', len(entries) - len(existing), len(entries))
 
-            root_description = ION_IDENTITIES.get(root_name)
-            exists = yield self.workbench.test_existence(ROOT_USER_ID)
-            if not exists:
-                log.info('Preloading ROOT USER')
+        pipeline = _FlushPipeline(self.workbench, self._preload_concurrency)
+        for label, config, key, value, owner, required in entries:
+            if value[ID_CFG] in existing:
+                continue
+            yield pipeline.ready()
 
-                resource_instance = self._create_resource(root_description)
-                if resource_instance is None:
-                    raise DataStoreError('Failed to create Identity Resource: %s' % str(root_description))
-                self._create_ownership_association(resource_instance.Repository, ROOT_USER_ID)
+            log.info('Preloading %s:%s', label, value.get(NAME_CFG) or value.get(PREDICATE_CFG))
+            self._preload_entry(label, config, key, value, owner, required)
 
-        if self.preload[ION_RESOURCE_TYPES_CFG]:
-            log.info('Preloading Resource Types')
+            pipeline.flush_new()
 
-            for key, value in ION_RESOURCE_TYPES.items():
+        yield pipeline.close()
 
-                exists = yield self.workbench.test_existence(value[ID_CFG])
-                if not exists:
-                    log.info('Preloading Resource Type:' + str(value.get(NAME_CFG)))
+        yield self.workbench.flush_initialization_to_backend(pipeline.flushed)
 
-                    resource_instance = self._create_resource(value)
-                    if resource_instance is None:
-                        raise DataStoreError('Failed to create Resource Type Resource: %s' % str(value))
-                    self._create_ownership_association(resource_instance.Repository, ROOT_USER_ID)
+    def _preload_entries(self):
+        """
+        @retval list of (label, config dict, key, description, owner id, required) of the entries to
+            preload, in the order they must be created. Each repository key is listed once.
+        """
+        entries = []
+        keys = set()
+        def add(label, config, owner, required, items):
+            for key, value in items:
+                if value[ID_CFG] not in keys:
+                    keys.add(value[ID_CFG])
+                    entry_owner = owner(value) if callable(owner) else owner
+                    entries.append((label, config, key, value, entry_owner, required))
 
+        if self.preload[ION_PREDICATES_CFG]:
+            add('Predicate', ION_PREDICATES, None, True, ION_PREDICATES.items())
 
+        # Load the Root User!
         if self.preload[ION_IDENTITIES_CFG]:
-            log.info('Preloading Identities')
-
-            for key, value in ION_IDENTITIES.items():
-                exists = yield self.workbench.test_existence(value[ID_CFG])
-                if not exists:
-                    log.info('Preloading Identity:' + str(value.get(NAME_CFG)))
-
-                    resource_instance = self._create_resource(value)
-                    if resource_instance is None:
-                        raise DataStoreError('Failed to create Identity Resource: %s' % str(value))
-                    self._create_ownership_association(resource_instance.Repository, value[ID_CFG])
-                    
-        if self.preload[ION_DATASETS_CFG]:
-            log.info('Preloading Data Sets: %d' % len(ION_DATASETS))
-
-            for key, value in ION_DATASETS.items():
-                exists = yield self.workbench.test_existence(value[ID_CFG])
-                if not exists:
-                    log.info('Preloading DataSet:' + str(value.get(NAME_CFG)))
-
-                    resource_instance = self._create_resource(value)
-                    # Do not fail if returning none - may or may not load data from disk
-                    if resource_instance is not None:
-
-                        owner = value.get(OWNER_ID) or ANONYMOUS_USER_ID
-                        log.info('Dataset Owner ID: %s' % owner)
+            add('Identity', ION_IDENTITIES, ROOT_USER_ID, True, [(root_name, ION_IDENTITIES.get(root_name))])
 
-                        self._create_ownership_association(resource_instance.Repository, owner)
-
-                    else:
-                        # Delete this entry from the CONFIG!
-                        del ION_DATASETS[key]
-
-
-            log.info('Preloading Data Sources: %d' % len(ION_DATA_SOURCES))
-            for key, value in ION_DATA_SOURCES.items():
-                exists = yield self.workbench.test_existence(value[ID_CFG])
-                if not exists:
-                    log.info('Preloading DataSource:' + str(value.get(NAME_CFG)))
-
-                    resource_instance = self._create_resource(value)
-                    # Do not fail if returning none - may or may not load data from disk
-                    if resource_instance is not None:
+        if self.preload[ION_RESOURCE_TYPES_CFG]:
+            add('Resource Type', ION_RESOURCE_TYPES, ROOT_USER_ID, True, ION_RESOURCE_TYPES.items())
 
-                        owner = value.get(OWNER_ID) or ANONYMOUS_USER_ID
-                        log.info('Datasource Owner ID: %s' % owner)
+        if self.preload[ION_IDENTITIES_CFG]:
+            add('Identity', ION_IDENTITIES, lambda value: value[ID_CFG], True, ION_IDENTITIES.items())
 
-                        self._create_ownership_association(resource_instance.Repository, owner)
-                    else:
-                        # Delete this entry from the CONFIG!
-                        del ION_DATA_SOURCES[key]
+        if self.preload[ION_DATASETS_CFG]:
+            # Do not fail if returning none - may or may not load data from disk
+            owner = lambda value: value.get(OWNER_ID) or ANONYMOUS_USER_ID
+            add('DataSet', ION_DATASETS, owner, False, ION_DATASETS.items())
+            add('DataSource', ION_DATA_SOURCES, owner, False, ION_DATA_SOURCES.items())
 
         if self.preload[ION_AIS_RESOURCES_CFG]:
-            log.info('Preloading AIS Resources')
+            add('AIS Resource', ION_AIS_RESOURCES, ANONYMOUS_USER_ID, True, ION_AIS_RESOURCES.items())
 
-            for key, value in ION_AIS_RESOURCES.items():
-                exists = yield self.workbench.test_existence(value[ID_CFG])
-                if not exists:
-                    log.info('Preloading AIS Resource:' + str(value.get(NAME_CFG)))
-
-                    resource_instance = self._create_resource(value)
-                    if resource_instance is None:
-                        raise DataStoreError('Failed to create AIS Resource: %s' % str(value))
-                    self._create_ownership_association(resource_instance.Repository, ANONYMOUS_USER_ID)
+        return entries
 
+    def _preload_entry(self, label, config, key, value, owner, required):
+        """
+        Create the repositories of one preload entry in the workbench
+        """
+        if label == 'Predicate':
+            predicate_repo = self._create_predicate(value)
+            if predicate_repo is None:
+                raise DataStoreError('Failed to create predicate: %s' % str(value))
+            #@TODO make associations to predicates!
+            return
 
+        resource_instance = self._create_resource(value)
+        if resource_instance is None:
+            if required:
+                raise DataStoreError('Failed to create %s Resource: %s' % (label, str(value)))
+            # Delete this entry from the CONFIG!
+            del config[key]
+            return
 
-        yield self.workbench.flush_initialization_to_backend()
+        log.info('%s Owner ID: %s', label, owner)
+        self._create_ownership_association(resource_instance.Repository, owner)
 
 
 
@@ -1591,7 +1882,7 @@ class DataStoreService(ServiceProcess):
 
         else:
             self.workbench.clear_repository_key(resource_key)
-            log.info('Retrieving content for resource "%s" failed.  This resource instance will not be added to the repository!' % resource_name)
+            log.info('Retrieving content for resource "%s" failed.  This resource instance will not be added to the repository!', resource_name)
             return None
 
 
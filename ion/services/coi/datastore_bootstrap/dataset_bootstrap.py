@@ -53,6 +53,9 @@ SEARCH_PATTERN_TYPE = object_utils.create_type_identifier(object_id=4505, versio
 from ion.core import ioninit
 CONF = ioninit.config(__name__)
 
+# Structure elements added to the repository at once while streaming a dataset file
+CF_load_batch_size = CONF.getValue('load_batch_size', 1000)
+
 
 def bootstrap_byte_array_dataset(instance, *args, **kwargs):
     """
@@ -87,22 +90,52 @@ def bootstrap_byte_array_dataset(instance, *args, **kwargs):
 
     return result
 
+def _load_container(instance, f):
+    """
+    Stream the structure elements of a serialized container from the file
+    object f into the repository of the instance, in batches of
+    CF_load_batch_size elements. Returns the head element.
+    """
+    index_hash = instance.Repository.index_hash
+
+    head_elm = None
+    batch = {}
+    for is_head, element in codec._iter_container(f):
+        if is_head:
+            head_elm = element
+        batch[element.key] = element
+
+        if len(batch) >= CF_load_batch_size:
+            index_hash.update(batch)
+            batch = {}
+
+    index_hash.update(batch)
+
+    if head_elm is None:
+        raise codec.CodecError('Could not decode message content - no head element in the container!')
+
+    return head_elm
+
+
 def read_ooicdm_file(instance, filename):
     f = None
+    result = False
     try:
 
         # Get an absolute path to the file
         filename = pu.get_ion_path(filename)
 
-        f = open(filename, 'r')
+        f = open(filename, 'rb')
         result = True
 
     except IOError, e:
         log.error('dataset_bootstrap.bootstrap_byte_array_dataset(): Could not open the given filepath "%s" for read access: %s' % (filename, str(e)))
 
     if f is not None:
-        head_elm, obj_dict = codec._unpack_container(f.read())
-        instance.Repository.index_hash.update(obj_dict)
+        try:
+            head_elm = _load_container(instance, f)
+        finally:
+            f.close()
 
         root_obj = instance.Repository._load_element(head_elm)
 
@@ -116,8 +149,6 @@ def read_ooicdm_file(instance, filename):
             
         instance.root_group = dataset.root_group
 
-        f.close()
-
     return result
 
 def read_ooicdm_tar_file(instance, filename):
@@ -131,9 +162,8 @@ def read_ooicdm_tar_file(instance, filename):
 
 
         log.debug('Untaring file...')
-        tar = tarfile.open(filename, 'r')
-
-        #f = tar.extractfile(tar.next())
+        # Stream mode - members are read in order, without seeking back through the compressed archive
+        tar = tarfile.open(filename, 'r|*')
 
     except IOError, e:
         log.error('dataset_bootstrap.bootstrap_byte_array_dataset(): Could not open the given filepath "%s" for read access: %s' % (filename, str(e)))
@@ -147,18 +177,21 @@ def read_ooicdm_tar_file(instance, filename):
 
     vars=[]
     root_obj = None
-    for name in tar.getnames():
+    for member in tar:
+
+        if not member.isfile():
+            continue
 
         try:
-            f = tar.extractfile(tar.getmember(name))
+            f = tar.extractfile(member)
         except ExtractError, e:
             log.error('dataset_bootstrap.bootstrap_byte_array_dataset(): Could not extract from zipped tar filepath "%s", Extract error: %s' % (filename, str(e)))
             return False
 
-        head_elm, obj_dict = codec._unpack_container(f.read())
-        instance.Repository.index_hash.update(obj_dict)
-
-        f.close()
+        try:
+            head_elm = _load_container(instance, f)
+        finally:
+            f.close()
 
         head_obj = instance.Repository._load_element(head_elm)
 
@@ -33,6 +33,7 @@ from ion.core.data.storage_configuration_utility import BLOB_CACHE, COMMIT_CACHE
 
 from telephus.cassandra.ttypes import InvalidRequestException
 
+from ion.services.coi import datastore
 from ion.services.coi.datastore import ION_DATASETS_CFG, PRELOAD_CFG, ID_CFG, DataStoreClient, CDM_BOUNDED_ARRAY_TYPE
 # Pick three to test existence
 from ion.services.coi.datastore_bootstrap.ion_preload_config import HAS_A_ID, DATASET_RESOURCE_TYPE_ID, ROOT_USER_ID, NAME_CFG, CONTENT_ARGS_CFG, PREDICATE_CFG
@@ -55,7 +56,9 @@ class DataStoreTest(IonTestCase):
 
     services = [
             {'name':'ds1','module':'ion.services.coi.datastore','class':'DataStoreService',
-             'spawnargs':{PRELOAD_CFG:{ION_DATASETS_CFG:True, ION_AIS_RESOURCES_CFG:True}}
+             'spawnargs':{PRELOAD_CFG:{ION_DATASETS_CFG:True, ION_AIS_RESOURCES_CFG:True},
+                          # The only datastore on its backend - test the head cache too
+                          'head_cache_size':1000}
                 },
             {'name':'workbench_test1',
              'module':'ion.core.object.test.test_workbench',
@@ -172,6 +175,24 @@ class DataStoreTest(IonTestCase):
         is_there = yield self.ds1.workbench.test_existence(self.repo_key)
         self.assertEqual(is_there,True)
 
+    @defer.inlineCallbacks
+    def test_existing_repositories(self):
+
+        # Every preloaded entry exists - a second initialization creates nothing
+        entries = self.ds1._preload_entries()
+        keys = [entry[3][ID_CFG] for entry in entries]
+        existing = yield self.ds1.workbench.existing_repositories(keys + [self.repo_key])
+        self.assertEqual(existing, set(keys))
+
+        # Split over several queries
+        self.patch(datastore, 'EXISTENCE_QUERY_KEYS', 3)
+        existing = yield self.ds1.workbench.existing_repositories(keys + [self.repo_key])
+        self.assertEqual(existing, set(keys))
+
+        commits = len(self.ds1.c_store.kvs)
+        yield self.ds1.initialize_datastore()
+        self.assertEqual(len(self.ds1.c_store.kvs), commits)
+
 
     def test_pull_invalid(self):
 
@@ -527,6 +548,106 @@ class DataStoreTest(IonTestCase):
 
 
 
+    @defer.inlineCallbacks
+    def test_push_clear_pull_history(self):
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+
+        # Build up some history, pushing after each commit
+        for n in range(3):
+            result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+            self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+            repo.root_object.title = 'Title %d' % n
+            repo.commit('commit %d' % n)
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        commit_keys = set(self.wb1.workbench.list_repository_commits(repo))
+        self.assertEqual(len(commit_keys), 4)
+        del repo
+
+        self.wb1.workbench.clear()
+        self.ds1.workbench.clear()
+
+        # The datastore resolves the heads only, but the pull must still contain the whole history
+        result = yield self.wb1.workbench.pull('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        self.failUnless(self.ds1.workbench._head_cache.has_key(self.repo_key))
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+        self.assertEqual(set(self.wb1.workbench.list_repository_commits(repo)), commit_keys)
+
+        ab = yield repo.checkout('master')
+        self.assertEqual(ab.title,'Title 2')
+
+        # Push on top of history the datastore no longer holds in its workbench
+        ab.title = 'Title 3'
+        repo.commit('commit 3')
+
+        self.ds1.workbench.clear()
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        # The cached heads must not survive the push
+        self.failIf(self.ds1.workbench._head_cache.has_key(self.repo_key))
+
+        self.wb1.workbench.clear()
+        self.ds1.workbench.clear()
+
+        result = yield self.wb1.workbench.pull('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+        self.assertEqual(len(self.wb1.workbench.list_repository_commits(repo)), 5)
+
+        ab = yield repo.checkout('master')
+        self.assertEqual(ab.title,'Title 3')
+
+    @defer.inlineCallbacks
+    def test_push_diverged(self):
+
+        repo = self.wb1.workbench.get_repository(self.repo_key)
+        base = repo._current_branch.commitrefs[0]
+
+        repo.root_object.title = 'Pushed'
+        repo.commit('pushed commit')
+        pushed_key = repo._current_branch.commitrefs[0].MyId
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        # Commit on the base again - the branch diverges from what the datastore holds
+        repo._current_branch.commitrefs.SetLink(0, base)
+        ab = yield repo.checkout('master')
+        ab.title = 'Diverged'
+        repo.commit('diverged commit')
+        diverged_key = repo._current_branch.commitrefs[0].MyId
+
+        # The datastore resolves the heads only - it holds none of their history
+        self.ds1.workbench.clear()
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        ds_repo = self.ds1.workbench.get_repository(self.repo_key)
+        head_keys = set([cref.MyId for cref in ds_repo.current_heads()])
+        self.assertEqual(head_keys, set([pushed_key, diverged_key]))
+
+        # Pushing the branch behind the datastore head changes nothing
+        repo._current_branch.commitrefs.SetLink(0, base)
+        self.ds1.workbench.clear()
+
+        result = yield self.wb1.workbench.push_by_name('datastore',self.repo_key)
+        self.assertEqual(result.MessageResponseCode, result.ResponseCodes.OK)
+
+        ds_repo = self.ds1.workbench.get_repository(self.repo_key)
+        head_keys = set([cref.MyId for cref in ds_repo.current_heads()])
+        self.assertEqual(head_keys, set([pushed_key, diverged_key]))
+
     @defer.inlineCallbacks
     def test_push_clear_pull_many(self):
 
@@ -827,6 +948,51 @@ class DataStoreExtractDataTest(IonTestCase):
                 self.failUnlessEqual(int(data), counter)
                 counter += 1
         
+    @defer.inlineCallbacks
+    def test_full_one_ba_windowed(self):
+
+        # 1000 float64 values per chunk, at most two chunks in flight
+        wb = self.ds1.workbench
+        wb._extract_chunk_bytes = 8 * 1000
+        wb._extract_window = 2
+
+        sends = {'in_flight':0, 'max_in_flight':0}
+        send_data_chunk = wb._send_data_chunk
+
+        @defer.inlineCallbacks
+        def slow_send_data_chunk(data_routing_key, chunkmsg):
+            sends['in_flight'] += 1
+            sends['max_in_flight'] = max(sends['max_in_flight'], sends['in_flight'])
+            yield pu.asleep(0.01)
+            yield send_data_chunk(data_routing_key, chunkmsg)
+            sends['in_flight'] -= 1
+
+        wb._send_data_chunk = slow_send_data_chunk
+
+        msg = yield self.dsc.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
+        msg.structure_array_ref = self.first_struct_as_key
+
+        for size in (15, 40, 200):
+            bounds = msg.request_bounds.add()
+            bounds.origin = 0
+            bounds.size = size
+
+        msg.data_routing_key = "data_listener"
+
+        resp = yield self.dsc.extract_data(msg)
+        yield self._def_done
+
+        self.failUnlessEquals(sends['max_in_flight'], 2)
+        self.failUnlessEquals(len(self._recv_data), 200*40*15 / 1000)
+
+        # still contiguous, in order
+        counter = 0
+        for ndarray in (x['ndarray'] for x in self._recv_data):
+            for data in ndarray:
+                self.failUnlessEqual(int(data), counter)
+                counter += 1
+        self.failUnlessEquals(counter, 200*40*15)
+
     @defer.inlineCallbacks
     def test_partial_one_ba(self):
         msg = yield self.dsc.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
@@ -7,8 +7,9 @@
 """
 
 from ion.core.object import object_utils
+from ion.core.object import codec
 from ion.core.messaging.message_client import MessageClient
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 from ion.services.dm.distribution.publisher_subscriber import Publisher, Subscriber
 from ion.core import ioninit
 
@@ -52,6 +53,9 @@ LOGGING_ERROR_EVENT_ID = 3002
 LOGGING_CRITICAL_EVENT_ID = 3001
 DATABLOCK_EVENT_ID = 4001
 
+# Header set on a message carrying a batch of serialized events - the value is the number of events in the batch
+EVENT_BATCH_HEADER = 'event-batch'
+
 
 class EventPublisher(Publisher):
     """
@@ -93,6 +97,13 @@ class EventPublisher(Publisher):
           Alternatly, you may set the field in two steps:
               msg = yield SomePublisher.create_event()
               msg.direction = msg.Direction.EAST        # using the enum as defined in the message
+
+    Batching:
+        High frequency emitters may set batch_size and/or batch_interval in the initializer. Published events are
+        then accumulated per topic and sent as a single message carrying a list of serialized events, when either
+        batch_size events are pending or batch_interval seconds have passed since the first pending event.
+        EventSubscribers unpack a batch transparently into one ondata call per event. Call flush_batches to send
+        any pending events immediately - this is also done when the publisher is terminated.
     """
 
     msg_type = None
@@ -116,22 +127,43 @@ class EventPublisher(Publisher):
         
         return "%s.%s" % (str(self.event_id), str(origin))
         
-    def __init__(self, xp_name=None, routing_key=None, process=None, origin="unknown", *args, **kwargs):
+    def __init__(self, xp_name=None, routing_key=None, process=None, origin="unknown", batch_size=None, batch_interval=None, *args, **kwargs):
         """
         Initializer override.
         Sets defaults for the EventPublisher.
 
         @param origin   Sets the origin used in the topic when publishing the event.
                         This can be overridden when calling publish.
+        @param batch_size       If set, events are batched and sent when this many are pending for a topic.
+        @param batch_interval   If set, events are batched and pending events are sent at most this many seconds
+                                after the first one was published.
         """
         self._origin = origin
         self._mc = MessageClient(proc=process)
 
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+
+        # routing key -> list of serialized events waiting to be sent
+        self._batches = {}
+        # routing key -> DelayedCall which flushes that batch
+        self._batch_calls = {}
+
         xp_name = xp_name or get_events_exchange_point()
         routing_key = routing_key or "unknown"
 
         Publisher.__init__(self, xp_name=xp_name, routing_key=routing_key, process=process, *args, **kwargs)
 
+    @property
+    def batching(self):
+        """
+        True if this publisher accumulates events into batches.
+        """
+        return bool((self._batch_size is not None and self._batch_size > 1) or self._batch_interval)
+
+    def on_terminate(self, *args, **kwargs):
+        return self.flush_batches()
+
     def _set_msg_fields(self, msg, msgargs):
         """
         Helper method to set fields of a Message instance. Used by create_event.
@@ -203,9 +235,62 @@ class EventPublisher(Publisher):
         assert origin and origin != "unknown", 'Error - No origin publishing event message:\n %s' % str(event_msg)
 
         routing_key=self.topic(origin)
-        log.debug("Publishing message to %s" % routing_key)
 
-        yield self.publish(event_msg, routing_key=routing_key)
+        if self.batching:
+            yield self._add_to_batch(event_msg, routing_key)
+        else:
+            log.debug("Publishing message to %s" % routing_key)
+            yield self.publish(event_msg, routing_key=routing_key)
+
+    def _add_to_batch(self, event_msg, routing_key):
+        """
+        Serializes an event and adds it to the pending batch for the routing key. Sends the batch if it is full,
+        otherwise makes sure a flush is scheduled when batch_interval is set.
+        """
+        batch = self._batches.setdefault(routing_key, [])
+        batch.append(codec.pack_message_content(event_msg))
+
+        if self._batch_size is not None and len(batch) >= self._batch_size:
+            return self.flush_batch(routing_key)
+
+        if self._batch_interval and routing_key not in self._batch_calls:
+            self._batch_calls[routing_key] = reactor.callLater(self._batch_interval, self._flush_on_timer, routing_key)
+
+        return defer.succeed(None)
+
+    def _flush_on_timer(self, routing_key):
+        # The delayed call has fired - it must not be cancelled by flush_batch
+        self._batch_calls.pop(routing_key, None)
+
+        d = self.flush_batch(routing_key)
+        d.addErrback(lambda failure: log.error('Error sending event batch to %s: %s' % (routing_key, failure.getErrorMessage())))
+
+    def flush_batch(self, routing_key):
+        """
+        Sends the pending batch of events for a routing key, if any.
+
+        @param routing_key  The routing key (topic) of the batch to send.
+        @retval Deferred on send
+        """
+        call = self._batch_calls.pop(routing_key, None)
+        if call is not None and call.active():
+            call.cancel()
+
+        batch = self._batches.pop(routing_key, None)
+        if not batch:
+            return defer.succeed(None)
+
+        log.debug("Publishing batch of %d events to %s" % (len(batch), routing_key))
+        return self.publish(batch, routing_key=routing_key, headers={EVENT_BATCH_HEADER:len(batch)})
+
+    def flush_batches(self):
+        """
+        Sends all pending batches of events.
+
+        @retval Deferred which fires when all batches are sent
+        """
+        dl = [self.flush_batch(routing_key) for routing_key in self._batches.keys()]
+        return defer.DeferredList(dl, fireOnOneErrback=True, consumeErrors=True)
 
     @defer.inlineCallbacks
     def create_and_publish_event(self, **kwargs):
@@ -448,6 +533,37 @@ class EventSubscriber(Subscriber):
         log.debug("Listening to events on %s" % self._binding_key)
         yield Subscriber.on_activate(self, *args, **kwargs)
 
+    def _receive_handler(self, data, msg):
+        """
+        Handler for messages received by the SubscriberReceiver. A message carrying a batch of events (see
+        EventPublisher) is unpacked and ondata is called once for each event in order, with the same headers as
+        the batch message.
+        """
+        if data.get(EVENT_BATCH_HEADER, None) is None:
+            return Subscriber._receive_handler(self, data, msg)
+
+        msg.ack()
+        return self._receive_batch(data)
+
+    @defer.inlineCallbacks
+    def _receive_batch(self, data):
+
+        workbench = getattr(self._process, 'workbench', None)
+
+        for serialized in data.get('content'):
+            content = codec.unpack_message_content(serialized)
+
+            # The receiver adds GPB message content to the workbench - do the same for each event in the batch
+            if workbench is not None:
+                workbench.put_repository(content.Repository)
+
+            event_data = dict(data)
+            del event_data[EVENT_BATCH_HEADER]
+            event_data['content'] = content
+            event_data['encoding'] = codec.ION_R1_GPB
+
+            yield defer.maybeDeferred(self.ondata, event_data)
+
 class ResourceLifecycleEventSubscriber(EventSubscriber):
     """
     Event Notification Subscriber for Resource lifecycle events. Used as a concrete derived class, and as a base for
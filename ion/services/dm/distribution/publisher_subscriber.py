@@ -180,21 +180,26 @@ class Publisher(BasicLifecycleObject, PSCRegisterable):
         self._publisher_id = rc.id_list[0]
         log.debug('done setting up publisher')
 
-    def publish(self, data, routing_key=None):
+    def publish(self, data, routing_key=None, headers=None):
         """
         @brief Publish data on a specified resource id/topic
         @param data Data, OOI-format, protocol-buffer encoded
         @param routing_key Routing key to publish data on. Normally the Publisher uses the routing key specified at construction time,
                            but this param may be overriden here.
+        @param headers Optional dict of additional message headers.
         @retval Deferred on send, not RPC
         """
         routing_key = routing_key or self._routing_key
 
+        msg_headers = {'sender-name' : self._process.proc_name }
+        if headers:
+            msg_headers.update(headers)
+
         # set up the sender/sender-name to make it look as if the owning process is doing the sending, which at some level it
         # technically is.
         kwargs = { 'recipient' : routing_key,
                    'content'   : data,
-                   'headers'   : {'sender-name' : self._process.proc_name },
+                   'headers'   : msg_headers,
                    'operation' : None,
                    'sender'    : self._process.id.full }
 
@@ -15,7 +15,7 @@ from ion.services.dm.distribution.publisher_subscriber import PublisherFactory,
 from ion.services.dm.distribution.events import EventPublisher, ResourceLifecycleEventPublisher, ProcessLifecycleEventPublisher, \
                                                 EventSubscriber, ResourceLifecycleEventSubscriber, ProcessLifecycleEventSubscriber, \
                                                 InfoLoggingEventPublisher, InfoLoggingEventSubscriber, \
-                                                RESOURCE_LIFECYCLE_EVENT_ID
+                                                RESOURCE_LIFECYCLE_EVENT_ID, EVENT_BATCH_HEADER
 
 from ion.test.iontest import IonTestCase
 from ion.core import ioninit
@@ -231,6 +231,76 @@ class TestEventPublisher(IonTestCase):
         # Pause to make sure we catch the message
         yield pu.asleep(1.0)
         self.assertEqual(testsub.msgs[0]['content'].name, u"TestEvent")
+
+    @defer.inlineCallbacks
+    def test_batch_publish(self):
+        """
+        Test that a batching publisher only sends full batches until it is
+        flushed, and that the subscriber unpacks each batch into individual
+        events in order.
+        """
+        subproc = Process()
+        yield subproc.spawn()
+        test_origin = "%s.%s" % ("batch", str(subproc.id))
+        testsub = QuickEventSubscriber(origin=test_origin,
+                                       process=subproc)
+        yield testsub.initialize()
+        yield testsub.activate()
+        yield pu.asleep(1.0)
+
+        pub1 = InfoLoggingEventPublisher(process=self._proc,
+                                         origin=test_origin,
+                                         batch_size=3)
+        yield pub1.initialize()
+        yield pub1.activate()
+        self.failUnless(pub1.batching)
+
+        for i in range(5):
+            yield pub1.create_and_publish_event(name="TestEvent%d" % i)
+
+        # Only the first full batch has been sent
+        yield pu.asleep(1.0)
+        self.failUnlessEqual(len(testsub.msgs), 3)
+
+        yield pub1.flush_batches()
+        yield pu.asleep(1.0)
+        self.failUnlessEqual(len(testsub.msgs), 5)
+
+        names = [data['content'].name for data in testsub.msgs]
+        self.failUnlessEqual(names, [u"TestEvent%d" % i for i in range(5)])
+        self.failIf(EVENT_BATCH_HEADER in testsub.msgs[0])
+
+    @defer.inlineCallbacks
+    def test_batch_interval(self):
+        """
+        Test that pending events are sent when the batch interval expires.
+        """
+        pub1 = ResourceLifecycleEventPublisher(process=self._proc, origin="orig", batch_interval=0.2)
+        yield pub1.initialize()
+        yield pub1.activate()
+
+        self.sent = []
+        def fake_publish(data, routing_key="", headers=None):
+            self.sent.append((data, routing_key, headers))
+            return defer.succeed(True)
+
+        pub1.publish = fake_publish
+
+        yield pub1.create_and_publish_event(name="one")
+        yield pub1.create_and_publish_event(name="two")
+        self.failUnlessEqual(len(self.sent), 0)
+
+        yield pu.asleep(0.5)
+        self.failUnlessEqual(len(self.sent), 1)
+
+        data, routing_key, headers = self.sent[0]
+        self.failUnlessEqual(len(data), 2)
+        self.failUnlessEqual(routing_key, "%s.orig" % str(RESOURCE_LIFECYCLE_EVENT_ID))
+        self.failUnlessEqual(headers, {EVENT_BATCH_HEADER:2})
+
+        # nothing left to send
+        yield pub1.flush_batches()
+        self.failUnlessEqual(len(self.sent), 1)
         
 
 class TestEventSubscriber(IonTestCase):
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/cassandraload.py
+@brief Concurrent gets or indexed puts through the Cassandra connection pool,
+    against fake Thrift servers in this process or against a cluster
+"""
+
+import sys
+import time
+import random
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+from ion.core.data.cassandra_bootstrap import CassandraIndexedStoreBootstrap
+from ion.core.data.test.fake_cassandra import FakeCassandraServer, FakeCassandraHandler
+from ion.util.metrics import Histogram
+
+COLUMN_FAMILY = 'commits'
+INDEXES = ['repository_key', 'branch_name']
+
+OPS = ['get', 'put', 'put_describe']
+
+
+class CassandraLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['hosts', None, None, 'Comma separated host:port list of a cluster. Default: start fake servers.']
+        , ['keyspace', None, 'sysname', 'Keyspace on the cluster.']
+        , ['fake', None, 2, 'Number of fake servers to start.']
+        , ['delay', None, 0.002, 'Fake server response delay [seconds].']
+        , ['connections', 'c', 1, 'Connections per host.']
+        , ['concurrency', None, 16, 'Number of operations in flight.']
+        , ['op', None, 'get', 'get, put (indexed put) or put_describe (indexed put reading the schema each time).']
+        , ['keys', None, 100, 'Number of keys to put and get.']
+        , ['size', None, 1024, 'Value size [bytes].']
+    ]
+    optFlags = [
+    ]
+
+
+class CassandraLoadTest(LoadTest):
+    """
+    Keeps concurrency operations in flight through a CassandraIndexedStore and
+    reports operations/second, latency percentiles and how requests were
+    spread over the connections of its pool. put_describe reloads the schema
+    before each put, like index validation did before the schema was cached.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.cassandraload.CassandraLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = CassandraLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.concurrency = int(opts['concurrency'])
+        self.op = opts['op']
+        if self.op not in OPS:
+            raise ValueError('Unknown op %s' % self.op)
+
+        self.servers = []
+        if opts['hosts']:
+            hosts = opts['hosts'].split(',')
+            host, sep, port = hosts[0].partition(':')
+            storage_provider = {'host':host, 'port':int(port or 9160), 'hosts':hosts[1:]}
+        else:
+            handler = FakeCassandraHandler(indexes={COLUMN_FAMILY:INDEXES}, delay=float(opts['delay']))
+            for i in range(int(opts['fake'])):
+                server = FakeCassandraServer(handler)
+                server.start()
+                self.servers.append(server)
+            storage_provider = {'host':'127.0.0.1', 'port':self.servers[0].port,
+                                'hosts':['127.0.0.1:%d' % server.port for server in self.servers[1:]]}
+
+        self.store = CassandraIndexedStoreBootstrap(None, None, storage_provider, opts['keyspace'], COLUMN_FAMILY,
+                                                    connections_per_host=int(opts['connections']))
+        yield self.store.initialize()
+        yield self.store.activate()
+        pool = self.store._manager
+        while len(pool.available()) < len(pool.members):
+            yield pu.asleep(0.05)
+
+        self.value = 'x' * int(opts['size'])
+        self.keys = ['%s-key-%d' % (self.load_id, i) for i in range(int(opts['keys']))]
+        for key in self.keys:
+            yield self.store.put(key, self.value, self._index_attributes(key))
+
+        self.latency = Histogram(self.op)
+        self.cur_state['ops'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        yield self.store.terminate()
+        for server in self.servers:
+            yield server.stop()
+
+    def _index_attributes(self, key):
+        return {'repository_key':key, 'branch_name':'master'}
+
+    def generate_load(self):
+        return defer.DeferredList([self._worker() for i in range(self.concurrency)])
+
+    @defer.inlineCallbacks
+    def _worker(self):
+        while not self.is_shutdown():
+            key = random.choice(self.keys)
+            start = time.time()
+            if self.op == 'get':
+                yield self.store.get(key)
+            else:
+                if self.op == 'put_describe':
+                    yield self.store._describe_query_attributes()
+                yield self.store.put(key, self.value, self._index_attributes(key))
+            self.latency.record(time.time() - start)
+            self.cur_state['ops'] += 1
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('ops')
+        snapshot = self.latency.snapshot()
+        self.latency.reset()
+        spread = ' '.join('%s=%d' % (m['host'], m['requests']) for m in self.store._manager.stats())
+        print '#%s %.0f %ss/sec, p50 %.3f ms, p99 %.3f ms, requests %s' % (self.load_id, rate, self.op,
+                snapshot['p50_ms'], snapshot['p99_ms'], spread)
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.cassandraload.CassandraLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.cassandraload.CassandraLoadTest - --connections 4 --concurrency 64
+python -m ion.test.load_runner -s -c ion.test.loadtests.cassandraload.CassandraLoadTest - --hosts node1:9160,node2:9160
+python -m ion.test.load_runner -s -c ion.test.loadtests.cassandraload.CassandraLoadTest - --op put
+python -m ion.test.load_runner -s -c ion.test.loadtests.cassandraload.CassandraLoadTest - --op put_describe
+"""
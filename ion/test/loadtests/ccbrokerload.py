@@ -7,6 +7,8 @@
 @brief Creates load on an AMQP broker
 """
 
+import gc
+import resource
 import uuid
 import sys
 import time
@@ -25,6 +27,9 @@ from ion.core.process.process import ProcessFactory, Process, ProcessClient
 from ion.core.process.service_process import ServiceProcess, ServiceClient
 from ion.core.messaging.message_client import MessageClient
 from ion.core.object import object_utils
+from ion.core.object import workbench
+from ion.interact import conversation
+from ion.util import metrics
 
 import ion.util.ionlog
 log = ion.util.ionlog.getLogger(__name__)
@@ -103,8 +108,12 @@ class CCBrokerTestOptions(LoadTestOptions):
 
         , ['procs', None, 1, 'Number of capability container service processes to run.']
         , ['clients', None, 1, 'Number of capability container service clients to run.']
+        , ['conv-log', None, None, 'Conversation message log mode: off, headers, ring or full. Defaults to the configured mode.']
+        , ['release-batch', None, None, 'Ended conversations whose repositories are released together. Defaults to the configured batch.']
     ]
     optFlags = [
+        ['metrics', None, 'Enable container metrics and print them with each monitor output.']
+        , ['workbench', None, 'Print the cost of managing the workbench repositories and the memory held with each monitor output.']
     ]
 
 
@@ -206,6 +215,17 @@ class CCBrokerTest(LoadTest):
         self.proc_count = int(opts['procs'])
         self.client_count = int(opts['clients'])
 
+        if opts['conv-log']:
+            # Must be set before any process (and its conversation manager) is created
+            conversation.CF_conv_log_mode = opts['conv-log']
+
+        if opts['release-batch']:
+            # Must be set before any process (and its workbench) is created
+            workbench.CF_release_batch = int(opts['release-batch'])
+
+        if opts['metrics']:
+            metrics.registry.enable()
+
         self.cur_state['connects'] = 0
         self.cur_state['msgsend'] = 0
         self.cur_state['msgrecv'] = 0
@@ -284,8 +304,20 @@ class CCBrokerTest(LoadTest):
             if rates['connects']: pieces.append('made %.2f connects/sec' % rates['connects'])
             if rates['msgsend']: pieces.append('sent %.2f msgs/sec' % rates['msgsend'])
             if rates['msgrecv']: pieces.append('received %.2f msgs/sec' % rates['msgrecv'])
+            if self.opts.get('conv-log', None):
+                # Allocation/retention cost of the conversation log mode
+                pieces.append('conv log %s: %d live objects, %d log records' % (
+                    conversation.CF_conv_log_mode, len(gc.get_objects()), self._count_conv_log_records()))
             print '#%s] (%s) %s' % (self.load_id, time.strftime('%H:%M:%S'), ', '.join(pieces))
 
+            if self.opts.get('workbench', False):
+                print '#%s] %s' % (self.load_id, self._workbench_summary())
+
+            if self.opts.get('metrics', False):
+                # Latencies of the last monitor interval
+                print metrics.format_snapshot(metrics.registry.snapshot())
+                metrics.registry.clear()
+
 
     def summary(self):
         state = self.cur_state
@@ -301,7 +333,38 @@ class CCBrokerTest(LoadTest):
             , '-'*80
         ])
 
+    def _workbench_summary(self):
+        totals = {'conversations':0, 'releases':0, 'seconds':0.0, 'pending':0, 'repositories':0,
+                  'cached':0, 'cached_bytes':0, 'blob_bytes':0}
+        for proc in ioninit.container_instance.proc_manager.process_registry.kvs.itervalues():
+            wb = getattr(proc, 'workbench', None)
+            if wb is None:
+                continue
+            stats = wb.get_cache_stats()
+            for name in totals:
+                if name in stats:
+                    totals[name] += stats[name]
+            totals['blob_bytes'] += stats['blobs']['bytes']
+
+        totals['us'] = 1e6 * totals['seconds'] / (totals['conversations'] or 1)
+        # Peak resident memory of the load test process - kilobytes on linux
+        totals['maxrss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return ('workbench: %(conversations)d conversations ended, %(us).1f us each, %(releases)d releases, '
+                '%(pending)d pending, %(repositories)d repositories held, %(cached)d cached (%(cached_bytes)d bytes), '
+                '%(blob_bytes)d blob bytes, max rss %(maxrss)d kB') % totals
+
+    def _count_conv_log_records(self):
+        count = 0
+        for proc in ioninit.container_instance.proc_manager.process_registry.kvs.itervalues():
+            conv_manager = getattr(proc, 'conv_manager', None)
+            if conv_manager is None:
+                continue
+            for conv in conv_manager.conversations.itervalues():
+                count += len(conv.conv_log)
+        return count
+
 
 """
 python -m ion.test.load_runner -s -c ion.test.loadtests.ccbrokerload.CCBrokerTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.ccbrokerload.CCBrokerTest - --workbench --release-batch 1
 """
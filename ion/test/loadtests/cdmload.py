@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/cdmload.py
+@brief Work on the wrappers of a large CDM dataset held in a workbench
+"""
+
+import array
+import gc
+import sys
+import time
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+from ion.core.object import gpb_wrapper
+from ion.core.object import workbench
+from ion.core.object.object_utils import CDM_DATASET_TYPE
+
+MODES = ['access', 'extend', 'buffer', 'build']
+
+
+class CDMLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['mode', None, 'access', 'What to time: reading the fields of all variables and attributes (access), ' +
+                                   'filling an attribute array with extend (extend) or from a buffer (buffer), ' +
+                                   'building the dataset in a new repository (build).']
+        , ['variables', None, 1000, 'Variables in the dataset.']
+        , ['attributes', None, 10, 'Attributes of each variable.']
+        , ['values', None, 100000, 'Values filled into the attribute array per fill in extend and buffer mode.']
+    ]
+    optFlags = [
+    ]
+
+
+def build_dataset(repo, variables, attributes):
+    """
+    Fill the dataset at the root of repo with one group of variables sharing two dimensions
+    """
+    ds = repo.root_object
+    ds.MakeRootGroup('cdmload')
+    group = ds.root_group
+    time_dim = group.AddDimension('time', 1000, True)
+    depth_dim = group.AddDimension('depth', 20, False)
+    group.AddAttribute('title', group.DataType.STRING, 'CDM load test')
+
+    for i in xrange(variables):
+        var = group.AddVariable('var %d' % i, group.DataType.FLOAT, [time_dim, depth_dim])
+        for j in xrange(attributes):
+            var.AddAttribute('att %d' % j, group.DataType.STRING, 'value %d of var %d' % (j, i))
+    return ds
+
+
+def wrapper_memory():
+    """
+    @retval count and bytes of the wrapper and structure element objects, not counting the GPB messages they hold
+    """
+    count = 0
+    size = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, (gpb_wrapper.Wrapper, gpb_wrapper.StructureElement)):
+            count += 1
+            size += sys.getsizeof(obj)
+            if hasattr(obj, '__dict__'):
+                size += sys.getsizeof(obj.__dict__)
+    return count, size
+
+
+class CDMLoadTest(LoadTest):
+    """
+    Builds a dataset of --variables variables with --attributes attributes
+    each and commits it, then reports the memory per wrapper and structure
+    element. In access mode it keeps reading the name and data type of every
+    variable and attribute and the values of the attributes, and reports
+    field reads/second. In extend and buffer mode it keeps replacing the
+    --values doubles of a group attribute, either by deleting them and calling
+    extend with an array module buffer or with set_all on the same buffer, and
+    reports values/second. In build mode it keeps building the dataset in a
+    new repository and reports variables built/second.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.cdmload.CDMLoadTest -
+    """
+
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = CDMLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.mode = opts['mode']
+        if self.mode not in MODES:
+            raise ValueError('Unknown mode %s' % self.mode)
+        self.variables = int(opts['variables'])
+        self.attributes = int(opts['attributes'])
+        self.values = int(opts['values'])
+
+        self.wb = workbench.WorkBench('CDM load test')
+
+        start = time.time()
+        self.repo = self.wb.create_repository(CDM_DATASET_TYPE)
+        self.ds = build_dataset(self.repo, self.variables, self.attributes)
+        built = time.time()
+        self.repo.commit('CDM load test dataset')
+        print '#%s built %d variables in %.2f sec, committed in %.2f sec' % (self.load_id, self.variables,
+                built - start, time.time() - built)
+
+        count, size = wrapper_memory()
+        print '#%s %d wrappers and structure elements, %.1f bytes each' % (self.load_id, count,
+                float(size) / (count or 1))
+
+        self.cur_state['reads'] = 0
+        self.cur_state['values'] = 0
+        self.cur_state['variables'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    def tearDown(self):
+        self._disable_monitor()
+        self.wb.clear()
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        if self.mode == 'access':
+            yield self._generate_access()
+        elif self.mode == 'build':
+            yield self._generate_build()
+        else:
+            yield self._generate_fill()
+
+    @defer.inlineCallbacks
+    def _generate_access(self):
+        group = self.ds.root_group
+        while not self.is_shutdown():
+            reads = 0
+            for var in group.variables:
+                var.name
+                var.data_type
+                reads += 2
+                for att in var.attributes:
+                    att.name
+                    att.data_type
+                    att.array.value[0]
+                    reads += 3
+            self.cur_state['reads'] += reads
+
+            # Let the monitor and shutdown run
+            yield pu.asleep(0)
+
+    @defer.inlineCallbacks
+    def _generate_fill(self):
+        group = self.ds.root_group
+        group.AddAttribute('samples', group.DataType.DOUBLE, [])
+        value = group.FindAttributeByName('samples').array.value
+        buffer = array.array('d', xrange(self.values))
+
+        while not self.is_shutdown():
+            if self.mode == 'extend':
+                del value[:]
+                value.extend(buffer)
+            else:
+                value.set_all(buffer)
+            assert len(value) == self.values
+            self.cur_state['values'] += self.values
+
+            # Let the monitor and shutdown run
+            yield pu.asleep(0)
+
+    @defer.inlineCallbacks
+    def _generate_build(self):
+        while not self.is_shutdown():
+            repo = self.wb.create_repository(CDM_DATASET_TYPE)
+            build_dataset(repo, self.variables, self.attributes)
+            self.wb.clear_repository(repo)
+            self.cur_state['variables'] += self.variables
+
+            # Let the monitor and shutdown run
+            yield pu.asleep(0)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        if self.mode == 'access':
+            rate = self._get_rate('reads')
+            print '#%s %.0f field reads/sec in %d variables of %d attributes' % (self.load_id, rate,
+                    self.variables, self.attributes)
+        elif self.mode == 'build':
+            rate = self._get_rate('variables')
+            print '#%s %.0f variables/sec built with %d attributes each' % (self.load_id, rate,
+                    self.attributes)
+        else:
+            rate = self._get_rate('values')
+            print '#%s %.0f values/sec filled by %s in batches of %d' % (self.load_id, rate,
+                    self.mode, self.values)
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.cdmload.CDMLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.cdmload.CDMLoadTest - --variables 10000 --attributes 5
+python -m ion.test.load_runner -s -c ion.test.loadtests.cdmload.CDMLoadTest - --mode extend --variables 0 --values 1000000
+python -m ion.test.load_runner -s -c ion.test.loadtests.cdmload.CDMLoadTest - --mode buffer --variables 0 --values 1000000
+python -m ion.test.load_runner -s -c ion.test.loadtests.cdmload.CDMLoadTest - --mode build --variables 2000
+"""
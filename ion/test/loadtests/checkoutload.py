@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/checkoutload.py
+@brief Checkouts of old versions of a repository with a long history, by
+    commit id or by date
+"""
+
+import sys
+import time
+import random
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+from ion.core.object import object_utils
+from ion.core.object import workbench
+from ion.util.metrics import Histogram
+
+ADDRESSBOOK_TYPE = object_utils.create_type_identifier(object_id=20002, version=1)
+
+MODES = ['commit', 'date']
+
+
+class CheckoutLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['commits', 'c', 10000, 'Commits in the history of the repository.']
+        , ['mode', None, 'commit', 'Check out by commit id (commit) or by date (date).']
+    ]
+    optFlags = [
+    ]
+
+
+class CheckoutLoadTest(LoadTest):
+    """
+    Commits --commits versions of an addressbook to one branch, then keeps
+    checking out a random old version by commit id or by date and checking
+    that it is the expected one. The first checkout indexes the
+    history; it is reported separately. Reports checkouts/second and
+    checkout latency.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.checkoutload.CheckoutLoadTest -
+    """
+
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = CheckoutLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.mode = opts['mode']
+        if self.mode not in MODES:
+            raise ValueError('Unknown mode %s' % self.mode)
+        self.commits = int(opts['commits'])
+
+        self.wb = workbench.WorkBench('Checkout load test')
+
+        start = time.time()
+        self.repo, ab = self.wb.init_repository(ADDRESSBOOK_TYPE)
+        self.versions = []
+        for i in xrange(self.commits):
+            ab.title = 'Version %d' % i
+            key = self.repo.commit('Version %d' % i)
+            self.versions.append((key, self.repo._commit_index[key].date))
+        print '#%s committed %d versions in %.2f sec' % (self.load_id, self.commits, time.time() - start)
+
+        self.latency = Histogram('checkout')
+        self.cur_state['checkouts'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    def tearDown(self):
+        self._disable_monitor()
+        self.wb.clear()
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            version = random.randrange(self.commits)
+            key, date = self.versions[version]
+
+            start = time.time()
+            if self.mode == 'commit':
+                ab = yield self.repo.checkout(branchname='master', commit_id=key)
+            else:
+                ab = yield self.repo.checkout(branchname='master', older_than=date)
+            elapsed = time.time() - start
+
+            # Commits made in the same clock tick can not be told apart by date
+            if ab.title != 'Version %d' % version and self.repo._current_branch.commitrefs[0].date != date:
+                raise AssertionError('Checked out %s instead of version %d' % (ab.title, version))
+
+            if self.cur_state['checkouts'] == 0:
+                print '#%s first checkout took %.1f ms' % (self.load_id, elapsed * 1000)
+            else:
+                self.latency.record(elapsed)
+            self.cur_state['checkouts'] += 1
+
+            # Let the monitor and shutdown run
+            yield pu.asleep(0)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('checkouts')
+        snapshot = self.latency.snapshot()
+        self.latency.reset()
+        print '#%s %.2f checkouts/sec by %s of %d commits, p50 %.2f ms, p99 %.2f ms' % (self.load_id,
+                rate, self.mode, self.commits, snapshot['p50_ms'], snapshot['p99_ms'])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.checkoutload.CheckoutLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.checkoutload.CheckoutLoadTest - --mode date --commits 20000
+"""
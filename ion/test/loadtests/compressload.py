@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/compressload.py
+@brief Compression ratio and throughput of the compressed store codec on the
+    blobs of the datastore bootstrap datasets
+"""
+
+import sys
+import time
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTestOptions
+from ion.test.loadtests.ccbrokerload import CCBrokerTest
+import ion.util.procutils as pu
+from ion.core import bootstrap
+from ion.core.data import store
+from ion.core.data import compressed_store
+from ion.services.coi.datastore_bootstrap.ion_preload_config import PRELOAD_CFG, ION_DATASETS_CFG, ION_AIS_RESOURCES_CFG
+
+MB = 1024.0 * 1024.0
+
+
+class CompressLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['host', 'h', 'localhost', 'Broker host name.']
+        , ['port', 'p', 5672, 'Broker port.']
+        , ['vhost', 'v', '/', 'Broker vhost.']
+        , ['heartbeat', None, 0, 'Heartbeat rate [seconds].']
+        , ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+
+        , ['levels', None, '1,6,9', 'Comma separated zlib levels.']
+        , ['threshold', 't', 512, 'Size in bytes from which blobs are compressed.']
+    ]
+    optFlags = [
+    ]
+
+
+class CompressLoadTest(CCBrokerTest):
+    """
+    Starts a datastore preloading the bootstrap datasets into the in memory
+    blob store, then encodes and decodes all of its blobs with each zlib level
+    in turn. Reports per level the ratio of blob bytes to stored bytes and
+    the encode and decode throughput in MB of blobs per second.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.compressload.CompressLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = CompressLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.levels = [int(level) for level in opts['levels'].split(',')]
+        self.threshold = int(opts['threshold'])
+
+        yield self._start_container()
+
+        services = [
+            {'name':'ds1', 'module':'ion.services.coi.datastore', 'class':'DataStoreService',
+             'spawnargs':{PRELOAD_CFG:{ION_DATASETS_CFG:True, ION_AIS_RESOURCES_CFG:True},
+                          'blobs':'ion.core.data.store.Store'}},
+        ]
+        yield bootstrap.spawn_processes(services, sup=self.sup)
+
+        self.blobs = store.Store.kvs.values()
+        self.blob_bytes = sum(len(blob) for blob in self.blobs)
+        large = [blob for blob in self.blobs if len(blob) >= self.threshold]
+        print '#%s %d blobs, %.2f MB, %d blobs (%.2f MB) above the threshold of %d bytes' % (self.load_id,
+                len(self.blobs), self.blob_bytes / MB, len(large), sum(len(blob) for blob in large) / MB, self.threshold)
+
+        for level in self.levels:
+            for stat in ('encode_secs', 'decode_secs', 'bytes', 'stored'):
+                self.cur_state['%d_%s' % (level, stat)] = 0
+
+        self._enable_monitor(self.monitor_rate)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        yield self._stop_container()
+        store.Store.kvs.clear()
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            for level in self.levels:
+                start = time.time()
+                encoded = [compressed_store.encode(blob, level, self.threshold) for blob in self.blobs]
+                encoded_at = time.time()
+                decoded = [compressed_store.decode(value) for value in encoded]
+                decoded_at = time.time()
+
+                if decoded != self.blobs:
+                    raise AssertionError('Decoded blobs differ from the originals at level %d' % level)
+
+                state = self.cur_state
+                state['%d_encode_secs' % level] += encoded_at - start
+                state['%d_decode_secs' % level] += decoded_at - encoded_at
+                state['%d_bytes' % level] += self.blob_bytes
+                state['%d_stored' % level] += sum(len(value) for value in encoded)
+
+                # Let the monitor and shutdown run
+                yield pu.asleep(0)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+
+        # Levels run interleaved, so rate each one over the time spent in it rather than over wall clock time
+        results = []
+        for level in self.levels:
+            delta = {}
+            for stat in ('encode_secs', 'decode_secs', 'bytes', 'stored'):
+                name = '%d_%s' % (level, stat)
+                delta[stat] = self.cur_state[name] - self.base_state.get(name, 0)
+            mb = delta['bytes'] / MB
+            results.append('level %d: ratio %.2f, encode %.1f MB/sec, decode %.1f MB/sec' % (level,
+                    float(delta['bytes']) / (delta['stored'] or 1),
+                    mb / (delta['encode_secs'] or 0.0001), mb / (delta['decode_secs'] or 0.0001)))
+        print '#%s %s' % (self.load_id, '; '.join(results))
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.compressload.CompressLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.compressload.CompressLoadTest - --levels 1,3,6,9 --threshold 128
+"""
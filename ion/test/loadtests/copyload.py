@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/copyload.py
+@brief Deep copies of a large structure from one repository to another
+"""
+
+import sys
+import time
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+from ion.core.object import object_utils
+from ion.core.object import workbench
+from ion.util.metrics import Histogram
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+ADDRESSLINK_TYPE = object_utils.create_type_identifier(object_id=20003, version=1)
+
+
+class CopyLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['objects', 'o', 100000, 'Objects in the copied structure.']
+        , ['changed', 'c', 10, 'Objects of each copy changed before it is committed.']
+    ]
+    optFlags = [
+    ]
+
+
+class CopyLoadTest(LoadTest):
+    """
+    Commits an addressbook linking --objects persons in one repository, then
+    repeatedly deep copies it into a new repository, changes a few of the
+    copied persons and commits the copy. Reports copies/second and the
+    latency of the copy alone and of the copy and commit together.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.copyload.CopyLoadTest -
+    """
+
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = CopyLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.objects = int(opts['objects'])
+        self.changed = int(opts['changed'])
+
+        self.wb = workbench.WorkBench('Copy load test')
+
+        start = time.time()
+        repo = self.wb.create_repository(ADDRESSLINK_TYPE)
+        ab = repo.root_object
+        ab.title = 'Copy load test %s' % self.load_id
+        for i in xrange(self.objects):
+            person = repo.create_object(PERSON_TYPE)
+            person.name = 'Person %d' % i
+            person.id = i
+            ab.person.add()
+            ab.person[i] = person
+        repo.commit('Initial state')
+        self.source = repo.root_object
+        print '#%s created and committed %d objects in %.2f sec' % (self.load_id, self.objects, time.time() - start)
+
+        self.copy_latency = Histogram('copy')
+        self.commit_latency = Histogram('copy and commit')
+        self.cur_state['copies'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    def tearDown(self):
+        self._disable_monitor()
+        self.wb.clear()
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            start = time.time()
+            repo = self.wb.create_repository()
+            repo.root_object = self.source
+            copied = time.time()
+
+            ab = repo.root_object
+            for i in xrange(self.changed):
+                ab.person[(self.cur_state['copies'] * self.changed + i) % self.objects].email = 'copy@copyload'
+            repo.commit('Copy %d' % self.cur_state['copies'])
+            committed = time.time()
+
+            self.wb.clear_repository(repo)
+
+            self.copy_latency.record(copied - start)
+            self.commit_latency.record(committed - start)
+            self.cur_state['copies'] += 1
+
+            # Let the monitor and shutdown run
+            yield pu.asleep(0)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('copies')
+        copy = self.copy_latency.snapshot()
+        commit = self.commit_latency.snapshot()
+        self.copy_latency.reset()
+        self.commit_latency.reset()
+        print '#%s %.2f copies/sec of %d objects, copy p50 %.1f ms, copy and commit p50 %.1f ms, p99 %.1f ms' % (
+                self.load_id, rate, self.objects, copy['p50_ms'], commit['p50_ms'], commit['p99_ms'])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.copyload.CopyLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.copyload.CopyLoadTest - --objects 10000 --changed 100
+"""
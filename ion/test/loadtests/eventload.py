@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/eventload.py
+@brief Measures event notification throughput with and without publisher batching
+"""
+
+import sys
+import time
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTestOptions
+from ion.test.loadtests.ccbrokerload import CCBrokerTest
+from ion.core.process.process import Process
+from ion.services.dm.distribution.events import InfoLoggingEventPublisher, InfoLoggingEventSubscriber
+import ion.util.procutils as pu
+
+import ion.util.ionlog
+log = ion.util.ionlog.getLogger(__name__)
+
+
+class EventLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['host', 'h', 'localhost', 'Broker host name.']
+        , ['port', 'p', 5672, 'Broker port.']
+        , ['vhost', 'v', '/', 'Broker vhost.']
+        , ['heartbeat', None, 0, 'Heartbeat rate [seconds].']
+        , ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+
+        , ['rate', 'r', 1000, 'Target number of events published per second.']
+        , ['batch-size', None, 0, 'Publisher batch size. 0 disables batching by count.']
+        , ['batch-interval', None, 0, 'Publisher batch interval [seconds]. 0 disables batching by time.']
+    ]
+    optFlags = [
+    ]
+
+
+class EventLoadTest(CCBrokerTest):
+    """
+    Publishes InfoLogging events at a target rate to a single subscriber and reports the sent and received event
+    rates. Run it once without batching and once with batching to compare, e.g.:
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.eventload.EventLoadTest - --rate 1000
+    python -m ion.test.load_runner -s -c ion.test.loadtests.eventload.EventLoadTest - --rate 10000 --batch-size 100 --batch-interval 0.05
+    python -m ion.test.load_runner -s -c ion.test.loadtests.eventload.EventLoadTest - --rate 100000 --batch-size 1000 --batch-interval 0.05
+    """
+
+    # Number of publish slices per second - the target rate is spread evenly over them
+    SLICES = 10
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = EventLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.rate = int(opts['rate'])
+        self.batch_size = int(opts['batch-size']) or None
+        self.batch_interval = float(opts['batch-interval']) or None
+
+        self.cur_state['msgsend'] = 0
+        self.cur_state['msgrecv'] = 0
+        self.cur_state['errors'] = 0
+        self.cur_state['connects'] = 0
+
+        yield self._start_container()
+
+        self._enable_monitor(self.monitor_rate)
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        origin = 'eventload.%s' % self.load_id
+
+        subproc = Process()
+        yield subproc.spawn()
+        self.sub = InfoLoggingEventSubscriber(origin=origin, process=subproc)
+        self.sub.ondata = self._on_event
+        yield subproc.register_life_cycle_object(self.sub)
+
+        pubproc = Process()
+        yield pubproc.spawn()
+        self.pub = InfoLoggingEventPublisher(process=pubproc, origin=origin,
+                                             batch_size=self.batch_size, batch_interval=self.batch_interval)
+        yield pubproc.register_life_cycle_object(self.pub)
+
+        per_slice = max(1, self.rate / self.SLICES)
+        slice_time = 1.0 / self.SLICES
+
+        while True:
+            if self.is_shutdown():
+                break
+
+            start = time.time()
+            for i in xrange(per_slice):
+                try:
+                    yield self.pub.create_and_publish_event(name='LoadEvent')
+                    self.cur_state['msgsend'] += 1
+                except Exception, ex:
+                    log.exception('Error publishing event')
+                    self.cur_state['errors'] += 1
+
+            remaining = slice_time - (time.time() - start)
+            # Always give the reactor a chance to deliver received events
+            yield pu.asleep(max(remaining, 0.0))
+
+        yield self.pub.flush_batches()
+
+    def _on_event(self, data):
+        self.cur_state['msgrecv'] += 1
+
+        # Release the event repository right away so the subscriber workbench does not grow during the run
+        content = data['content']
+        workbench = self.sub._process.workbench
+        if content.Repository.repository_key in workbench._repos:
+            workbench.clear_repository(content.Repository)
+
+    def summary(self):
+        state = self.cur_state
+        secsElapsed = (state['_time'] - self.start_state['_time']) or 0.0001
+
+        print '\n'.join([
+              '-'*80
+            , '#%s Summary (target rate %d events/sec, batch size %s, batch interval %s)' % (
+                  self.load_id, self.rate, self.batch_size, self.batch_interval)
+            , 'Test ran for %.2f seconds, with a total of %d published events and %d received events.' % (
+                  secsElapsed, state['msgsend'], state['msgrecv'])
+            , 'The average events/second was %.2f published and %.2f received.' % (
+                state['msgsend']/secsElapsed, state['msgrecv']/secsElapsed)
+            , '-'*80
+        ])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.eventload.EventLoadTest - --rate 1000
+"""
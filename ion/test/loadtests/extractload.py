@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/extractload.py
+@brief Extraction of a large variable from a datastore, end to end: from the
+    extract_data request to the last data chunk received
+"""
+
+import sys
+import time
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTestOptions
+from ion.test.loadtests.ccbrokerload import CCBrokerTest
+from ion.core import bootstrap, ioninit
+from ion.core.messaging.receiver import Receiver, WorkerReceiver
+from ion.core.object.object_utils import ARRAY_STRUCTURE_TYPE, CDM_ARRAY_FLOAT64_TYPE
+from ion.core.object.workbench import BLOBS_MESSAGE_TYPE, DATA_REQUEST_MESSAGE_TYPE
+from ion.services.coi.datastore import DataStoreClient, CDM_BOUNDED_ARRAY_TYPE
+from ion.util.metrics import Histogram
+
+MB = 1024.0 * 1024.0
+
+
+class ExtractLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['host', 'h', 'localhost', 'Broker host name.']
+        , ['port', 'p', 5672, 'Broker port.']
+        , ['vhost', 'v', '/', 'Broker vhost.']
+        , ['heartbeat', None, 0, 'Heartbeat rate [seconds].']
+        , ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+
+        , ['values', None, 1000000, 'Float64 values in the extracted variable.']
+        , ['window', 'w', None, 'Data chunks in flight. Default: the datastore configuration.']
+        , ['chunk-bytes', None, None, 'Bytes of values per data chunk. Default: the datastore configuration.']
+    ]
+    optFlags = [
+    ]
+
+
+class ExtractLoadTest(CCBrokerTest):
+    """
+    Puts an array structure of one bounded array of float64 values into a
+    datastore, then repeatedly extracts all of it to a data listener and
+    reports extractions/second, MB of values/second and extraction latency.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.extractload.ExtractLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = ExtractLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.values = int(opts['values'])
+
+        spawnargs = {}
+        if opts['window'] is not None:
+            spawnargs['extract_window'] = int(opts['window'])
+        if opts['chunk-bytes'] is not None:
+            spawnargs['extract_chunk_bytes'] = int(opts['chunk-bytes'])
+
+        yield self._start_container()
+
+        services = [
+            {'name':'ds1', 'module':'ion.services.coi.datastore', 'class':'DataStoreService',
+             'spawnargs':spawnargs},
+            {'name':'extractload_wb', 'module':'ion.core.object.test.test_workbench', 'class':'WorkBenchProcess',
+             'spawnargs':{'proc-name':'extractload_wb'}},
+        ]
+        yield bootstrap.spawn_processes(services, sup=self.sup)
+
+        child_id = yield self.sup.get_child_id('extractload_wb')
+        self.proc = ioninit.container_instance.proc_manager.process_registry.kvs.get(child_id)
+
+        # One bounded array holding all values
+        repo = self.proc.workbench.create_repository(ARRAY_STRUCTURE_TYPE)
+        content = repo.root_object
+        ba = repo.create_object(CDM_BOUNDED_ARRAY_TYPE)
+        bounds = ba.bounds.add()
+        bounds.origin = 0
+        bounds.size = self.values
+        ndarray = repo.create_object(CDM_ARRAY_FLOAT64_TYPE)
+        ndarray.value.extend(float(i) for i in xrange(self.values))
+        ba.ndarray = ndarray
+        ref = content.bounded_arrays.add()
+        ref.SetLink(ba)
+        repo.commit()
+        self.structure_key = content.MyId
+
+        msg = yield self.proc.message_client.create_instance(BLOBS_MESSAGE_TYPE)
+        for key, element in repo.index_hash.iteritems():
+            link = msg.blob_elements.add()
+            link.SetLink(msg.Repository._wrap_message_object(element._element))
+        self.dsc = DataStoreClient(proc=self.proc)
+        yield self.dsc.put_blobs(msg)
+
+        self.routing_key = 'extractload_%s' % self.load_id
+        self.done = None
+        consumer_config = {'exchange':'magnet.topic',
+                           'exchange_type':'topic',
+                           'durable':False,
+                           'auto_delete':True,
+                           'mandatory':True,
+                           'immediate':False,
+                           'warn_if_exists':False,
+                           'routing_key':self.routing_key,
+                           'queue':None,
+                           }
+        receiver = WorkerReceiver(self.routing_key, process=self.proc, scope=Receiver.SCOPE_GLOBAL,
+                                  handler=self._received, consumer_config=consumer_config)
+        yield receiver.attach()
+
+        self.latency = Histogram('extract')
+        self.cur_state['extractions'] = 0
+        self.cur_state['bytes'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        yield self._stop_container()
+
+    @defer.inlineCallbacks
+    def _received(self, data, msg):
+        content = data['content']
+        self.cur_state['bytes'] += 8 * len(content.ndarray.value)
+        if content.done:
+            self.done.callback(True)
+        yield msg.ack()
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            request = yield self.proc.message_client.create_instance(DATA_REQUEST_MESSAGE_TYPE)
+            request.structure_array_ref = self.structure_key
+            bounds = request.request_bounds.add()
+            bounds.origin = 0
+            bounds.size = self.values
+            request.data_routing_key = self.routing_key
+
+            self.done = defer.Deferred()
+            start = time.time()
+            yield self.dsc.extract_data(request)
+            yield self.done
+            self.latency.record(time.time() - start)
+            self.cur_state['extractions'] += 1
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('extractions')
+        mb_rate = self._get_rate('bytes') / MB
+        snapshot = self.latency.snapshot()
+        self.latency.reset()
+        print '#%s %.2f extractions/sec of %d values, %.1f MB/sec, p50 %.0f ms, p99 %.0f ms' % (self.load_id,
+                rate, self.values, mb_rate, snapshot['p50_ms'], snapshot['p99_ms'])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.extractload.ExtractLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.extractload.ExtractLoadTest - --window 1 --chunk-bytes 80000
+"""
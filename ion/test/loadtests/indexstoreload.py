@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/indexstoreload.py
+@brief Range queries on the in memory IndexStore: sorted index vs. a linear scan of the index values
+"""
+
+import sys
+import time
+import random
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+from ion.core.data import store
+from ion.core.data.store import Query
+
+MODES = ['sorted', 'scan']
+
+
+class IndexStoreLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['mode', None, 'all', 'Range evaluation: sorted, scan or all.']
+        , ['rows', 'r', 1000000, 'Number of rows in the store.']
+        , ['width', 'w', 100, 'Number of distinct timestamps matched by each range query.']
+        , ['batch', 'b', 10, 'Number of queries between reactor yields.']
+    ]
+    optFlags = [
+    ]
+
+
+class IndexStoreLoadTest(LoadTest):
+    """
+    Fills an IndexStore with rows having a unique timestamp attribute and a
+    'kind' attribute shared by all rows, then runs BETWEEN queries on the
+    timestamp (plus the required equality predicate on kind) and reports
+    queries/second per mode:
+        sorted - IndexStore.query, bisecting the sorted attribute index
+        scan   - the same query answered by testing every distinct indexed
+                 value, as GT was evaluated before the indexes were sorted
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.indexstoreload.IndexStoreLoadTest -
+    """
+
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = IndexStoreLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.rows = int(opts['rows'])
+        self.width = int(opts['width'])
+        self.batch = int(opts['batch'])
+        self.modes = MODES if opts['mode'] == 'all' else [opts['mode']]
+
+        store.IndexStore.kvs.clear()
+        store.IndexStore.indices.clear()
+        self.store = store.IndexStore(indices=['kind', 'timestamp'])
+
+        start = time.time()
+        for i in xrange(self.rows):
+            self.store.put('key%d' % i, 'value', {'kind':'sample', 'timestamp':'%012d' % i})
+        print '#%s loaded %d rows in %.1f seconds' % (self.load_id, self.rows, time.time() - start)
+
+        for mode in self.modes:
+            self.cur_state[mode] = 0
+            self.cur_state[mode + '_secs'] = 0.0
+
+        self._enable_monitor(self.monitor_rate)
+        return defer.succeed(None)
+
+    def tearDown(self):
+        self._disable_monitor()
+        store.IndexStore.kvs.clear()
+        store.IndexStore.indices.clear()
+        return defer.succeed(None)
+
+    def _query(self):
+        low = random.randint(0, max(0, self.rows - self.width))
+        query = Query()
+        query.add_predicate_eq('kind', 'sample')
+        query.add_predicate_between('timestamp', '%012d' % low, '%012d' % (low + self.width - 1))
+        return query
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            for mode in self.modes:
+                start = time.time()
+                for i in xrange(self.batch):
+                    query = self._query()
+                    if mode == 'sorted':
+                        d = self.store.query(query)
+                    else:
+                        d = self._scan_query(query)
+                    d.addCallback(self._check_result)
+                self.cur_state[mode + '_secs'] += time.time() - start
+                self.cur_state[mode] += self.batch
+
+                # Let the monitor and shutdown run
+                yield pu.asleep(0)
+
+    def _scan_query(self, query):
+        """
+        Evaluates the query with a linear scan over all distinct values of the range attribute
+        """
+        (eq_name, eq_value, eq_type), (name, (low, high), range_type) = query.get_predicates()
+        kindex = self.store.indices[name]
+        matches = set()
+        for attr_val in kindex.keys():
+            if low <= attr_val <= high:
+                matches.update(kindex.get(attr_val, set()))
+        keys = matches.intersection(self.store.indices[eq_name].get(eq_value, set()))
+        result = {}
+        for k in keys:
+            result[k] = self.store.kvs[k].copy()
+        return defer.succeed(result)
+
+    def _check_result(self, result):
+        if len(result) != self.width:
+            raise AssertionError('Expected %d rows, got %d' % (self.width, len(result)))
+
+    def monitor(self, output=True):
+        if not output:
+            return
+
+        # Modes run interleaved, so rate each one over the time spent in it rather than over wall clock time
+        rates = []
+        for mode in self.modes:
+            secs = self.cur_state[mode + '_secs'] - self.base_state.get(mode + '_secs', 0.0)
+            queries = self.cur_state[mode] - self.base_state.get(mode, 0)
+            rates.append('%s: %.1f queries/sec' % (mode, queries / (secs or 0.0001)))
+        print '#%s %s' % (self.load_id, ', '.join(rates))
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.indexstoreload.IndexStoreLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.indexstoreload.IndexStoreLoadTest - --mode sorted --rows 100000 --width 1000
+"""
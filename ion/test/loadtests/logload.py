@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/logload.py
+@brief Measures the cost of disabled debug log calls: eager formatting vs. deferred formatting
+"""
+
+import sys
+import time
+import logging
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+import ion.util.ionlog
+
+MODES = ['eager', 'stdlib', 'deferred', 'guarded']
+
+
+class LogLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['mode', None, 'all', 'Log call style: eager, stdlib, deferred, guarded or all.']
+        , ['batch', 'b', 10000, 'Number of log calls between reactor yields.']
+    ]
+    optFlags = [
+    ]
+
+
+class LogLoadTest(LoadTest):
+    """
+    Issues debug log calls with the logger set to INFO, i.e. the common production case where debug output is off,
+    and reports calls/second per call style:
+        eager    - stdlib logger, message formatted with % in the call
+        stdlib   - stdlib logger, format arguments passed to the call
+        deferred - IonLogger, format arguments passed to the call
+        guarded  - IonLogger, call guarded by isEnabledFor
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.logload.LogLoadTest -
+    """
+
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = LogLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.batch = int(opts['batch'])
+        self.modes = MODES if opts['mode'] == 'all' else [opts['mode']]
+
+        name = '%s.%s' % (__name__, self.load_id)
+        self.stdlog = ion.util.ionlog.getLogger(name)
+        self.ionlog = ion.util.ionlog.getIonLogger(name)
+        ion.util.ionlog.set_log_level(name, logging.INFO)
+
+        self.content = {'key':'value', 'list':range(10)}
+
+        for mode in self.modes:
+            self.cur_state[mode] = 0
+            self.cur_state[mode + '_secs'] = 0.0
+
+        self._enable_monitor(self.monitor_rate)
+        return defer.succeed(None)
+
+    def tearDown(self):
+        self._disable_monitor()
+        return defer.succeed(None)
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            for mode in self.modes:
+                start = time.time()
+                getattr(self, '_log_%s' % mode)(self.batch)
+                self.cur_state[mode + '_secs'] += time.time() - start
+                self.cur_state[mode] += self.batch
+
+                # Let the monitor and shutdown run
+                yield pu.asleep(0)
+
+    def _log_eager(self, count):
+        log = self.stdlog
+        content = self.content
+        for i in xrange(count):
+            log.debug('Received message %d with content: %s' % (i, content))
+
+    def _log_stdlib(self, count):
+        log = self.stdlog
+        content = self.content
+        for i in xrange(count):
+            log.debug('Received message %d with content: %s', i, content)
+
+    def _log_deferred(self, count):
+        log = self.ionlog
+        content = self.content
+        for i in xrange(count):
+            log.debug('Received message %d with content: %s', i, content)
+
+    def _log_guarded(self, count):
+        log = self.ionlog
+        content = self.content
+        for i in xrange(count):
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('Received message %d with content: %s', i, content)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+
+        # Modes run interleaved, so rate each one over the time spent in it rather than over wall clock time
+        rates = []
+        for mode in self.modes:
+            secs = self.cur_state[mode + '_secs'] - self.base_state.get(mode + '_secs', 0.0)
+            calls = self.cur_state[mode] - self.base_state.get(mode, 0)
+            rates.append('%s: %.0f calls/sec' % (mode, calls / (secs or 0.0001)))
+        print '#%s %s' % (self.load_id, ', '.join(rates))
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.logload.LogLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.logload.LogLoadTest - --mode deferred
+"""
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/prefetchload.py
+@brief Checkouts of a deep structure of which part is only held by a remote
+    process standing in for a datastore
+"""
+
+import sys
+import time
+import random
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTestOptions
+from ion.test.loadtests.ccbrokerload import CCBrokerTest
+from ion.core import bootstrap, ioninit
+from ion.core.object import object_utils
+from ion.util.metrics import Histogram
+
+LISTOBJ_TYPE = object_utils.create_type_identifier(object_id=20004, version=1)
+KEYVALUE_TYPE = object_utils.create_type_identifier(object_id=20005, version=1)
+COMMIT_TYPE = object_utils.create_type_identifier(object_id=8, version=1)
+
+
+class PrefetchLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['host', 'h', 'localhost', 'Broker host name.']
+        , ['port', 'p', 5672, 'Broker port.']
+        , ['vhost', 'v', '/', 'Broker vhost.']
+        , ['heartbeat', None, 0, 'Heartbeat rate [seconds].']
+        , ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+
+        , ['depth', 'd', 6, 'Levels of lists in the structure.']
+        , ['fanout', 'f', 4, 'Items in each list.']
+        , ['missing', None, 0.5, 'Fraction of the objects below the root which are not local.']
+    ]
+    optFlags = [
+    ]
+
+
+class PrefetchLoadTest(CCBrokerTest):
+    """
+    Builds a tree of lists --depth levels deep with --fanout items each and
+    key/value leaves, commits it and pushes it to a second workbench process
+    standing in for a datastore. Then keeps dropping a random --missing
+    fraction of the objects from the local repository and checking it out
+    again, which gets the dropped objects from the remote process. Reports
+    checkouts/second and checkout latency.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.prefetchload.PrefetchLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = PrefetchLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.depth = int(opts['depth'])
+        self.fanout = int(opts['fanout'])
+        missing = float(opts['missing'])
+
+        yield self._start_container()
+
+        services = [
+            {'name':'prefetchload_client', 'module':'ion.core.object.test.test_workbench', 'class':'WorkBenchProcess',
+             'spawnargs':{'proc-name':'prefetchload_client'}},
+            {'name':'prefetchload_remote', 'module':'ion.core.object.test.test_workbench', 'class':'WorkBenchProcess',
+             'spawnargs':{'proc-name':'prefetchload_remote'}},
+        ]
+        yield bootstrap.spawn_processes(services, sup=self.sup)
+
+        registry = ioninit.container_instance.proc_manager.process_registry.kvs
+        child_id = yield self.sup.get_child_id('prefetchload_client')
+        self.wb = registry.get(child_id).workbench
+        child_id = yield self.sup.get_child_id('prefetchload_remote')
+        remote = registry.get(child_id)
+
+        repo = self.wb.create_repository(LISTOBJ_TYPE)
+        self.leaves = 0
+        self._fill(repo, repo.root_object, self.depth)
+        repo.commit('Deep structure')
+
+        result = yield self.wb.push(remote.id.full, repo)
+        if result.MessageResponseCode != result.ResponseCodes.OK:
+            raise AssertionError('Push failed: %s' % result.MessageResponseCode)
+        repo.upstream = remote.id.full
+        self.repo = repo
+
+        root_key = repo.root_object.MyId
+        keys = [key for key, element in repo.index_hash.iteritems()
+                if key != root_key and element.type.object_id != COMMIT_TYPE.object_id]
+        self.drop = random.sample(keys, int(len(keys) * missing))
+        print '#%s %d objects, %d not local at each checkout' % (self.load_id, len(keys) + 1, len(self.drop))
+
+        self.latency = Histogram('checkout')
+        self.cur_state['checkouts'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    def _fill(self, repo, listobj, depth):
+        for i in range(self.fanout):
+            if depth > 1:
+                child = repo.create_object(LISTOBJ_TYPE)
+                self._fill(repo, child, depth - 1)
+            else:
+                child = repo.create_object(KEYVALUE_TYPE)
+                child.key = 'leaf %d' % self.leaves
+                child.value = 'value %d' % self.leaves
+                self.leaves += 1
+            item = listobj.items.add()
+            item.SetLink(child)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        yield self._stop_container()
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        cache = self.wb._workbench_cache
+        while not self.is_shutdown():
+            for key in self.drop:
+                cache.pop(key, None)
+                if self.repo.index_hash.has_key(key):
+                    del self.repo.index_hash[key]
+
+            start = time.time()
+            yield self.repo.checkout('master')
+            self.latency.record(time.time() - start)
+            self.cur_state['checkouts'] += 1
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('checkouts')
+        snapshot = self.latency.snapshot()
+        self.latency.reset()
+        print '#%s %.2f checkouts/sec of %d levels, %d not local, p50 %.1f ms, p99 %.1f ms' % (self.load_id,
+                rate, self.depth, len(self.drop), snapshot['p50_ms'], snapshot['p99_ms'])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.prefetchload.PrefetchLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.prefetchload.PrefetchLoadTest - --depth 8 --fanout 3 --missing 0.9
+"""
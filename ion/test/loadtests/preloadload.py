@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/preloadload.py
+@brief Cold and warm start time of a datastore preloading hundreds of entries
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTestOptions
+from ion.test.loadtests.ccbrokerload import CCBrokerTest
+from ion.core import bootstrap, ioninit
+from ion.services.coi.datastore_bootstrap import ion_preload_config
+from ion.services.coi.datastore_bootstrap.ion_preload_config import ID_CFG, NAME_CFG, DESCRIPTION_CFG, CONTENT_CFG, anonymous_name
+
+
+class PreloadLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['host', 'h', 'localhost', 'Broker host name.']
+        , ['port', 'p', 5672, 'Broker port.']
+        , ['vhost', 'v', '/', 'Broker vhost.']
+        , ['heartbeat', None, 0, 'Heartbeat rate [seconds].']
+        , ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+
+        , ['entries', 'e', 500, 'Number of identities preloaded in addition to the configured entries.']
+        , ['concurrency', 'c', 8, 'Preload flushes in flight.']
+    ]
+    optFlags = [
+    ]
+
+
+class PreloadLoadTest(CCBrokerTest):
+    """
+    Adds generated identities to the preload configuration, then repeatedly
+    starts a datastore on a new sqlite database (cold start: every entry is
+    created and flushed) and once more on the same database (warm start:
+    every entry exists), and reports the time each start took.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.preloadload.PreloadLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = PreloadLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.concurrency = int(opts['concurrency'])
+
+        template = ion_preload_config.ION_IDENTITIES[anonymous_name]
+        self.added = []
+        for i in range(int(opts['entries'])):
+            name = 'preloadload_%s_%d' % (self.load_id, i)
+            entry = dict(template)
+            entry[ID_CFG] = '%s-%08d' % (self.load_id, i)
+            entry[NAME_CFG] = name
+            entry[DESCRIPTION_CFG] = 'Identity generated by the preload load test'
+            entry[CONTENT_CFG] = dict(template[CONTENT_CFG], subject='/DC=org/CN=%s' % name, name=name)
+            ion_preload_config.ION_IDENTITIES[name] = entry
+            self.added.append(name)
+
+        self.tempdir = tempfile.mkdtemp()
+        self.starts = 0
+
+        for mode in ('cold', 'warm'):
+            self.cur_state[mode] = 0
+            self.cur_state[mode + '_secs'] = 0.0
+
+        yield self._start_container()
+        self._enable_monitor(self.monitor_rate)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        yield self._stop_container()
+        for name in self.added:
+            del ion_preload_config.ION_IDENTITIES[name]
+        for name in os.listdir(self.tempdir):
+            os.remove(os.path.join(self.tempdir, name))
+        os.rmdir(self.tempdir)
+
+    @defer.inlineCallbacks
+    def _start_datastore(self, database):
+        """
+        @retval Seconds to spawn a datastore on database, which is terminated again
+        """
+        self.starts += 1
+        name = 'ds%d' % self.starts
+        services = [
+            {'name':name, 'module':'ion.services.coi.datastore', 'class':'DataStoreService',
+             'spawnargs':{'commits':'ion.core.data.sqlite_store.SqliteIndexStore',
+                          'blobs':'ion.core.data.sqlite_store.SqliteStore',
+                          'database':database,
+                          'preload_concurrency':self.concurrency}},
+        ]
+        start = time.time()
+        yield bootstrap.spawn_processes(services, sup=self.sup)
+        elapsed = time.time() - start
+
+        child_id = yield self.sup.get_child_id(name)
+        datastore = ioninit.container_instance.proc_manager.process_registry.kvs.get(child_id)
+        yield datastore.terminate()
+        defer.returnValue(elapsed)
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            database = os.path.join(self.tempdir, 'preload%d.db' % self.starts)
+            cold = yield self._start_datastore(database)
+            warm = yield self._start_datastore(database)
+
+            for mode, secs in (('cold', cold), ('warm', warm)):
+                self.cur_state[mode] += 1
+                self.cur_state[mode + '_secs'] += secs
+            print '#%s cold start %.2f sec, warm start %.2f sec' % (self.load_id, cold, warm)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        averages = []
+        for mode in ('cold', 'warm'):
+            averages.append('%s %.2f sec' % (mode, self.cur_state[mode + '_secs'] / (self.cur_state[mode] or 1)))
+        print '#%s average start: %s' % (self.load_id, ', '.join(averages))
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.preloadload.PreloadLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.preloadload.PreloadLoadTest - --entries 1000 --concurrency 1
+"""
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/pushload.py
+@brief Pushes of a large repository to a datastore which already holds
+    nearly all of its objects
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTestOptions
+from ion.test.loadtests.ccbrokerload import CCBrokerTest
+from ion.core import bootstrap, ioninit
+from ion.core.object import object_utils
+from ion.util.metrics import Histogram
+
+PERSON_TYPE = object_utils.create_type_identifier(object_id=20001, version=1)
+ADDRESSLINK_TYPE = object_utils.create_type_identifier(object_id=20003, version=1)
+
+BACKENDS = ['memory', 'sqlite']
+
+
+class PushLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['host', 'h', 'localhost', 'Broker host name.']
+        , ['port', 'p', 5672, 'Broker port.']
+        , ['vhost', 'v', '/', 'Broker vhost.']
+        , ['heartbeat', None, 0, 'Heartbeat rate [seconds].']
+        , ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+
+        , ['backend', None, 'memory', 'Datastore backend: memory or sqlite.']
+        , ['objects', 'o', 5000, 'Objects in the pushed repository.']
+        , ['changed', 'c', 10, 'Objects changed before each push.']
+    ]
+    optFlags = [
+        ['full', None, 'Advertise the keys of all objects in every push instead of only the changed ones.'],
+    ]
+
+
+class PushLoadTest(CCBrokerTest):
+    """
+    Pushes a repository of --objects objects to a datastore once, then keeps
+    changing a few of them, clearing the workbench of the datastore and
+    pushing again. Each push advertises only the keys added since the previous
+    one; with --full it sends the keys of all objects, so the datastore has
+    to check the existence of nearly all of them in its backend. Either way
+    it fetches only the changed ones. Reports pushes/second and push latency.
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.pushload.PushLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = PushLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.backend = opts['backend']
+        if self.backend not in BACKENDS:
+            raise ValueError('Unknown backend %s' % self.backend)
+        self.objects = int(opts['objects'])
+        self.changed = int(opts['changed'])
+        self.full = bool(opts['full'])
+
+        yield self._start_container()
+
+        spawnargs = {}
+        self.tempdir = None
+        if self.backend == 'sqlite':
+            self.tempdir = tempfile.mkdtemp()
+            spawnargs = {'commits':'ion.core.data.sqlite_store.SqliteIndexStore',
+                         'blobs':'ion.core.data.sqlite_store.SqliteStore',
+                         'database':os.path.join(self.tempdir, 'pushload.db')}
+        services = [
+            {'name':'ds1', 'module':'ion.services.coi.datastore', 'class':'DataStoreService',
+             'spawnargs':spawnargs},
+            {'name':'pushload_wb', 'module':'ion.core.object.test.test_workbench', 'class':'WorkBenchProcess',
+             'spawnargs':{'proc-name':'pushload_wb'}},
+        ]
+        yield bootstrap.spawn_processes(services, sup=self.sup)
+
+        registry = ioninit.container_instance.proc_manager.process_registry.kvs
+        child_id = yield self.sup.get_child_id('ds1')
+        self.datastore = registry.get(child_id)
+        child_id = yield self.sup.get_child_id('pushload_wb')
+        self.wb = registry.get(child_id).workbench
+
+        repo = self.wb.create_repository(ADDRESSLINK_TYPE)
+        ab = repo.root_object
+        ab.title = 'Push load test %s' % self.load_id
+        for i in range(self.objects):
+            person = repo.create_object(PERSON_TYPE)
+            person.name = 'Person %d' % i
+            person.id = i
+            ab.person.add()
+            ab.person[i] = person
+        repo.commit('Initial state')
+        self.repo = repo
+        self.version = 0
+
+        start = time.time()
+        yield self._push()
+        print '#%s %s first push of %d objects took %.2f sec' % (self.load_id, self.backend, self.objects,
+                time.time() - start)
+
+        self.latency = Histogram('push')
+        self.cur_state['pushes'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        yield self._stop_container()
+        if self.tempdir is not None:
+            for name in os.listdir(self.tempdir):
+                os.remove(os.path.join(self.tempdir, name))
+            os.rmdir(self.tempdir)
+
+    @defer.inlineCallbacks
+    def _push(self):
+        result = yield self.wb.push('datastore', self.repo, full=self.full)
+        if result.MessageResponseCode != result.ResponseCodes.OK:
+            raise AssertionError('Push failed: %s' % result.MessageResponseCode)
+
+    @defer.inlineCallbacks
+    def generate_load(self):
+        while not self.is_shutdown():
+            self.version += 1
+            ab = self.repo.root_object
+            for i in range(self.changed):
+                person = ab.person[(self.version * self.changed + i) % self.objects]
+                person.email = 'version%d@pushload' % self.version
+            self.repo.commit('Version %d' % self.version)
+
+            # Drop what the datastore holds in memory so that existence is checked in its backend
+            self.datastore.workbench.clear()
+
+            start = time.time()
+            yield self._push()
+            self.latency.record(time.time() - start)
+            self.cur_state['pushes'] += 1
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('pushes')
+        snapshot = self.latency.snapshot()
+        self.latency.reset()
+        print '#%s %s %s %.2f pushes/sec of %d objects with %d changed, p50 %.1f ms, p99 %.1f ms' % (self.load_id,
+                self.backend, self.full and 'full' or 'delta', rate, self.objects, self.changed,
+                snapshot['p50_ms'], snapshot['p99_ms'])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.pushload.PushLoadTest -
+python -m ion.test.load_runner -s -c ion.test.loadtests.pushload.PushLoadTest - --backend sqlite --objects 20000
+python -m ion.test.load_runner -s -c ion.test.loadtests.pushload.PushLoadTest - --backend sqlite --objects 20000 --full
+"""
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+"""
+@file ion/test/loadtests/storeload.py
+@brief Puts, gets and range queries on an index store backend: in memory,
+    embedded sqlite or Cassandra, by default served by fake Thrift servers
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from twisted.internet import defer
+
+from ion.test.loadtest import LoadTest, LoadTestOptions
+import ion.util.procutils as pu
+from ion.core.data import store
+from ion.core.data import sqlite_store
+from ion.core.data.store import Query
+from ion.util.metrics import Histogram
+
+TABLE = 'commits'
+INDEXES = ['kind', 'timestamp']
+
+BACKENDS = ['memory', 'sqlite', 'cassandra']
+OPS = ['put', 'get', 'query']
+
+
+class StoreLoadTestOptions(LoadTestOptions):
+    optParameters = [
+          ['monitor', 'm', 3, 'Monitor poll rate [seconds].']
+        , ['backend', None, 'sqlite', 'memory, sqlite or cassandra.']
+        , ['op', None, 'get', 'put, get or query.']
+        , ['database', None, None, 'sqlite database file. Default: a new temporary file.']
+        , ['hosts', None, None, 'Comma separated host:port list of a cassandra cluster. Default: start a fake server.']
+        , ['delay', None, 0.0, 'Fake cassandra server response delay [seconds].']
+        , ['concurrency', None, 16, 'Number of operations in flight.']
+        , ['keys', None, 10000, 'Number of rows put before the test.']
+        , ['size', None, 1024, 'Value size [bytes].']
+        , ['width', 'w', 10, 'Number of rows matched by each range query.']
+    ]
+    optFlags = [
+    ]
+
+
+class StoreLoadTest(LoadTest):
+    """
+    Fills an index store with rows having a unique timestamp attribute and a
+    'kind' attribute shared by all rows, then keeps concurrency operations in
+    flight and reports operations/second and latency percentiles:
+        put   - indexed put of an existing row
+        get   - get of a random row
+        query - BETWEEN on the timestamp (plus the required equality
+                predicate on kind) matching width rows
+
+    python -m ion.test.load_runner -s -c ion.test.loadtests.storeload.StoreLoadTest -
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self, argv=None):
+        fullPath = '%s.%s' % (self.__class__.__module__, self.__class__.__name__)
+        if argv is None and fullPath in sys.argv:
+            argv = sys.argv[sys.argv.index(fullPath) + 1:]
+        self.opts = opts = StoreLoadTestOptions()
+        opts.parseOptions(argv)
+
+        self.monitor_rate = opts['monitor']
+        self.backend = opts['backend']
+        self.op = opts['op']
+        if self.backend not in BACKENDS:
+            raise ValueError('Unknown backend %s' % self.backend)
+        if self.op not in OPS:
+            raise ValueError('Unknown op %s' % self.op)
+        self.concurrency = int(opts['concurrency'])
+        self.rows = int(opts['keys'])
+        self.width = int(opts['width'])
+
+        self.servers = []
+        self.tempdir = None
+        if self.backend == 'memory':
+            store.IndexStore.kvs.clear()
+            store.IndexStore.indices.clear()
+            self.store = store.IndexStore(indices=INDEXES)
+        elif self.backend == 'sqlite':
+            database = opts['database']
+            if not database:
+                self.tempdir = tempfile.mkdtemp()
+                database = os.path.join(self.tempdir, 'storeload.db')
+            self.store = sqlite_store.SqliteIndexStore(database=database, table=TABLE, indices=INDEXES)
+        else:
+            self.store = self._cassandra_store(opts)
+
+        if self.backend != 'memory':
+            yield self.store.initialize()
+            yield self.store.activate()
+            if self.backend == 'cassandra':
+                pool = self.store._manager
+                while len(pool.available()) < len(pool.members):
+                    yield pu.asleep(0.05)
+
+        self.value = 'x' * int(opts['size'])
+        start = time.time()
+        yield defer.DeferredList([self._put(i) for i in xrange(self.rows)], fireOnOneErrback=True)
+        print '#%s %s loaded %d rows in %.1f seconds' % (self.load_id, self.backend, self.rows, time.time() - start)
+
+        self.latency = Histogram(self.op)
+        self.cur_state['ops'] = 0
+        self._enable_monitor(self.monitor_rate)
+
+    def _cassandra_store(self, opts):
+        from ion.core.data.cassandra_bootstrap import CassandraIndexedStoreBootstrap
+        from ion.core.data.test.fake_cassandra import FakeCassandraServer, FakeCassandraHandler
+
+        if opts['hosts']:
+            hosts = opts['hosts'].split(',')
+            host, sep, port = hosts[0].partition(':')
+            storage_provider = {'host':host, 'port':int(port or 9160), 'hosts':hosts[1:]}
+        else:
+            handler = FakeCassandraHandler(indexes={TABLE:INDEXES}, delay=float(opts['delay']))
+            server = FakeCassandraServer(handler)
+            server.start()
+            self.servers.append(server)
+            storage_provider = {'host':'127.0.0.1', 'port':server.port}
+        return CassandraIndexedStoreBootstrap(None, None, storage_provider, 'sysname', TABLE)
+
+    @defer.inlineCallbacks
+    def tearDown(self):
+        self._disable_monitor()
+        if self.backend == 'memory':
+            store.IndexStore.kvs.clear()
+            store.IndexStore.indices.clear()
+        else:
+            yield self.store.terminate()
+        for server in self.servers:
+            yield server.stop()
+        if self.tempdir is not None:
+            for name in os.listdir(self.tempdir):
+                os.remove(os.path.join(self.tempdir, name))
+            os.rmdir(self.tempdir)
+
+    def _put(self, i):
+        return self.store.put('key%d' % i, self.value, {'kind':'sample', 'timestamp':'%012d' % i})
+
+    def _query(self):
+        low = random.randint(0, max(0, self.rows - self.width))
+        query = Query()
+        query.add_predicate_eq('kind', 'sample')
+        query.add_predicate_between('timestamp', '%012d' % low, '%012d' % (low + self.width - 1))
+        return query
+
+    def generate_load(self):
+        return defer.DeferredList([self._worker() for i in range(self.concurrency)])
+
+    @defer.inlineCallbacks
+    def _worker(self):
+        while not self.is_shutdown():
+            start = time.time()
+            if self.op == 'put':
+                yield self._put(random.randrange(self.rows))
+            elif self.op == 'get':
+                yield self.store.get('key%d' % random.randrange(self.rows))
+            else:
+                rows = yield self.store.query(self._query())
+                if len(rows) != self.width:
+                    raise AssertionError('Expected %d rows, got %d' % (self.width, len(rows)))
+            self.latency.record(time.time() - start)
+            self.cur_state['ops'] += 1
+
+            # The in memory store answers synchronously - let the monitor and shutdown run
+            if self.cur_state['ops'] % 100 == 0:
+                yield pu.asleep(0)
+
+    def monitor(self, output=True):
+        if not output:
+            return
+        rate = self._get_rate('ops')
+        snapshot = self.latency.snapshot()
+        self.latency.reset()
+        print '#%s %s %.0f %ss/sec, p50 %.3f ms, p99 %.3f ms' % (self.load_id, self.backend, rate, self.op,
+                snapshot['p50_ms'], snapshot['p99_ms'])
+
+"""
+python -m ion.test.load_runner -s -c ion.test.loadtests.storeload.StoreLoadTest - --backend memory
+python -m ion.test.load_runner -s -c ion.test.loadtests.storeload.StoreLoadTest - --backend sqlite --op put
+python -m ion.test.load_runner -s -c ion.test.loadtests.storeload.StoreLoadTest - --backend sqlite --op query --keys 100000
+python -m ion.test.load_runner -s -c ion.test.loadtests.storeload.StoreLoadTest - --backend cassandra --op get --delay 0.001
+"""
@@ -75,14 +75,18 @@ class LRUDict(object):
             self.size = size
 
 
-    def __init__(self, limit, pairs=None, use_size=False):
-        """ limit is either an integer item count or a size in bytes. """
+    def __init__(self, limit, pairs=None, use_size=False, sizeof=None):
+        """
+        limit is either an integer item count or a size in bytes.
+        sizeof optionally gives the size of a value when use_size is set, instead of its __sizeof__.
+        """
 
         self.limit = max(limit, 1)
         self.d = {}
         self.first = None
         self.last = None
         self.use_size = use_size
+        self.sizeof = sizeof
         self.total_size = 0
 
         if pairs is None: pairs = []
@@ -105,8 +109,11 @@ class LRUDict(object):
             del self[key]
 
         size = 1
-        if self.use_size and hasattr(val, '__sizeof__'):
-            size = val.__sizeof__()
+        if self.use_size:
+            if self.sizeof is not None:
+                size = self.sizeof(val)
+            elif hasattr(val, '__sizeof__'):
+                size = val.__sizeof__()
         self.total_size += size
 
         nobj = LRUDict.Node(self.last, (key, val), size)
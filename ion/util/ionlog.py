@@ -62,34 +62,129 @@ def getLogger(loggername=__name__):
     return log_factory.get_logger(loggername)
 
 import logging
+import sys
+
+def getIonLogger(loggername=__name__):
+    """
+    Returns an IonLogger for the named logger. Use in hot code paths instead
+    of getLogger.
+    """
+    return IonLogger(loggername)
+
+# Incremented whenever log levels may have changed - IonLogger instances
+# refresh their cached effective level when they see a new value.
+_level_generation = 0
+
+def log_levels_changed():
+    """
+    Tells all IonLogger instances to refresh their cached effective level.
+    Call this after changing logger levels through the logging module.
+    """
+    global _level_generation
+    _level_generation += 1
+
+def set_log_level(loggername, level):
+    """
+    Sets the level of the named logger and refreshes IonLogger instances.
+    """
+    logging.getLogger(loggername).setLevel(level)
+    log_levels_changed()
+
 class IonLogger(object):
     """
-    Simple wrapper around a python logger.
+    Wrapper around a python logger for hot code paths.
 
-    Currently unused.
+    Pass format arguments to the log call instead of formatting the message
+    in the call, so the formatting (and any str() of the arguments) only
+    happens when the message is actually emitted:
+
+        log.debug('Received content: %s', content)
+
+    The effective level is cached, so a disabled call costs one comparison.
+    Use isEnabledFor to guard computing expensive arguments, or wrap them in
+    a DeferredStr. Level changes must go through set_log_level or be followed
+    by log_levels_changed. Anything else is delegated to the python logger.
     """
     def __init__(self, loggername):
-        self.logger = logging.getLogger(loggername)
+        self.logger = log_factory.get_logger(loggername)
+        self._generation = None
+        self._level = logging.NOTSET
+
+    def _refresh_level(self):
+        # Levels at or below the logging.disable() level are off as well
+        self._level = max(self.logger.getEffectiveLevel(), self.logger.manager.disable + 1)
+        self._generation = _level_generation
+
+    def isEnabledFor(self, level):
+        if self._generation != _level_generation:
+            self._refresh_level()
+        return level >= self._level
+
+    def setLevel(self, level):
+        self.logger.setLevel(level)
+        log_levels_changed()
+
+    def _emit(self, level, msg, args, kwargs):
+        # Called from the level methods below: report their caller as the
+        # source of the record, like the python logger does
+        frame = sys._getframe(2)
+        exc_info = kwargs.get('exc_info', None)
+        if exc_info and not isinstance(exc_info, tuple):
+            exc_info = sys.exc_info()
+        record = self.logger.makeRecord(self.logger.name, level, frame.f_code.co_filename, frame.f_lineno,
+                                        msg, args, exc_info, frame.f_code.co_name, kwargs.get('extra', None))
+        self.logger.handle(record)
+
+    def log(self, level, msg, *args, **kwargs):
+        if self.isEnabledFor(level):
+            self._emit(level, msg, args, kwargs)
 
-    def debug(self, msg, *args):
-        self.logger.debug(msg, *args)
+    def debug(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.DEBUG):
+            self._emit(logging.DEBUG, msg, args, kwargs)
 
-    def info(self, msg, *args):
-        self.logger.info(msg, *args)
+    def info(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.INFO):
+            self._emit(logging.INFO, msg, args, kwargs)
 
-    def warn(self, msg, *args):
-        self.logger.warn(msg, *args)
+    def warn(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.WARNING):
+            self._emit(logging.WARNING, msg, args, kwargs)
 
-    def error(self, msg, *args):
-        self.logger.error(msg, *args)
+    def error(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.ERROR):
+            self._emit(logging.ERROR, msg, args, kwargs)
 
-    def critical(self, msg, *args):
-        self.logger.critical(msg, *args)
+    def critical(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.CRITICAL):
+            self._emit(logging.CRITICAL, msg, args, kwargs)
 
-    def exception(self, msg, *args):
-        self.logger.exception(msg, *args)
+    def exception(self, msg, *args, **kwargs):
+        if self.isEnabledFor(logging.ERROR):
+            kwargs['exc_info'] = 1
+            self._emit(logging.ERROR, msg, args, kwargs)
 
     warning = warn
+    fatal = critical
+
+    def __getattr__(self, name):
+        return getattr(self.logger, name)
+
+class DeferredStr(object):
+    """
+    Log argument whose string value is computed only if the message is
+    emitted, e.g.:
+
+        log.debug('Headers: %s', DeferredStr(pu.pprint_to_string, headers))
+    """
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
 
 """
 class LoggerAdapter:
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""
+@file ion/util/metrics.py
+@brief In-process metrics for a capability container: counters, gauges and
+    latency histograms. Disabled by default; instrumented code checks
+    registry.enabled before taking any measurement.
+"""
+
+import time
+
+from ion.core import ioninit
+
+CONF = ioninit.config(__name__)
+CF_enabled = CONF.getValue('enabled', False)
+CF_sub_bucket_bits = CONF.getValue('sub_bucket_bits', 4)
+
+class Counter(object):
+    """
+    Monotonic count of events.
+    """
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def snapshot(self):
+        return self.value
+
+class Gauge(object):
+    """
+    Current value of something. Either set explicitly or computed by a
+    callable when a snapshot is taken.
+    """
+    __slots__ = ('name', 'value', 'func')
+
+    def __init__(self, name, func=None):
+        self.name = name
+        self.value = None
+        self.func = func
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        if self.func is not None:
+            return self.func()
+        return self.value
+
+class Histogram(object):
+    """
+    Latency histogram with HDR style log-linear buckets. Values are recorded
+    in seconds and kept as integer microseconds. Each power of two range is
+    split into 2**sub_bucket_bits buckets, so the value reported for a
+    percentile is within 1/2**sub_bucket_bits of the recorded value whatever
+    its magnitude, and recording is constant time.
+    """
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self, name, sub_bucket_bits=None):
+        self.name = name
+        self.sub_bucket_bits = sub_bucket_bits or CF_sub_bucket_bits
+        self.reset()
+
+    def reset(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _bucket(self, value):
+        """
+        Returns the lowest value of the bucket holding value (microseconds)
+        """
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        if shift <= 0:
+            return value
+        return (value >> shift) << shift
+
+    def _bucket_top(self, bucket):
+        """
+        Returns the highest value of the bucket starting at bucket
+        """
+        shift = bucket.bit_length() - self.sub_bucket_bits - 1
+        if shift <= 0:
+            return bucket
+        return bucket + (1 << shift) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1000000 + 0.5)
+        if value < 0:
+            value = 0
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        @retval the value in seconds at or below which percent of the recorded
+            values fall
+        """
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(self._bucket_top(bucket), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def snapshot(self):
+        """
+        @retval dict with count and min, max, mean and percentile values in
+            milliseconds
+        """
+        result = {'count':self.count,
+                  'min_ms':(self.min or 0) / 1000.0,
+                  'max_ms':self.max / 1000.0,
+                  'mean_ms':(float(self.total) / self.count / 1000.0) if self.count else 0.0}
+        for percent in self.PERCENTILES:
+            result['p%s_ms' % percent] = self.percentile(percent) * 1000.0
+        return result
+
+class MetricsRegistry(object):
+    """
+    Named counters, gauges and histograms of a container. Instrumented code
+    should check the enabled attribute before measuring anything, e.g.:
+
+        if metrics.registry.enabled:
+            start = time.time()
+        ...
+        if metrics.registry.enabled:
+            metrics.registry.record('receiver.receive', time.time() - start)
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.start_time = time.time()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        """
+        Resets all counters and histograms. Gauges are kept.
+        """
+        self.counters.clear()
+        self.histograms.clear()
+        self.start_time = time.time()
+
+    def counter(self, name):
+        counter = self.counters.get(name, None)
+        if counter is None:
+            counter = self.counters[name] = Counter(name)
+        return counter
+
+    def gauge(self, name, func=None):
+        gauge = self.gauges.get(name, None)
+        if gauge is None:
+            gauge = self.gauges[name] = Gauge(name, func)
+        elif func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name, None)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(name)
+        return histogram
+
+    def inc(self, name, n=1):
+        """
+        Increments the named counter if metrics are enabled
+        """
+        if self.enabled:
+            self.counter(name).inc(n)
+
+    def record(self, name, seconds):
+        """
+        Records a latency in the named histogram if metrics are enabled
+        """
+        if self.enabled:
+            self.histogram(name).record(seconds)
+
+    def snapshot(self):
+        """
+        @retval dict of plain values, suitable as message content
+        """
+        gauges = {}
+        for name, gauge in self.gauges.iteritems():
+            try:
+                gauges[name] = gauge.snapshot()
+            except Exception, ex:
+                gauges[name] = 'error: %s' % ex
+        return {'enabled':self.enabled,
+                'interval':time.time() - self.start_time,
+                'counters':dict((name, c.snapshot()) for name, c in self.counters.iteritems()),
+                'gauges':gauges,
+                'histograms':dict((name, h.snapshot()) for name, h in self.histograms.iteritems())}
+
+def format_snapshot(snapshot):
+    """
+    @retval a snapshot (local or received from a remote container) as text table
+    """
+    lines = ['Metrics %s, %.1f seconds' % ('enabled' if snapshot['enabled'] else 'disabled', snapshot['interval'])]
+    if snapshot['counters']:
+        lines.append('')
+        lines.append('%-50s %12s' % ('counter', 'value'))
+        for name in sorted(snapshot['counters']):
+            lines.append('%-50s %12s' % (name, snapshot['counters'][name]))
+    if snapshot['gauges']:
+        lines.append('')
+        lines.append('%-50s %12s' % ('gauge', 'value'))
+        for name in sorted(snapshot['gauges']):
+            lines.append('%-50s %12s' % (name, snapshot['gauges'][name]))
+    if snapshot['histograms']:
+        lines.append('')
+        lines.append('%-50s %8s %9s %9s %9s %9s %9s' % ('histogram [ms]', 'count', 'mean', 'p50', 'p99', 'p99.9', 'max'))
+        for name in sorted(snapshot['histograms']):
+            h = snapshot['histograms'][name]
+            lines.append('%-50s %8d %9.3f %9.3f %9.3f %9.3f %9.3f' % (name, h['count'], h['mean_ms'],
+                         h['p50_ms'], h['p99_ms'], h['p99.9_ms'], h['max_ms']))
+    return '\n'.join(lines)
+
+# declare global instance
+try:
+    registry
+except NameError:
+    registry = MetricsRegistry(CF_enabled)
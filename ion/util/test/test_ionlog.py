@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+@file ion/util/test/test_ionlog.py
+@brief Tests for the IonLogger facade and the logging conventions of hot modules
+"""
+
+import ast
+import os
+import logging
+
+from twisted.trial import unittest
+
+import ion.util.ionlog
+from ion.util.ionlog import IonLogger, DeferredStr, set_log_level
+
+import ion.core.messaging.receiver
+import ion.core.process.process
+import ion.core.object.repository
+import ion.services.coi.datastore
+
+# Modules on the message path which must not format log messages eagerly
+HOT_MODULES = [ion.core.messaging.receiver,
+               ion.core.process.process,
+               ion.core.object.repository,
+               ion.services.coi.datastore]
+
+LOG_LEVELS = ('debug', 'info', 'warn', 'warning', 'error', 'exception', 'critical')
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class CountingStr(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        return 'counted'
+
+
+class IonLoggerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.name = 'ion.util.test.test_ionlog.%s' % self._testMethodName
+        self.handler = RecordingHandler()
+        logging.getLogger(self.name).addHandler(self.handler)
+        self.log = IonLogger(self.name)
+
+    def tearDown(self):
+        logger = logging.getLogger(self.name)
+        logger.removeHandler(self.handler)
+        set_log_level(self.name, logging.NOTSET)
+
+    def test_levels(self):
+        set_log_level(self.name, logging.INFO)
+
+        self.failIf(self.log.isEnabledFor(logging.DEBUG))
+        self.failUnless(self.log.isEnabledFor(logging.INFO))
+
+        self.log.debug('Not emitted %s', 1)
+        self.log.info('Emitted %s', 2)
+        self.assertEqual([r.getMessage() for r in self.handler.records], ['Emitted 2'])
+        # Records point at the caller, not at the facade
+        self.assertEqual(self.handler.records[0].funcName, 'test_levels')
+
+        # Changes through set_log_level are picked up by existing instances
+        set_log_level(self.name, logging.DEBUG)
+        self.failUnless(self.log.isEnabledFor(logging.DEBUG))
+        self.log.debug('Now emitted %s', 3)
+        self.assertEqual(self.handler.records[-1].getMessage(), 'Now emitted 3')
+
+        # So are changes through the facade itself
+        self.log.setLevel(logging.ERROR)
+        self.failIf(self.log.isEnabledFor(logging.WARNING))
+        self.assertEqual(self.log.getEffectiveLevel(), logging.ERROR)
+
+    def test_exception(self):
+        set_log_level(self.name, logging.DEBUG)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.log.exception('Failed: %s', 'op')
+
+        record = self.handler.records[-1]
+        self.assertEqual(record.levelno, logging.ERROR)
+        self.assertEqual(record.getMessage(), 'Failed: op')
+        self.failUnless(record.exc_info)
+
+    def test_deferred_str(self):
+        counter = CountingStr()
+
+        set_log_level(self.name, logging.INFO)
+        self.log.debug('Value: %s', DeferredStr(counter))
+        self.assertEqual(counter.count, 0)
+
+        set_log_level(self.name, logging.DEBUG)
+        self.log.debug('Value: %s', DeferredStr(counter))
+        self.assertEqual(self.handler.records[-1].getMessage(), 'Value: counted')
+        self.assertEqual(counter.count, 1)
+
+
+class HotModuleLoggingTest(unittest.TestCase):
+    """
+    Lint style check that hot modules pass format arguments to log calls
+    instead of building the message with % or + in the call.
+    """
+
+    def _eager_log_calls(self, filename):
+        source = open(filename).read()
+        tree = ast.parse(source, filename)
+        eager = []
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not node.args:
+                continue
+            func = node.func
+            if not (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+                    and func.value.id == 'log' and func.attr in LOG_LEVELS):
+                continue
+            msg = node.args[0]
+            if isinstance(msg, ast.BinOp) and isinstance(msg.op, (ast.Mod, ast.Add)):
+                eager.append('%s:%d' % (os.path.basename(filename), node.lineno))
+        return eager
+
+    def test_no_eager_formatting(self):
+        for module in HOT_MODULES:
+            filename = os.path.splitext(module.__file__)[0] + '.py'
+            eager = self._eager_log_calls(filename)
+            self.failIf(eager, 'Eagerly formatted log calls: %s' % ', '.join(eager))
+
+    def test_hot_modules_use_ion_logger(self):
+        for module in HOT_MODULES:
+            self.failUnless(isinstance(module.log, IonLogger),
+                            '%s does not use getIonLogger' % module.__name__)
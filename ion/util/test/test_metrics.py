@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+@file ion/util/test/test_metrics.py
+@brief Tests for the container metrics registry
+"""
+
+from twisted.trial import unittest
+
+from ion.util.metrics import MetricsRegistry, Histogram, format_snapshot
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        h = Histogram('test', sub_bucket_bits=4)
+        # 1 to 1000 milliseconds
+        for i in range(1, 1001):
+            h.record(i / 1000.0)
+
+        self.assertEqual(h.count, 1000)
+        self.assertEqual(h.min, 1000)
+        self.assertEqual(h.max, 1000000)
+
+        # Each value is within 1/16 of the recorded value
+        for percent, expected in ((50, 0.5), (90, 0.9), (99, 0.99)):
+            value = h.percentile(percent)
+            self.failUnless(abs(value - expected) <= expected / 16.0, '%s: %s' % (percent, value))
+
+        self.assertEqual(h.percentile(100), 1.0)
+
+        snapshot = h.snapshot()
+        self.assertEqual(snapshot['count'], 1000)
+        self.assertAlmostEqual(snapshot['mean_ms'], 500.5, 3)
+        self.assertEqual(snapshot['max_ms'], 1000.0)
+
+    def test_small_values(self):
+        # Values below 2**sub_bucket_bits microseconds are kept exactly
+        h = Histogram('test', sub_bucket_bits=4)
+        for usec in (0, 3, 7, 7):
+            h.record(usec / 1000000.0)
+        self.assertEqual(h.buckets, {0:1, 3:1, 7:2})
+        self.assertEqual(h.percentile(50), 0.000003)
+
+    def test_empty(self):
+        h = Histogram('test')
+        self.assertEqual(h.percentile(99), 0.0)
+        self.assertEqual(h.snapshot()['mean_ms'], 0.0)
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def test_disabled(self):
+        registry = MetricsRegistry(enabled=False)
+        registry.inc('count')
+        registry.record('latency', 0.1)
+        self.assertEqual(registry.counters, {})
+        self.assertEqual(registry.histograms, {})
+
+    def test_registry(self):
+        registry = MetricsRegistry(enabled=True)
+        registry.inc('count')
+        registry.inc('count', 2)
+        registry.record('latency', 0.002)
+        registry.gauge('value').set(5)
+        registry.gauge('computed', lambda: 7)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'], {'count':3})
+        self.assertEqual(snapshot['gauges'], {'value':5, 'computed':7})
+        self.assertEqual(snapshot['histograms']['latency']['count'], 1)
+        self.failUnless(snapshot['enabled'])
+
+        text = format_snapshot(snapshot)
+        self.failUnless('latency' in text)
+        self.failUnless('computed' in text)
+
+        registry.clear()
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['counters'], {})
+        self.assertEqual(snapshot['histograms'], {})
+        self.assertEqual(snapshot['gauges']['computed'], 7)